@@ -1,30 +1,210 @@
 """
-Flexible API Client for OpenRouter and OpenAI
+Resilient API client for OpenRouter and OpenAI chat completions.
 
-Usage:
-    Set environment variables:
-    - OPENROUTER_API_KEY=your_key (for OpenRouter)
-    - OPENAI_API_KEY=your_key (for OpenAI)
+Every call gets a unique call id, which is logged and sent upstream as
+X-Request-ID; its log lines also carry the id of the HTTP request that made it. Each call also runs under an overall deadline, so a provider
+in trouble can't hold a request for longer than API_CALL_DEADLINE. Within
+that budget:
+    - each attempt has explicit connect/read timeouts on a pooled HTTP client per provider
+    - 429s, 5xx responses, timeouts and connection errors are retried with full-jitter
+      exponential backoff, waiting at least as long as the provider's Retry-After
+    - a circuit breaker per provider stops sending it traffic after repeated failures
+      and lets one probe through once its cooldown has passed
+    - an optional hedge sends a second copy of a slow attempt and keeps whichever answers first
+    - every attempt takes a token from the provider's rate limit (see admission.py)
+    - when a provider keeps failing, its breaker is open or its quota is exhausted, the call
+      fails over to the next provider in its API_FAILOVER chain (OpenRouter -> OpenAI by default)
+
+The SDK's own retries are turned off so these are the only ones. The openai
+SDK is imported on first use, as it is the slowest import in the app; clients
+and their connection pools are per process, one per provider.
+
+Configuration (environment):
+    OPENROUTER_API_KEY=your_key     (for OpenRouter)
+    OPENAI_API_KEY=your_key         (for OpenAI)
+    OPENROUTER_BASE_URL / OPENAI_BASE_URL   optional endpoint overrides
+    API_CONNECT_TIMEOUT=5           seconds to open a connection
+    API_READ_TIMEOUT=30             seconds to wait for response data
+    API_CALL_DEADLINE=45            total budget for one call, retries and failover included
+    API_MAX_CONNECTIONS=64          connection pool size per provider
+    API_MAX_KEEPALIVE=16            idle connections kept open per provider
+    API_KEEPALIVE_EXPIRY=30         seconds an idle connection is kept
+    API_MAX_RETRIES=2               retries per provider after the first attempt
+    API_BACKOFF_BASE=0.5            backoff ceiling for the first retry, doubled for each retry after it
+    API_BACKOFF_MAX=8               largest backoff
+    API_BREAKER_THRESHOLD=5         consecutive failures that open a provider's breaker
+    API_BREAKER_COOLDOWN=30         seconds a breaker stays open before a probe
+    API_HEDGE_AFTER=0               seconds before a slow attempt is hedged (only with a free token,
+                                    never while the breaker is half-open); 0 disables hedging
+    API_FAILOVER=openrouter:openai  failover chains, comma separated
+    API_FAILOVER_MODEL=gpt-4o-mini  OpenAI model used for OpenRouter models without an OpenAI name
 
-    Then call with provider parameter:
-    response = await make_API_call(model_name, messages, "openrouter")
-    response = await make_API_call(model_name, messages, "openai")
+Usage:
+    response = await make_API_call(model_name, messages, "openrouter")    # None if every provider failed
+    response = await chat_completion(model_name, messages, "openrouter")  # raises APICallError
+    get_client_stats()
 
     Or use the alias:
     response = await make_openrouter_call(model_name, messages, "openrouter")
 """
 
-import openai
 import os
 import asyncio
-from typing import Optional, List, Dict, Any
+import random
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional, List, Dict, Any
+
+from admission import admit, release_admission, try_admit
+from observability import log, upstream_call
+
+if TYPE_CHECKING:
+    import httpx
 
 # API Provider configuration - API keys from environment
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Client cache to avoid reinitializing
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "30"))
+API_CALL_DEADLINE = float(os.getenv("API_CALL_DEADLINE", "45"))
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "64"))
+API_MAX_KEEPALIVE = int(os.getenv("API_MAX_KEEPALIVE", "16"))
+API_KEEPALIVE_EXPIRY = float(os.getenv("API_KEEPALIVE_EXPIRY", "30"))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "2"))
+API_BACKOFF_BASE = float(os.getenv("API_BACKOFF_BASE", "0.5"))
+API_BACKOFF_MAX = float(os.getenv("API_BACKOFF_MAX", "8"))
+API_BREAKER_THRESHOLD = int(os.getenv("API_BREAKER_THRESHOLD", "5"))
+API_BREAKER_COOLDOWN = float(os.getenv("API_BREAKER_COOLDOWN", "30"))
+API_HEDGE_AFTER = float(os.getenv("API_HEDGE_AFTER", "0"))
+API_FAILOVER = os.getenv("API_FAILOVER", "openrouter:openai")
+API_FAILOVER_MODEL = os.getenv("API_FAILOVER_MODEL", "gpt-4o-mini")
+
+PROVIDER_BASE_URLS = {
+    "openrouter": os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+    "openai": os.getenv("OPENAI_BASE_URL"),  # None means the SDK default
+}
+
+# Status codes worth another attempt; anything else is the request's fault and would fail again
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+def parse_failover_chains(spec: str) -> Dict[str, List[str]]:
+    """"openrouter:openai" -> {"openrouter": ["openai"]}"""
+    chains = {}
+    for chain in spec.split(","):
+        providers = [p.strip().lower() for p in chain.split(":") if p.strip()]
+        if len(providers) > 1:
+            chains[providers[0]] = providers[1:]
+    return chains
+
+FAILOVER_CHAINS = parse_failover_chains(API_FAILOVER)
+
+class APICallError(Exception):
+    """Raised when a call failed on every provider it was allowed to try."""
+
+    def __init__(self, request_id: str, errors: List[str]):
+        super().__init__(f"[{request_id}] " + "; ".join(errors))
+        self.request_id = request_id
+        self.errors = errors
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open."""
+
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(f"{provider} circuit open, retry in {retry_in:.0f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker for one provider.
+
+    closed: calls go through. After `threshold` failures in a row it opens.
+    open: calls are refused until `cooldown` seconds have passed.
+    half_open: one probe call goes through; success closes the breaker, failure reopens it.
+    """
+
+    def __init__(self, name: str, threshold: int = API_BREAKER_THRESHOLD, cooldown: float = API_BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if self.retry_in() > 0:
+                return False
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def retry_in(self) -> float:
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def release(self) -> None:
+        """Free the half-open probe slot of an attempt that was abandoned before the provider answered."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            log(f"🟢 {self.name} circuit closed", provider=self.name, circuit="closed")
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            log(f"🔴 {self.name} circuit open for {self.cooldown:.0f}s after {self.failures} failures",
+                level="warning", provider=self.name, circuit="open", failures=self.failures)
+
+# Client, breaker and counter caches, one entry per provider
 client_cache = {}
+breakers: Dict[str, CircuitBreaker] = {}
+provider_stats: Dict[str, Dict[str, int]] = {}
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    if provider not in breakers:
+        breakers[provider] = CircuitBreaker(provider)
+    return breakers[provider]
+
+def count(provider: str, counter: str) -> None:
+    stats = provider_stats.setdefault(provider, {
+        "calls": 0, "successes": 0, "failures": 0, "retries": 0,
+        "hedges": 0, "hedge_wins": 0, "hedges_skipped": 0, "failovers_to": 0, "short_circuited": 0,
+    })
+    stats[counter] += 1
+
+def make_http_client() -> "httpx.AsyncClient":
+    """Pooled HTTP client with explicit timeouts, shared by all calls to one provider."""
+    import openai
+    # openai >= 3 ships its HTTP transport as httpx2
+    try:
+        import httpx2 as httpx
+    except ImportError:
+        import httpx
+
+    return openai.DefaultAsyncHttpxClient(
+        timeout=httpx.Timeout(API_READ_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=API_MAX_CONNECTIONS,
+            max_keepalive_connections=API_MAX_KEEPALIVE,
+            keepalive_expiry=API_KEEPALIVE_EXPIRY,
+        ),
+    )
 
 def get_client_for_provider(provider: str):
     """Get or create a client for the specified provider."""
@@ -36,63 +216,293 @@ def get_client_for_provider(provider: str):
     if provider == "openrouter":
         if not OPENROUTER_API_KEY:
             raise ValueError("OPENROUTER_API_KEY environment variable is required for OpenRouter API")
-        client = openai.AsyncOpenAI(
-            api_key=OPENROUTER_API_KEY,
-            base_url="https://openrouter.ai/api/v1"
-        )
-        print("🔧 Initialized OpenRouter client")
-
+        api_key = OPENROUTER_API_KEY
     elif provider == "openai":
         if not OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY environment variable is required for OpenAI API")
-        client = openai.AsyncOpenAI(
-            api_key=OPENAI_API_KEY,
-        )
-        print("🔧 Initialized OpenAI client")
-
+        api_key = OPENAI_API_KEY
     else:
         raise ValueError(f"Unsupported API provider: {provider}. Use 'openrouter' or 'openai'")
 
+    import openai
+
+    client = openai.AsyncOpenAI(
+        api_key=api_key,
+        base_url=PROVIDER_BASE_URLS[provider],
+        max_retries=0,
+        http_client=make_http_client(),
+    )
+    log(f"🔧 Initialized {provider} client (pool {API_MAX_CONNECTIONS}, "
+        f"timeouts {API_CONNECT_TIMEOUT:g}s connect / {API_READ_TIMEOUT:g}s read)", provider=provider)
+
     client_cache[provider] = client
     return client
 
-async def make_API_call(model_name: str, messages: List[Dict[str, Any]], provider: str = "openrouter", **kwargs) -> Optional[Any]:
+async def close_clients() -> None:
+    """Close every cached client's connection pool."""
+    for client in list(client_cache.values()):
+        await client.close()
+    client_cache.clear()
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def failover_model(model_name: str, from_provider: str, to_provider: str) -> str:
+    """Name of the same (or closest) model on the failover provider."""
+    if from_provider == to_provider:
+        return model_name
+    if to_provider == "openai":
+        # OpenRouter names OpenAI models "openai/<model>"; anything else has no OpenAI equivalent
+        vendor, _, name = model_name.partition("/")
+        return name if vendor == "openai" and name else API_FAILOVER_MODEL
+    if to_provider == "openrouter" and "/" not in model_name:
+        return f"openai/{model_name}"
+    return model_name
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, connection errors, 429s and 5xx responses are worth retrying."""
+    import openai
+
+    if isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+def should_fail_over(error: BaseException) -> bool:
+    """Everything except a request the provider rejected as malformed is worth trying elsewhere."""
+    import openai
+
+    return not isinstance(error, (openai.BadRequestError, openai.UnprocessableEntityError))
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """The wait a provider asked for in Retry-After (seconds or HTTP date) or retry-after-ms."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None,
+                  base: float = API_BACKOFF_BASE, cap: float = API_BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff, never shorter than the provider's Retry-After."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+async def hedged(call: Callable[[], Awaitable[Any]], hedge_after: float, provider: str,
+                 may_hedge: Optional[Callable[[], Awaitable[bool]]] = None) -> Any:
     """
-    Make an API call using the specified provider (OpenRouter or OpenAI).
+    Run `call`, and if it hasn't answered after `hedge_after` seconds start a second copy.
+
+    The first copy to succeed wins and the other is cancelled. Raises the last
+    error only if both copies fail.
+
+    Args:
+        may_hedge: Asked before the second copy is started; it is skipped when this returns False
+    """
+    if hedge_after <= 0:
+        return await call()
+
+    primary = asyncio.create_task(call())
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            if may_hedge is None or await may_hedge():
+                count(provider, "hedges")
+                tasks.add(asyncio.create_task(call()))
+            else:
+                count(provider, "hedges_skipped")
+
+        error: Optional[BaseException] = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        count(provider, "hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def call_provider(provider: str, model_name: str, messages: List[Dict[str, Any]],
+                        request_id: str, deadline: float, hedge_after: float, **kwargs) -> Any:
+    """
+    Call one provider with retries, its breaker and the call's deadline.
+
+    Args:
+        deadline: Event loop time by which the call must be finished
+
+    Returns:
+        The chat completion response
+    """
+    loop = asyncio.get_running_loop()
+    client = get_client_for_provider(provider)
+    breaker = get_breaker(provider)
+    headers = {**(kwargs.pop("extra_headers", None) or {}), "X-Request-ID": request_id}
+
+    for attempt in range(API_MAX_RETRIES + 1):
+        if breaker.retry_in() > 0:
+            # Open and cooling down: fail fast without spending quota
+            count(provider, "short_circuited")
+            raise CircuitOpenError(provider, breaker.retry_in())
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError(f"{provider} deadline exceeded")
+        # Every attempt spends one token of the provider's quota. It is taken before the
+        # breaker's probe slot, so a call stuck in admission never holds the probe.
+        await asyncio.wait_for(admit(provider), remaining)
+        if not breaker.allow():
+            release_admission(provider)
+            count(provider, "short_circuited")
+            raise CircuitOpenError(provider, breaker.retry_in())
+        settled = False
+        try:
+            remaining = deadline - loop.time()
+
+            count(provider, "calls")
+            call = lambda: client.chat.completions.create(
+                model=model_name, messages=messages, extra_headers=headers, **kwargs)
+
+            async def may_hedge() -> bool:
+                # A half-open breaker lets one probe through, so it gets no second copy.
+                # Otherwise the hedge spends a token like any other call, if one is free now.
+                return breaker.state != "half_open" and await try_admit(provider)
+
+            try:
+                with upstream_call(f"{provider}_chat"):
+                    response = await asyncio.wait_for(hedged(call, hedge_after, provider, may_hedge), remaining)
+            except Exception as e:
+                settled = True
+                count(provider, "failures")
+                if not is_retryable(e):
+                    # The provider answered, so it is healthy; the request itself is at fault
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+
+                delay = backoff_delay(attempt, retry_after_seconds(e))
+                if attempt == API_MAX_RETRIES or loop.time() + delay >= deadline:
+                    raise
+                count(provider, "retries")
+                log(f"🔁 [{request_id}] {provider} attempt {attempt + 1} failed ({describe_error(e)}), "
+                    f"retrying in {delay:.2f}s", level="warning", call_id=request_id, provider=provider,
+                    attempt=attempt + 1, error=describe_error(e), retry_in=round(delay, 3))
+                await asyncio.sleep(delay)
+            else:
+                settled = True
+                breaker.record_success()
+                count(provider, "successes")
+                return response
+        finally:
+            if not settled:
+                # Given up before the provider answered (deadline, admission, cancellation):
+                # that says nothing about its health, but a half-open probe must be freed
+                breaker.release()
+
+def describe_error(error: BaseException) -> str:
+    import openai
+
+    if isinstance(error, openai.APIStatusError):
+        return f"HTTP {error.status_code}"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timed out"
+    return str(error) or type(error).__name__
+
+async def chat_completion(
+    model_name: str,
+    messages: List[Dict[str, Any]],
+    provider: str = "openrouter",
+    request_id: Optional[str] = None,
+    deadline: float = API_CALL_DEADLINE,
+    hedge_after: float = API_HEDGE_AFTER,
+    failover: bool = True,
+    **kwargs,
+) -> Any:
+    """
+    Make a chat completion call with retries, circuit breaking, hedging and failover.
 
     Args:
         model_name: The model to use for the API call
         messages: List of message dictionaries for the conversation
-        provider: The API provider to use ("openrouter" or "openai")
+        provider: The API provider to try first ("openrouter" or "openai")
+        request_id: Id for logs and the X-Request-ID header; a new one is made if omitted
+        deadline: Seconds the whole call may take, failover included
+        hedge_after: Seconds before a slow attempt is hedged; 0 disables hedging
+        failover: Whether to try the provider's failover chain when it fails
         **kwargs: Additional parameters to pass to the API call
 
     Returns:
-        API response object or None if failed
+        API response object
+
+    Raises:
+        APICallError: If every provider failed or the deadline ran out
     """
-    try:
-        # Get the appropriate client for the provider
-        client = get_client_for_provider(provider)
+    provider = provider.lower()
+    request_id = request_id or new_request_id()
+    loop = asyncio.get_running_loop()
+    ends_at = loop.time() + deadline
+    started = time.perf_counter()
 
-        # Add parallel-safe logging with request ID for tracking
-        request_id = f"{model_name}_{id(messages)}"
-        print(f"🤖 [{request_id}] Making {provider.upper()} API call")
+    chain = [provider] + (FAILOVER_CHAINS.get(provider, []) if failover else [])
+    errors = []
+    for index, name in enumerate(chain):
+        model = failover_model(model_name, provider, name)
+        if index:
+            count(name, "failovers_to")
+            log(f"↪️ [{request_id}] Failing over to {name.upper()} ({model})", level="warning",
+                call_id=request_id, provider=name, model=model)
+        else:
+            log(f"🤖 [{request_id}] Making {name.upper()} API call", call_id=request_id, provider=name, model=model)
+        try:
+            response = await call_provider(name, model, messages, request_id, ends_at, hedge_after, **kwargs)
+        except Exception as e:
+            errors.append(f"{name}: {describe_error(e)}")
+            log(f"❌ [{request_id}] {name.upper()} API call failed: {describe_error(e)}", level="error",
+                call_id=request_id, provider=name, error=describe_error(e))
+            if not should_fail_over(e) or loop.time() >= ends_at:
+                break
+            continue
+        elapsed = time.perf_counter() - started
+        log(f"✅ [{request_id}] {name.upper()} API call completed in {elapsed:.2f}s",
+            call_id=request_id, provider=name, model=model, duration_ms=round(elapsed * 1000, 1))
+        return response
 
-        # Prepare common parameters
-        call_params = {
-            "model": model_name,
-            "messages": messages,
-        }
+    raise APICallError(request_id, errors)
 
-        # Add any additional parameters
-        call_params.update(kwargs)
+async def make_API_call(model_name: str, messages: List[Dict[str, Any]], provider: str = "openrouter", **kwargs) -> Optional[Any]:
+    """
+    Make an API call using the specified provider (OpenRouter or OpenAI).
 
-        response = await client.chat.completions.create(**call_params)
-        print(f"✅ [{request_id}] {provider.upper()} API call completed")
-        return response
+    Args:
+        model_name: The model to use for the API call
+        messages: List of message dictionaries for the conversation
+        provider: The API provider to try first ("openrouter" or "openai")
+        **kwargs: Options for chat_completion and additional parameters to pass to the API call
 
-    except Exception as e:
-        request_id = f"{model_name}_{id(messages)}"
-        print(f"❌ [{request_id}] Error making {provider.upper()} API call: {e}")
+    Returns:
+        API response object or None if every provider failed
+    """
+    try:
+        return await chat_completion(model_name, messages, provider, **kwargs)
+    except APICallError as e:
+        log(f"❌ Error making {provider.upper()} API call: {e}", level="error")
         return None
 
 # Alias for backward compatibility
@@ -106,3 +516,13 @@ def get_cached_providers() -> List[str]:
     """Get list of providers that have been cached/initialized."""
     return list(client_cache.keys())
 
+def get_client_stats() -> Dict[str, Any]:
+    """Per-provider call counters and circuit breaker state."""
+    return {
+        name: {
+            **provider_stats.get(name, {}),
+            "circuit": get_breaker(name).state,
+            "circuit_retry_in": round(get_breaker(name).retry_in(), 1),
+        }
+        for name in get_available_providers()
+    }
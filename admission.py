@@ -0,0 +1,377 @@
+"""
+Rate limiting and fair admission control for upstream calls.
+
+Each provider or model quota (Gemini image model, Veo model, OpenRouter,
+OpenAI) has a token bucket refilled at its per-minute rate. A call takes a
+token before it goes upstream. When the bucket is empty, callers wait in the
+quota's fair queue:
+    - priority classes are served strictly in order, so interactive image
+      generations and edits go ahead of batch items and video jobs
+    - within a class, clients are served round-robin, so a client who queues
+      a burst gets one token per round like everyone else instead of the whole quota
+
+A caller is turned away with RateLimitedError when the wait it would face is
+longer than its class allows, or when its client already has too many calls
+queued. Endpoints turn this into a 429 with a Retry-After header. The
+Retry-After is the estimated wait, so a client that honours it comes back when
+a token is likely to be free.
+
+When the app runs as several workers (see shared_store.py), each quota's
+bucket lives in the shared store, so the workers draw on one quota between
+them. Tokens are taken on the store thread, never on the event loop, and wait
+estimates use the last count seen. The fair queues stay per worker; a worker
+whose timer finds the shared bucket empty just waits for the next token.
+
+Client identity and priority come from context variables. A middleware sets
+them per request (the client address, as seen through trusted proxies), and
+tasks started during the request inherit them.
+
+Configuration (environment):
+    RATE_LIMITS=gemini-2.5-flash-image-preview=60:10,openrouter=120:20
+                                     per-quota overrides as name=requests_per_minute:burst
+    RATE_LIMIT_DEFAULT=60:10         quota for names without an override
+    ADMISSION_MAX_WAIT=20            seconds an interactive call may wait for a token
+    ADMISSION_MAX_WAIT_BATCH=120     seconds a batch call may wait for a token
+    ADMISSION_CLIENT_QUEUE=16        calls one client may have waiting per quota
+
+Usage:
+    await admit(IMAGE_MODEL)                       # waits for a token or raises RateLimitedError
+    check_admission(VIDEO_MODEL, priority="batch") # raise now instead of queuing a doomed job
+    if await try_admit("openrouter"): ...          # optional extra call, only if a token is free
+    priority_var.set("batch")
+"""
+
+import asyncio
+import contextvars
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from observability import record_timing
+from shared_store import SharedStore, shared_store
+
+# Priority classes, served strictly in this order
+PRIORITY_CLASSES = ("interactive", "batch")
+
+ADMISSION_MAX_WAIT = {
+    "interactive": float(os.getenv("ADMISSION_MAX_WAIT", "20")),
+    "batch": float(os.getenv("ADMISSION_MAX_WAIT_BATCH", "120")),
+}
+ADMISSION_CLIENT_QUEUE = int(os.getenv("ADMISSION_CLIENT_QUEUE", "16"))
+
+DEFAULT_RATE_LIMITS = {
+    "gemini-2.5-flash-image-preview": (60.0, 10),
+    "veo-3.0-fast-generate-001": (10.0, 2),
+    "openrouter": (120.0, 20),
+    "openai": (120.0, 20),
+}
+
+# Who is calling and how urgent it is; set per request by a middleware
+client_id_var: ContextVar[str] = ContextVar("client_id", default="anonymous")
+priority_var: ContextVar[str] = ContextVar("priority", default="interactive")
+
+class RateLimitedError(Exception):
+    """Raised when a call can't be admitted soon enough; retry_after is in whole seconds."""
+
+    def __init__(self, name: str, retry_after: int, reason: str = "rate limit reached"):
+        super().__init__(f"{name} {reason}, please retry in {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Holds up to `burst` tokens, refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def take(self) -> bool:
+        return self.try_take()
+
+    def give_back(self) -> None:
+        self._refill()
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def time_until(self, count: float = 1) -> float:
+        """Seconds until `count` tokens will have accumulated, ignoring the burst cap."""
+        self._refill()
+        return max(0.0, (count - self.tokens) / self.rate)
+
+class SharedTokenBucket:
+    """
+    A token bucket kept in the shared store, so every worker process draws on it.
+
+    Taking a token is a store write, so it is a coroutine run on the store
+    thread. Wait estimates use the token count seen on the last take, refilled
+    locally, so they cost no I/O.
+    """
+
+    def __init__(self, store: SharedStore, name: str, rate: float, burst: int,
+                 clock: Callable[[], float] = time.monotonic):
+        self.store = store
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self) -> bool:
+        taken, self.tokens = await self.store.call(self.store.take_token, self.name, self.rate, self.burst)
+        self.updated = self.clock()
+        return taken
+
+    def give_back(self) -> None:
+        self.store.submit(self.store.give_back_token, self.name, self.rate, self.burst)
+        self._refill()
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def time_until(self, count: float = 1) -> float:
+        """Seconds until `count` tokens will have accumulated, ignoring the burst cap."""
+        self._refill()
+        return max(0.0, (count - self.tokens) / self.rate)
+
+class FairAdmissionQueue:
+    """A token bucket with per-priority, per-client round-robin queues in front of it."""
+
+    def __init__(self, name: str, requests_per_minute: float, burst: int,
+                 max_wait: Optional[Dict[str, float]] = None,
+                 max_client_queue: int = ADMISSION_CLIENT_QUEUE,
+                 clock: Callable[[], float] = time.monotonic,
+                 store: Optional[SharedStore] = None):
+        self.name = name
+        if store is not None:
+            self.bucket = SharedTokenBucket(store, name, requests_per_minute / 60, burst, clock)
+        else:
+            self.bucket = TokenBucket(requests_per_minute / 60, burst, clock)
+        self.max_wait = max_wait if max_wait is not None else ADMISSION_MAX_WAIT
+        self.max_client_queue = max_client_queue
+        # priority -> client -> that client's waiting futures; client order is the round-robin order
+        self._queues: Dict[str, "OrderedDict[str, Deque[asyncio.Future]]"] = {
+            priority: OrderedDict() for priority in PRIORITY_CLASSES
+        }
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.counters: Dict[str, int] = {"admitted": 0, "queued": 0, "rejected": 0, "cancelled": 0}
+
+    def waiting(self) -> int:
+        return sum(len(q) for clients in self._queues.values() for q in clients.values())
+
+    def estimated_wait(self, client: str, priority: str) -> float:
+        """
+        Seconds a new call from `client` would wait for its token.
+
+        Everyone in a higher class goes first. In its own class, round-robin
+        serves each other client at most one more call than `client` has
+        queued before this one is reached.
+        """
+        rank = PRIORITY_CLASSES.index(priority)
+        ahead = sum(len(q) for p in PRIORITY_CLASSES[:rank] for q in self._queues[p].values())
+        clients = self._queues[priority]
+        own = len(clients.get(client, ()))
+        ahead += own + sum(min(len(q), own + 1) for c, q in clients.items() if c != client)
+        return self.bucket.time_until(ahead + 1)
+
+    def check(self, client: str, priority: str) -> None:
+        """Raise RateLimitedError now if a call from this client would be turned away."""
+        if len(self._queues[priority].get(client, ())) >= self.max_client_queue:
+            raise RateLimitedError(self.name, max(1, math.ceil(self.estimated_wait(client, priority))),
+                                   reason="has too many queued requests from this client")
+        wait = self.estimated_wait(client, priority)
+        if wait > self.max_wait[priority]:
+            raise RateLimitedError(self.name, math.ceil(wait))
+
+    async def admit(self, client: str, priority: str) -> float:
+        """
+        Wait for a token.
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            RateLimitedError: If the wait would exceed the class limit or the client's queue is full
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        # Straight through when nobody is waiting and a token is free
+        if not self.waiting() and await self.bucket.take():
+            self.counters["admitted"] += 1
+            return 0.0
+
+        try:
+            self.check(client, priority)
+        except RateLimitedError:
+            self.counters["rejected"] += 1
+            raise
+
+        started = self.bucket.clock()
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(client, deque()).append(future)
+        self.counters["queued"] += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The token was granted as the caller gave up; pass it on
+                self.bucket.give_back()
+            else:
+                self._discard(priority, client, future)
+            self.counters["cancelled"] += 1
+            self._dispatch()
+            raise
+        self.counters["admitted"] += 1
+        return self.bucket.clock() - started
+
+    async def try_admit(self) -> bool:
+        """Take a token only if one is free and nobody is waiting; never queues."""
+        if not self.waiting() and await self.bucket.take():
+            self.counters["admitted"] += 1
+            return True
+        return False
+
+    def _discard(self, priority: str, client: str, future: asyncio.Future) -> None:
+        queue = self._queues[priority].get(client)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            if not queue:
+                del self._queues[priority][client]
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """Highest class first; within it, the next client in round-robin order."""
+        for priority in PRIORITY_CLASSES:
+            clients = self._queues[priority]
+            if clients:
+                client, queue = next(iter(clients.items()))
+                future = queue.popleft()
+                del clients[client]
+                if queue:
+                    # Back of the line for this client's next call
+                    clients[client] = queue
+                return future
+        return None
+
+    def _next_live_waiter(self) -> Optional[asyncio.Future]:
+        """The next waiter still waiting; callers cancelled but not yet discarded are skipped."""
+        future = self._next_waiter()
+        while future is not None and future.done():
+            future = self._next_waiter()
+        return future
+
+    def _dispatch(self) -> None:
+        """Hand out every available token, then wake up again when the next one is due."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if isinstance(self.bucket, SharedTokenBucket):
+            # Shared tokens are taken on the store thread, so hand them out from a task
+            if self._dispatcher is None or self._dispatcher.done():
+                self._dispatcher = contextvars.Context().run(asyncio.create_task, self._dispatch_shared())
+            return
+        while self.waiting() and self.bucket.try_take():
+            future = self._next_live_waiter()
+            if future is None:
+                self.bucket.give_back()
+                break
+            future.set_result(None)
+        if self.waiting():
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.bucket.time_until(1), self._dispatch)
+
+    async def _dispatch_shared(self) -> None:
+        while self.waiting() and await self.bucket.take():
+            future = self._next_live_waiter()
+            if future is None:
+                self.bucket.give_back()
+                break
+            future.set_result(None)
+        if self.waiting():
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.bucket.time_until(1), self._dispatch)
+
+    def stats(self) -> Dict[str, object]:
+        self.bucket._refill()
+        return {
+            **self.counters,
+            "waiting": {priority: sum(len(q) for q in clients.values()) for priority, clients in self._queues.items()},
+            "clients_waiting": len({c for clients in self._queues.values() for c in clients}),
+            "tokens": round(self.bucket.tokens, 2),
+            "requests_per_minute": round(self.bucket.rate * 60, 2),
+            "burst": self.bucket.burst,
+        }
+
+def _parse_limit(raw: str) -> Tuple[float, int]:
+    rate, _, burst = raw.partition(":")
+    rate = float(rate)
+    return rate, int(burst) if burst else max(1, int(rate // 6))
+
+def _parse_overrides(raw: str) -> Dict[str, Tuple[float, int]]:
+    """Parse RATE_LIMITS entries of the form name=requests_per_minute:burst."""
+    overrides = {}
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry or "=" not in entry:
+            continue
+        name, limits = entry.rsplit("=", 1)
+        overrides[name.strip()] = _parse_limit(limits)
+    return overrides
+
+DEFAULT_RATE_LIMIT = _parse_limit(os.getenv("RATE_LIMIT_DEFAULT", "60:10"))
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **_parse_overrides(os.getenv("RATE_LIMITS", ""))}
+
+# Admission queue cache, one per provider or model
+admission_queues: Dict[str, FairAdmissionQueue] = {}
+
+def get_admission_queue(name: str) -> FairAdmissionQueue:
+    """Get or create the admission queue for a provider or model."""
+    if name not in admission_queues:
+        rate, burst = RATE_LIMITS.get(name, DEFAULT_RATE_LIMIT)
+        admission_queues[name] = FairAdmissionQueue(name, rate, burst, store=shared_store)
+    return admission_queues[name]
+
+async def admit(name: str, priority: Optional[str] = None, client: Optional[str] = None) -> float:
+    """Take a token from a quota for the current client; returns the seconds spent waiting."""
+    waited = await get_admission_queue(name).admit(client or client_id_var.get(), priority or priority_var.get())
+    if waited:
+        record_timing("quota", waited)
+    return waited
+
+async def try_admit(name: str) -> bool:
+    """Take a token from a quota if one is free right now, without queuing or raising."""
+    return await get_admission_queue(name).try_admit()
+
+def release_admission(name: str) -> None:
+    """Return a token taken by admit() for a call that was then not made."""
+    queue = get_admission_queue(name)
+    queue.bucket.give_back()
+    queue.counters["admitted"] -= 1
+
+def check_admission(name: str, priority: Optional[str] = None, client: Optional[str] = None) -> None:
+    """Raise RateLimitedError now if the current client's call would be turned away."""
+    get_admission_queue(name).check(client or client_id_var.get(), priority or priority_var.get())
+
+def admission_stats() -> Dict[str, Dict[str, object]]:
+    return {name: queue.stats() for name, queue in admission_queues.items()}
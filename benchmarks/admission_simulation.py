@@ -0,0 +1,200 @@
+"""
+Synthetic-load simulation of the admission layer: quota compliance, fairness, priorities and 429s.
+
+Runs the real FairAdmissionQueue on the event loop against a fast quota
+(--rate tokens per second) in four scenarios:
+    priority      one client floods 80 batch calls while three clients send steady
+                  interactive calls; interactive waits should stay near zero
+    fairness      three batch clients queue 40, 20 and 10 calls at once; while all are
+                  backlogged each should get an equal share. The same load through one
+                  shared FIFO (every call under one client id) is the baseline
+    backpressure  one interactive client bursts 40 calls with a 1s wait limit; the
+                  overflow is rejected with a Retry-After, and retrying after it succeeds
+    cancellation  eight queued calls from four clients are all cancelled at once, just as
+                  a token comes due (a /generate-batch client disconnecting); every call
+                  should end cancelled and the token should go to the next caller
+
+Every admission is timestamped. Compliance means no window of any length saw
+more than burst + rate * window admissions.
+
+Usage:
+    python benchmarks/admission_simulation.py
+    python benchmarks/admission_simulation.py --rate 20 --burst 5 --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from statistics import median, quantiles
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import FairAdmissionQueue, RateLimitedError
+
+def make_queue(rate: float, burst: int, interactive_wait: float = 30, batch_wait: float = 60) -> FairAdmissionQueue:
+    return FairAdmissionQueue("sim", rate * 60, burst,
+                              max_wait={"interactive": interactive_wait, "batch": batch_wait},
+                              max_client_queue=1000)
+
+def max_excess(timestamps, rate: float, burst: int) -> float:
+    """Largest (admissions in a window) - (burst + rate * window) over all windows; <= 0 is compliant."""
+    times = sorted(timestamps)
+    worst = float("-inf")
+    for i, start in enumerate(times):
+        for j in range(i, len(times)):
+            worst = max(worst, (j - i + 1) - (burst + rate * (times[j] - start)))
+    return round(worst, 3)
+
+def jain_index(values) -> float:
+    """1.0 when every client got the same service, 1/n when one client got all of it."""
+    values = list(values)
+    return round(sum(values) ** 2 / (len(values) * sum(v * v for v in values)), 3) if any(values) else 1.0
+
+def percentile(values, q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return quantiles(values, n=100)[q - 1]
+
+async def call(queue, client, priority, log, start, owner=None):
+    wait = await queue.admit(client, priority)
+    log.append({"client": owner or client, "priority": priority, "wait": wait, "at": time.monotonic() - start})
+
+async def scenario_priority(rate: float, burst: int) -> dict:
+    queue, log, start = make_queue(rate, burst), [], time.monotonic()
+    tasks = [asyncio.create_task(call(queue, "bulk", "batch", log, start)) for _ in range(80)]
+
+    async def steady(client):
+        for _ in range(9):
+            tasks.append(asyncio.create_task(call(queue, client, "interactive", log, start)))
+            await asyncio.sleep(1 / 3)
+
+    await asyncio.gather(*(steady(c) for c in ("alice", "bob", "carol")))
+    await asyncio.gather(*tasks)
+
+    waits = {p: [e["wait"] * 1000 for e in log if e["priority"] == p] for p in ("interactive", "batch")}
+    return {
+        "admitted": len(log),
+        "duration_s": round(max(e["at"] for e in log), 2),
+        "interactive_wait_ms": {"p50": round(median(waits["interactive"]), 1),
+                                "p95": round(percentile(waits["interactive"], 95), 1)},
+        "batch_wait_ms": {"p50": round(median(waits["batch"]), 1),
+                          "p95": round(percentile(waits["batch"], 95), 1)},
+        "max_excess": max_excess([e["at"] for e in log], rate, burst),
+    }
+
+async def scenario_fairness(rate: float, burst: int, fifo: bool) -> dict:
+    queue, log, start = make_queue(rate, burst), [], time.monotonic()
+    demand = {"a": 40, "b": 20, "c": 10}
+    # The FIFO baseline queues every call under one client id but logs its real owner
+    await asyncio.gather(*(call(queue, "shared" if fifo else client, "batch", log, start, owner=client)
+                           for client, count in demand.items() for _ in range(count)))
+
+    # Service while every client is backlogged: after the initial burst (granted before anyone
+    # queued) and until the smallest demand could have been met
+    window = min(demand.values()) * len(demand)
+    share = Counter(e["client"] for e in log[burst:burst + window])
+    return {
+        "share_while_backlogged": {client: share.get(client, 0) for client in demand},
+        "jain_index": jain_index(share.get(client, 0) for client in demand),
+        "max_excess": max_excess([e["at"] for e in log], rate, burst),
+    }
+
+async def scenario_backpressure(rate: float, burst: int) -> dict:
+    queue, log, start = make_queue(rate, burst, interactive_wait=1.0), [], time.monotonic()
+    results = await asyncio.gather(*(call(queue, "greedy", "interactive", log, start) for _ in range(40)),
+                                   return_exceptions=True)
+    rejected = [r for r in results if isinstance(r, RateLimitedError)]
+    retry_after = max((r.retry_after for r in rejected), default=0)
+
+    # A client that honours Retry-After gets in on its next try
+    retried_ok = None
+    if rejected:
+        await asyncio.sleep(retry_after)
+        try:
+            await call(queue, "greedy", "interactive", log, start)
+            retried_ok = True
+        except RateLimitedError:
+            retried_ok = False
+
+    return {
+        "sent": len(results),
+        "admitted": len(results) - len(rejected),
+        "rejected": len(rejected),
+        "retry_after_s": sorted({r.retry_after for r in rejected}),
+        "retry_after_retry_succeeded": retried_ok,
+        "max_wait_of_admitted_ms": round(max(e["wait"] for e in log) * 1000, 1),
+        "max_excess": max_excess([e["at"] for e in log], rate, burst),
+    }
+
+async def scenario_cancellation(rate: float, burst: int) -> dict:
+    queue, log, start = make_queue(rate, burst), [], time.monotonic()
+    for _ in range(burst):
+        await call(queue, "warmup", "interactive", log, start)
+    tasks = [asyncio.create_task(call(queue, f"client{i % 4}", "batch", log, start)) for i in range(8)]
+    await asyncio.sleep(0)
+
+    # Block the loop until a token is due, so the cancellations and the dispatch timer land together
+    time.sleep(queue.bucket.time_until(1))
+    for task in tasks:
+        task.cancel()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    next_wait = await queue.admit("next", "interactive")
+    return {
+        "cancelled": sum(isinstance(r, asyncio.CancelledError) for r in results),
+        "errors": sorted({type(r).__name__ for r in results if not isinstance(r, asyncio.CancelledError)}),
+        "still_waiting": queue.waiting(),
+        "next_call_wait_ms": round(next_wait * 1000, 1),
+    }
+
+async def run(rate: float, burst: int) -> dict:
+    return {
+        "quota": {"rate_per_s": rate, "burst": burst},
+        "priority": await scenario_priority(rate, burst),
+        "fairness": {
+            "fair_queue": await scenario_fairness(rate, burst, fifo=False),
+            "fifo_baseline": await scenario_fairness(rate, burst, fifo=True),
+        },
+        "backpressure": await scenario_backpressure(rate, burst),
+        "cancellation": await scenario_cancellation(rate, burst),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rate", type=float, default=20, help="Quota refill rate in tokens per second")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.rate, args.burst))
+
+    p = results["priority"]
+    print(f"Quota: {args.rate:g}/s, burst {args.burst}")
+    print(f"priority      interactive wait p50 {p['interactive_wait_ms']['p50']:.0f}ms p95 {p['interactive_wait_ms']['p95']:.0f}ms"
+          f" | batch wait p50 {p['batch_wait_ms']['p50']:.0f}ms p95 {p['batch_wait_ms']['p95']:.0f}ms"
+          f" | {p['admitted']} calls in {p['duration_s']}s")
+    for name, f in results["fairness"].items():
+        print(f"fairness      {name:<14} share {f['share_while_backlogged']} Jain {f['jain_index']}")
+    b = results["backpressure"]
+    print(f"backpressure  {b['admitted']}/{b['sent']} admitted, {b['rejected']} got 429 (Retry-After {b['retry_after_s']}s),"
+          f" retry after it succeeded: {b['retry_after_retry_succeeded']}")
+
+    c = results["cancellation"]
+    print(f"cancellation  {c['cancelled']}/8 cancelled cleanly, errors {c['errors'] or 'none'}, "
+          f"{c['still_waiting']} left queued, next call waited {c['next_call_wait_ms']:.0f}ms")
+
+    excess = [p["max_excess"], b["max_excess"]] + [f["max_excess"] for f in results["fairness"].values()]
+    print(f"compliance    worst window excess over burst + rate * window: {max(excess):+.2f} "
+          f"({'within quota' if max(excess) <= 0.05 else 'QUOTA EXCEEDED'})")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Local stand-ins for Gemini, Veo and the OpenRouter/OpenAI endpoint, for benchmarks and load tests.
+
+FakeGenaiClient can be dropped in for genai.Client. It implements the async
+calls the app makes (models.generate_content, models.generate_videos,
+operations.get, files.download) with configurable latency, jitter and failure
+rate, and returns real google.genai response types. Images are real PNGs (a
+small pool, encoded once) and videos are real H.264/AAC clips, so everything
+downstream (thumbnails, catalog, trims) runs as it would in production.
+
+make_fake_llm_app() is an OpenAI-compatible chat completions server. It
+answers "new" or "edit", after a configurable latency, and fails with 500s or
+429s (with Retry-After) at configurable rates.
+
+`serve` runs the real app with both fakes injected in an isolated workspace
+directory, so no API keys are used and no files land in the repository:
+
+Usage:
+    python benchmarks/fakes.py serve --port 8766 --image-latency 0.8 --video-latency 20 --failure-rate 0.02
+    python benchmarks/fakes.py llm --port 8790 --latency 0.3
+
+    client = FakeGenaiClient(image_latency=0.5, video_latency=5)
+    main.client = client
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import errors, types
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def make_clip(path: str, seconds: float, width: int = 1280, height: int = 720, fps: int = 24,
+              audio: bool = True, gop: int = 24) -> str:
+    """Write a synthetic H.264 clip shaped like Veo output (moving test pattern, sine audio)."""
+    from video_editing import run_ffmpeg
+
+    args = ["-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={seconds}"]
+    if audio:
+        args += ["-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={seconds}"]
+    args += ["-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-g", str(gop)]
+    args += ["-c:a", "aac", "-b:a", "128k"] if audio else ["-an"]
+    run_ffmpeg(args + ["-shortest", path])
+    return path
+
+def make_image_bytes(size: int = 1024, seed: int = 0, format: str = "PNG") -> bytes:
+    """A photo-like test image (gradient plus noise), so encoded sizes are realistic."""
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient("L").resize((size, size))
+    noise = Image.effect_noise((size, size), 16 + rng.random() * 16)
+    image = Image.merge("RGB", (gradient, noise, gradient.rotate(90 * rng.randint(0, 3))))
+    buffer = BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+class Latency:
+    """Mean latency with uniform jitter (as a fraction of the mean) and a failure rate."""
+
+    def __init__(self, mean: float, jitter: float = 0.2, failure_rate: float = 0.0, rng: Optional[random.Random] = None):
+        self.mean = mean
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rng = rng or random.Random()
+
+    def sample(self) -> float:
+        return max(0.0, self.mean * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+
+    async def wait(self, call: str) -> None:
+        await asyncio.sleep(self.sample())
+        if self.rng.random() < self.failure_rate:
+            raise errors.ServerError(503, {"error": {"code": 503, "status": "UNAVAILABLE",
+                                                     "message": f"Injected {call} failure"}})
+
+class _FakeModels:
+    def __init__(self, fake: "FakeGenaiClient"):
+        self._fake = fake
+
+    async def generate_content(self, model: str, contents, config=None, **kwargs) -> types.GenerateContentResponse:
+        fake = self._fake
+        fake.calls["generate_content"] += 1
+        await fake.image.wait("generate_content")
+        data = await asyncio.to_thread(fake.image_bytes, fake.calls["generate_content"])
+        part = types.Part.from_bytes(data=data, mime_type="image/png")
+        return types.GenerateContentResponse(candidates=[
+            types.Candidate(content=types.Content(role="model", parts=[part]))
+        ])
+
+    async def generate_videos(self, model: str, prompt: str = None, image=None, config=None,
+                              **kwargs) -> types.GenerateVideosOperation:
+        fake = self._fake
+        fake.calls["generate_videos"] += 1
+        await fake.video_create.wait("generate_videos")
+        name = f"operations/fake-{fake.calls['generate_videos']}"
+        fake._operations[name] = time.monotonic() + fake.video.sample()
+        return types.GenerateVideosOperation(name=name, done=False)
+
+class _FakeOperations:
+    def __init__(self, fake: "FakeGenaiClient"):
+        self._fake = fake
+
+    async def get(self, operation: types.GenerateVideosOperation) -> types.GenerateVideosOperation:
+        fake = self._fake
+        fake.calls["operations_get"] += 1
+        await fake.poll.wait("operations.get")
+        if time.monotonic() < fake._operations.get(operation.name, 0):
+            return types.GenerateVideosOperation(name=operation.name, done=False)
+        fake._operations.pop(operation.name, None)
+        video = types.Video(uri=f"https://fake.invalid/{operation.name}.mp4", mime_type="video/mp4")
+        return types.GenerateVideosOperation(
+            name=operation.name, done=True,
+            response=types.GenerateVideosResponse(generated_videos=[types.GeneratedVideo(video=video)]),
+        )
+
+class _FakeFiles:
+    def __init__(self, fake: "FakeGenaiClient"):
+        self._fake = fake
+
+    async def download(self, file: types.Video, **kwargs) -> bytes:
+        fake = self._fake
+        fake.calls["files_download"] += 1
+        await fake.download.wait("files.download")
+        file.video_bytes = fake.video_bytes()
+        return file.video_bytes
+
+class FakeGenaiClient:
+    """
+    Drop-in for genai.Client covering the async calls the app makes.
+
+    Args:
+        image_latency: Mean seconds for generate_content
+        video_latency: Mean seconds from generate_videos until the operation reports done
+        jitter: Uniform jitter as a fraction of each mean
+        failure_rate: Probability that any single call raises a 503 ServerError
+        image_size: Width and height of generated images
+        clip_seconds: Length of the clip every finished video operation returns
+    """
+
+    IMAGE_POOL = 8
+
+    def __init__(self, image_latency: float = 0.8, video_latency: float = 20.0, jitter: float = 0.2,
+                 failure_rate: float = 0.0, image_size: int = 1024, clip_seconds: float = 8.0,
+                 seed: Optional[int] = None):
+        rng = random.Random(seed)
+        self.image = Latency(image_latency, jitter, failure_rate, rng)
+        self.video = Latency(video_latency, jitter, 0.0, rng)
+        self.video_create = Latency(0.5, jitter, failure_rate, rng)
+        self.poll = Latency(0.1, jitter, failure_rate, rng)
+        self.download = Latency(0.3, jitter, failure_rate, rng)
+        self.image_size = image_size
+        self.clip_seconds = clip_seconds
+        self.calls: Dict[str, int] = {"generate_content": 0, "generate_videos": 0, "operations_get": 0,
+                                      "files_download": 0}
+        self._operations: Dict[str, float] = {}
+        self._images: Dict[int, bytes] = {}
+        self._clip: Optional[bytes] = None
+        self.aio = _Aio(self)
+
+    def warm(self) -> None:
+        """Encode the image pool and the clip now rather than during the first calls."""
+        for index in range(self.IMAGE_POOL):
+            self.image_bytes(index)
+        self.video_bytes()
+
+    def image_bytes(self, index: int) -> bytes:
+        """One of a small pool of distinct images, encoded once, so the fake costs no CPU under load."""
+        slot = index % self.IMAGE_POOL
+        if slot not in self._images:
+            self._images[slot] = make_image_bytes(self.image_size, seed=slot)
+        return self._images[slot]
+
+    def video_bytes(self) -> bytes:
+        if self._clip is None:
+            with tempfile.TemporaryDirectory() as workdir:
+                path = make_clip(os.path.join(workdir, "veo.mp4"), self.clip_seconds)
+                with open(path, "rb") as f:
+                    self._clip = f.read()
+        return self._clip
+
+class _Aio:
+    def __init__(self, fake: FakeGenaiClient):
+        self.models = _FakeModels(fake)
+        self.operations = _FakeOperations(fake)
+        self.files = _FakeFiles(fake)
+
+def make_fake_llm_app(latency: float = 0.3, jitter: float = 0.2, failure_rate: float = 0.0,
+                      throttle_rate: float = 0.0, retry_after: float = 1.0, seed: Optional[int] = None):
+    """
+    OpenAI-compatible chat completions server (serve it with base URL http://host:port/v1).
+
+    Args:
+        latency: Mean seconds per completion
+        failure_rate: Probability of a 500 response
+        throttle_rate: Probability of a 429 response carrying Retry-After
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    rng = random.Random(seed)
+    timing = Latency(latency, jitter, 0.0, rng)
+    app = FastAPI(title="Fake chat completions")
+    app.state.calls = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        await asyncio.sleep(timing.sample())
+        roll = rng.random()
+        if roll < failure_rate:
+            return JSONResponse({"error": {"message": "Injected failure", "type": "server_error"}}, status_code=500)
+        if roll < failure_rate + throttle_rate:
+            return JSONResponse({"error": {"message": "Injected rate limit", "type": "rate_limit"}}, status_code=429,
+                                headers={"Retry-After": f"{retry_after:g}"})
+
+        # Deterministic per prompt, so repeated prompts get the same answer
+        prompt = str(body.get("messages", [{}])[-1].get("content", ""))
+        answer = "edit" if hashlib.sha256(prompt.encode()).digest()[0] % 2 else "new"
+        return {
+            "id": f"chatcmpl-fake-{app.state.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": answer}}],
+            "usage": {"prompt_tokens": 50, "completion_tokens": 1, "total_tokens": 51},
+        }
+
+    return app
+
+async def serve_app(args) -> None:
+    """Run the real app against the fakes, from an isolated workspace directory."""
+    import uvicorn
+
+    workspace = os.path.abspath(args.workspace or tempfile.mkdtemp(prefix="bench_workspace_"))
+    os.makedirs(workspace, exist_ok=True)
+    for name in ("static", "templates"):
+        link = os.path.join(workspace, name)
+        if not os.path.exists(link):
+            os.symlink(os.path.join(REPO_DIR, name), link)
+    os.chdir(workspace)
+
+    llm_url = f"http://127.0.0.1:{args.llm_port}/v1"
+    os.environ.setdefault("GOOGLE_API_KEY", "fake")
+    os.environ["VIDEO_POLL_INTERVAL"] = str(args.poll_interval)
+    for key, value in {"OPENROUTER_API_KEY": "fake", "OPENAI_API_KEY": "fake",
+                       "OPENROUTER_BASE_URL": llm_url, "OPENAI_BASE_URL": llm_url}.items():
+        os.environ[key] = value
+    if not args.keep_rate_limits:
+        # Measure the service, not the production quotas
+        os.environ["RATE_LIMIT_DEFAULT"] = "1000000:100000"
+        os.environ["RATE_LIMITS"] = ",".join(f"{name}=1000000:100000" for name in (
+            "gemini-2.5-flash-image-preview", "veo-3.0-fast-generate-001", "openrouter", "openai"))
+
+    import main
+
+    main.client = FakeGenaiClient(image_latency=args.image_latency, video_latency=args.video_latency,
+                                  jitter=args.jitter, failure_rate=args.failure_rate, seed=args.seed)
+    main.client.warm()
+    llm_app = make_fake_llm_app(args.llm_latency, args.jitter, args.failure_rate, args.throttle_rate, seed=args.seed)
+
+    servers = [
+        uvicorn.Server(uvicorn.Config(llm_app, host="127.0.0.1", port=args.llm_port, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=args.port, log_level="warning")),
+    ]
+    print(f"🧪 Serving the app with fakes on :{args.port} (LLM on :{args.llm_port}), workspace {workspace}", flush=True)
+    await asyncio.gather(*(server.serve() for server in servers))
+
+async def serve_llm(args) -> None:
+    import uvicorn
+
+    app = make_fake_llm_app(args.latency, args.jitter, args.failure_rate, args.throttle_rate, seed=args.seed)
+    await uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning")).serve()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the app or the chat endpoint against local fakes")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="The full app with fake Gemini, Veo and LLM upstreams")
+    serve.add_argument("--port", type=int, default=8766)
+    serve.add_argument("--llm-port", type=int, default=8790)
+    serve.add_argument("--workspace", help="Working directory for media files (default: a new temp dir)")
+    serve.add_argument("--image-latency", type=float, default=0.8)
+    serve.add_argument("--video-latency", type=float, default=20.0)
+    serve.add_argument("--llm-latency", type=float, default=0.3)
+    serve.add_argument("--jitter", type=float, default=0.2)
+    serve.add_argument("--failure-rate", type=float, default=0.0)
+    serve.add_argument("--throttle-rate", type=float, default=0.0)
+    serve.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between Veo operation polls")
+    serve.add_argument("--keep-rate-limits", action="store_true", help="Keep the app's production rate limits")
+    serve.add_argument("--seed", type=int)
+
+    llm = commands.add_parser("llm", help="Only the OpenAI-compatible chat endpoint")
+    llm.add_argument("--port", type=int, default=8790)
+    llm.add_argument("--latency", type=float, default=0.3)
+    llm.add_argument("--jitter", type=float, default=0.2)
+    llm.add_argument("--failure-rate", type=float, default=0.0)
+    llm.add_argument("--throttle-rate", type=float, default=0.0)
+    llm.add_argument("--seed", type=int)
+
+    args = parser.parse_args()
+    asyncio.run(serve_app(args) if args.command == "serve" else serve_llm(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Micro-benchmark of the image byte path: PIL decode/re-encode vs passing bytes through.
+
+Compares, per request, the old and new handling of the three places image
+bytes cross the app boundary:
+    save    storing Gemini's inline_data (PIL decode + PNG re-encode vs raw write)
+    edit    sending a stored image to Gemini (PIL Image serialized by the SDK vs Part.from_bytes)
+    video   sending a stored image to Veo (PIL PNG re-encode vs types.Image from the bytes)
+
+Reports wall-clock latency and CPU time per call, and the saving.
+
+Usage:
+    python benchmarks/image_byte_path.py
+    python benchmarks/image_byte_path.py --size 1024 --iterations 20 --json results.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+from statistics import median
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import _transformers, types
+from PIL import Image
+
+from image_bytes import image_part, save_image_bytes, veo_image
+
+def make_sample_png(size: int) -> bytes:
+    """A photo-like test image: smooth gradient with noise, so PNG compression is realistic."""
+    gradient = Image.linear_gradient("L").resize((size, size))
+    noise = Image.effect_noise((size, size), 24)
+    image = Image.merge("RGB", (gradient, noise, gradient.rotate(90)))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+# Previous implementations, kept here as the baseline
+
+def old_save(data: bytes, directory: str) -> None:
+    image = Image.open(BytesIO(data))
+    image.save(os.path.join(directory, "old.png"))
+
+def old_edit(path: str) -> types.Part:
+    with Image.open(path) as image:
+        image.load()
+    # What the SDK does with a PIL Image in contents
+    blob = _transformers.pil_to_blob(image)
+    return types.Part(inline_data=blob)
+
+def old_video(data: bytes) -> types.Image:
+    image = Image.open(BytesIO(data))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return types.Image(image_bytes=buffer.getvalue(), mime_type="image/png")
+
+def new_edit(path: str) -> types.Part:
+    with open(path, "rb") as f:
+        return image_part(f.read())
+
+def measure(func, iterations: int) -> dict:
+    """Median wall and CPU milliseconds per call."""
+    func()  # warm up
+    wall, cpu = [], []
+    for _ in range(iterations):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        func()
+        wall.append((time.perf_counter() - wall_start) * 1000)
+        cpu.append((time.process_time() - cpu_start) * 1000)
+    return {"wall_ms": round(median(wall), 3), "cpu_ms": round(median(cpu), 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--size", type=int, default=1024, help="Test image width and height in pixels")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    data = make_sample_png(args.size)
+    results = {"image": {"size": args.size, "bytes": len(data)}, "paths": {}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        stored = os.path.join(directory, "stored.png")
+        with open(stored, "wb") as f:
+            f.write(data)
+
+        cases = {
+            "save": (lambda: old_save(data, directory), lambda: save_image_bytes(data, directory, "image/png")),
+            "edit": (lambda: old_edit(stored), lambda: new_edit(stored)),
+            "video": (lambda: old_video(data), lambda: veo_image(data)),
+        }
+        for name, (old, new) in cases.items():
+            old_stats, new_stats = measure(old, args.iterations), measure(new, args.iterations)
+            results["paths"][name] = {
+                "old": old_stats,
+                "new": new_stats,
+                "cpu_saved_ms": round(old_stats["cpu_ms"] - new_stats["cpu_ms"], 3),
+                "speedup": round(old_stats["wall_ms"] / max(new_stats["wall_ms"], 1e-6), 1),
+            }
+
+    print(f"{args.size}x{args.size} PNG, {len(data) / 1024:.0f} KB, median of {args.iterations} runs")
+    print(f"{'path':<8}{'old wall':>12}{'new wall':>12}{'old cpu':>12}{'new cpu':>12}{'speedup':>10}")
+    for name, r in results["paths"].items():
+        print(f"{name:<8}{r['old']['wall_ms']:>10.2f}ms{r['new']['wall_ms']:>10.2f}ms"
+              f"{r['old']['cpu_ms']:>10.2f}ms{r['new']['cpu_ms']:>10.2f}ms{r['speedup']:>9.1f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
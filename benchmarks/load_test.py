@@ -0,0 +1,331 @@
+"""
+Offline load test: drives every endpoint concurrently against local fakes of Gemini, Veo and OpenRouter.
+
+Starts the app with benchmarks/fakes.py in a throwaway workspace (or targets
+--url), prepares source media through the API (an upload, a generated image,
+a generated video), then runs every scenario at the same time for --duration
+seconds. Each scenario is a closed loop of --concurrency workers, or fewer for
+the encode-heavy ones:
+    static, upload, generate_new, generate_cached, generate_auto, edit, batch,
+    video (submit and follow SSE to the end), trim, export, media_range,
+    media_conditional, thumbs, list_files, job_status, stats, metrics, delete, cancel
+
+Reports throughput and p50/p95/p99 per scenario, plus status code counts.
+Results are saved as JSON and can be compared with an earlier run.
+
+Usage:
+    python benchmarks/load_test.py --duration 60 --json load.json
+    python benchmarks/load_test.py --duration 60 --compare load.json --json load2.json
+    python benchmarks/load_test.py --scenarios generate_new,batch --image-latency 2 --failure-rate 0.05
+    python benchmarks/load_test.py --url http://localhost:8000   # an app you started with fakes.py serve
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import make_image_bytes
+from benchmarks.report import load_results, print_comparison, print_table, summarize, write_results
+
+HEAVY = {"video": 1, "trim": 1, "export": 1, "cancel": 1, "batch": 1}
+
+# Prompts the local intent rules can't settle, so auto mode reaches the LLM
+AMBIGUOUS = ["sunset over the harbor", "the same but at night", "more dramatic lighting", "a quiet forest road"]
+
+class LoadTest:
+    def __init__(self, url: str, concurrency: int, duration: float):
+        self.url = url
+        self.concurrency = concurrency
+        self.duration = duration
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+        self.assets = {}
+        self.job_ids = []
+        # Encoded up front so the load generator doesn't compete with the app for CPU
+        self.upload_images = [make_image_bytes(256, seed=seed) for seed in range(16)]
+
+    async def record(self, scenario: str, operation):
+        """Run one operation; 2xx and 304 count as successes, everything else as an error."""
+        started = time.perf_counter()
+        try:
+            status = await operation()
+        except Exception as e:
+            status = type(e).__name__
+        elapsed = (time.perf_counter() - started) * 1000
+        self.statuses[scenario][str(status)] += 1
+        if isinstance(status, int) and (200 <= status < 300 or status == 304):
+            self.latencies[scenario].append(elapsed)
+        else:
+            self.errors[scenario] += 1
+            # Back off like a well-behaved client would
+            await asyncio.sleep(0.5)
+
+    async def follow_job(self, http: httpx.AsyncClient, job: dict) -> dict:
+        """Follow a job's SSE stream to its final state."""
+        self.job_ids.append(job["job_id"])
+        if job.get("status") in ("succeeded", "failed", "cancelled"):
+            return job
+        async with http.stream("GET", f"/jobs/{job['job_id']}/events", timeout=None) as response:
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line.split(":", 1)[1].strip()
+                elif line.startswith("data:") and event == "done":
+                    return json.loads(line[5:])
+        raise RuntimeError("Event stream ended before the job finished")
+
+    async def job_status(self, http, response) -> int:
+        if response.status_code != 202:
+            return response.status_code
+        final = await self.follow_job(http, response.json())
+        return 200 if final["status"] == "succeeded" else f"job_{final['status']}"
+
+    async def prepare(self, http: httpx.AsyncClient) -> None:
+        """Create the media the scenarios work on, through the API itself."""
+        upload = await http.post("/upload-image", files={"file": ("bench.png", make_image_bytes(512, seed=1), "image/png")})
+        upload.raise_for_status()
+        self.assets["upload"] = upload.json()["image_path"]
+
+        image = await http.post("/generate-image", data={"prompt": "benchmark source image", "mode": "new"})
+        image.raise_for_status()
+        self.assets["image"] = image.json()["image_path"]
+
+        video = await http.post("/generate-video", data={"image_path": self.assets["image"],
+                                                         "prompt": "slow pan", "no_cache": "true"})
+        video.raise_for_status()
+        final = await self.follow_job(http, video.json())
+        if final["status"] != "succeeded":
+            raise RuntimeError(f"Could not prepare a source video: {final.get('error')}")
+        self.assets["video"] = final["video_path"]
+
+        media = await http.get(self.assets["video"])
+        self.assets["video_etag"] = media.headers.get("etag")
+
+    def scenarios(self, http: httpx.AsyncClient):
+        assets = self.assets
+
+        async def static():
+            return (await http.get("/static/script.js")).status_code
+
+        async def upload():
+            data = random.choice(self.upload_images)
+            return (await http.post("/upload-image", files={"file": ("u.png", data, "image/png")})).status_code
+
+        async def generate_new():
+            return (await http.post("/generate-image", data={"prompt": f"a red kite {uuid.uuid4().hex[:8]}",
+                                                             "mode": "new"})).status_code
+
+        async def generate_cached():
+            return (await http.post("/generate-image", data={"prompt": "benchmark source image",
+                                                             "mode": "new"})).status_code
+
+        async def generate_auto():
+            prompt = f"{random.choice(AMBIGUOUS)} {uuid.uuid4().hex[:6]}"
+            return (await http.post("/generate-image", data={"prompt": prompt, "mode": "auto",
+                                                             "current_image": assets["image"]})).status_code
+
+        async def edit():
+            return (await http.post("/generate-image", data={"prompt": f"add a hat {uuid.uuid4().hex[:6]}",
+                                                             "mode": "edit",
+                                                             "current_image": assets["upload"]})).status_code
+
+        async def batch():
+            payload = {"prompts": [f"tile {uuid.uuid4().hex[:6]}", f"tile {uuid.uuid4().hex[:6]}"],
+                       "variants": 2, "mode": "new"}
+            async with http.stream("POST", "/generate-batch", json=payload, timeout=None) as response:
+                lines = [json.loads(line) async for line in response.aiter_lines() if line.strip()]
+            summary = lines[-1] if lines else {}
+            return response.status_code if summary.get("done") and not summary.get("failed") else "batch_failed"
+
+        async def video():
+            response = await http.post("/generate-video", data={"image_path": assets["image"],
+                                                                "prompt": "orbit", "no_cache": "true"})
+            return await self.job_status(http, response)
+
+        async def trim():
+            start = round(random.uniform(0, 3), 2)
+            response = await http.post("/trim-video", data={"video_path": assets["video"], "start_time": start,
+                                                             "end_time": start + 3,
+                                                             "mode": random.choice(["fast", "precise"])})
+            return await self.job_status(http, response)
+
+        async def export():
+            scenes = [{"path": assets["video"], "start_time": 0.5, "end_time": 3},
+                      {"path": assets["video"], "start_time": round(random.uniform(3, 5), 2), "end_time": 7.5}]
+            return await self.job_status(http, await http.post("/export-sequence", json={"scenes": scenes}))
+
+        async def media_range():
+            return (await http.get(assets["video"], headers={"Range": "bytes=0-65535"})).status_code
+
+        async def media_conditional():
+            return (await http.get(assets["video"], headers={"If-None-Match": assets["video_etag"] or ""})).status_code
+
+        async def thumbs():
+            name = assets["image"].rsplit("/", 1)[1]
+            return (await http.get(f"/thumbs/256/generated_images/{name}")).status_code
+
+        async def list_files():
+            return (await http.get("/list-files", params={"limit": 50})).status_code
+
+        async def job_status():
+            job_id = random.choice(self.job_ids) if self.job_ids else "missing"
+            return (await http.get(f"/jobs/{job_id}")).status_code
+
+        async def stats():
+            path = random.choice(["/cache-stats", "/upstream-stats", "/intent-stats"])
+            return (await http.get(path)).status_code
+
+        async def metrics():
+            return (await http.get("/metrics")).status_code
+
+        async def delete():
+            data = random.choice(self.upload_images)
+            uploaded = await http.post("/upload-image", files={"file": ("d.png", data, "image/png")})
+            if uploaded.status_code != 200:
+                return uploaded.status_code
+            # Timed together with the upload that gives it something to delete
+            return (await http.post("/delete-file", json={"path": uploaded.json()["image_path"]})).status_code
+
+        async def cancel():
+            response = await http.post("/trim-video", data={"video_path": assets["video"], "start_time": 0,
+                                                             "end_time": 7, "mode": "precise"})
+            if response.status_code != 202:
+                return response.status_code
+            job = response.json()
+            self.job_ids.append(job["job_id"])
+            cancelled = await http.delete(f"/jobs/{job['job_id']}")
+            # A job that finished first can't be cancelled; that's not a failure
+            return 200 if cancelled.status_code == 409 else cancelled.status_code
+
+        return {fn.__name__: fn for fn in (
+            static, upload, generate_new, generate_cached, generate_auto, edit, batch, video, trim, export,
+            media_range, media_conditional, thumbs, list_files, job_status, stats, metrics, delete, cancel)}
+
+    async def run(self, selected=None):
+        limits = httpx.Limits(max_connections=200, max_keepalive_connections=100)
+        async with httpx.AsyncClient(base_url=self.url, timeout=120, limits=limits) as http:
+            await self.prepare(http)
+            scenarios = self.scenarios(http)
+            if selected:
+                unknown = set(selected) - set(scenarios)
+                if unknown:
+                    raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+                scenarios = {name: scenarios[name] for name in selected}
+
+            deadline = time.monotonic() + self.duration
+
+            async def worker(name, operation):
+                while time.monotonic() < deadline:
+                    await self.record(name, operation)
+
+            started = time.monotonic()
+            await asyncio.gather(*(worker(name, op) for name, op in scenarios.items()
+                                   for _ in range(HEAVY.get(name, self.concurrency))))
+            elapsed = time.monotonic() - started
+
+            server = {}
+            for path in ("/cache-stats", "/upstream-stats", "/intent-stats"):
+                response = await http.get(path)
+                if response.status_code == 200:
+                    server[path.strip("/")] = response.json()
+
+        results = {name: summarize(self.latencies[name], self.errors[name], elapsed,
+                                   statuses=dict(self.statuses[name]))
+                   for name in scenarios}
+        return results, elapsed, server
+
+def start_server(args, workspace: str) -> subprocess.Popen:
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakes.py"), "serve",
+               "--port", str(args.port), "--llm-port", str(args.llm_port), "--workspace", workspace,
+               "--image-latency", str(args.image_latency), "--video-latency", str(args.video_latency),
+               "--llm-latency", str(args.llm_latency), "--failure-rate", str(args.failure_rate),
+               "--poll-interval", str(args.poll_interval)]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL if not args.server_logs else None,
+                              stderr=subprocess.STDOUT if not args.server_logs else None)
+
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit("The app exited during startup; rerun with --server-logs to see why")
+        try:
+            if httpx.get(f"{url}/list-files", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise SystemExit("The app did not start within 60s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", help="Target an already running app instead of starting one with fakes")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run the scenarios")
+    parser.add_argument("--concurrency", type=int, default=4, help="Workers per light scenario")
+    parser.add_argument("--scenarios", help="Comma-separated subset of scenarios")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--llm-port", type=int, default=8790)
+    parser.add_argument("--image-latency", type=float, default=0.8)
+    parser.add_argument("--video-latency", type=float, default=5.0)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--keep-workspace", action="store_true")
+    parser.add_argument("--server-logs", action="store_true", help="Show the app's output")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    server, workspace = None, None
+    if not args.url:
+        workspace = tempfile.mkdtemp(prefix="bench_workspace_")
+        server = start_server(args, workspace)
+    url = args.url or f"http://127.0.0.1:{args.port}"
+
+    try:
+        test = LoadTest(url, args.concurrency, args.duration)
+        selected = [s.strip() for s in args.scenarios.split(",")] if args.scenarios else None
+        results, elapsed, server_stats = asyncio.run(test.run(selected))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if workspace and not args.keep_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    print(f"{args.duration:g}s against {url}"
+          + (f" (fakes: image {args.image_latency}s, video {args.video_latency}s, LLM {args.llm_latency}s,"
+             f" failure rate {args.failure_rate})" if not args.url else ""))
+    print_table(results)
+    for name, summary in results.items():
+        unexpected = {k: v for k, v in summary["statuses"].items() if k not in ("200", "202", "206", "304")}
+        if unexpected:
+            print(f"  {name}: {unexpected}")
+
+    config = {k: v for k, v in vars(args).items() if k not in ("json", "compare")}
+    document = {"benchmark": "load_test", "meta": {}, "config": config, "results": results}
+    if args.json:
+        document = write_results(args.json, "load_test", config, results, elapsed_s=round(elapsed, 2),
+                                 server_stats=server_stats)
+    if args.compare:
+        print_comparison(load_results(args.compare), document)
+
+if __name__ == "__main__":
+    main()
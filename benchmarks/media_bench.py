@@ -0,0 +1,102 @@
+"""
+Trim and export benchmark on synthetic clips of several lengths.
+
+Generates Veo-shaped clips (1280x720, 24 fps, H.264 with a 1 s GOP, AAC audio)
+of each --lengths, plus a 640x480 silent clip that forces the render path, and
+times the real video_editing functions in-process:
+    trim_fast       smart cut of the middle half of the clip
+    trim_precise    full re-encode of the same range
+    export_concat   two matching scenes from the clip, joined by stream copy
+    export_render   a scene from the clip and one from the mismatched clip, rendered then joined
+
+Exports run without the segment cache, so every repeat does the full work.
+Reports the median and spread of wall time and the realtime factor (seconds of
+output per second of encoding) for each operation and length.
+
+Usage:
+    python benchmarks/media_bench.py
+    python benchmarks/media_bench.py --lengths 5,15,60 --repeat 3 --json media.json
+    python benchmarks/media_bench.py --compare media.json
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from statistics import median
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import make_clip
+from benchmarks.report import load_results, print_comparison, print_table, summarize, write_results
+from video_editing import export_sequence_file, trim_video_file
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+def bench_length(workdir: str, length: float, odd_clip: str, repeat: int) -> dict:
+    clip = make_clip(os.path.join(workdir, f"clip_{length:g}s.mp4"), length)
+    start, end = length / 4, length * 3 / 4
+    # Cut points off the keyframes, as a user's would be
+    start, end = round(start + 0.3, 2), round(end - 0.3, 2)
+
+    operations = {
+        "trim_fast": (lambda out: trim_video_file(clip, start, end, out, mode="fast"), end - start),
+        "trim_precise": (lambda out: trim_video_file(clip, start, end, out, mode="precise"), end - start),
+        "export_concat": (lambda out: export_sequence_file([(clip, 0.4, length / 2), (clip, length / 2, length - 0.4)],
+                                                           out, cache=None), length - 0.8),
+        "export_render": (lambda out: export_sequence_file([(clip, 0.4, length / 2), (odd_clip, 0, 2)],
+                                                           out, cache=None), length / 2 - 0.4 + 2),
+    }
+
+    results = {}
+    for name, (run, output_seconds) in operations.items():
+        walls, paths = [], set()
+        for index in range(repeat):
+            out = os.path.join(workdir, f"{name}_{length:g}_{index}.mp4")
+            result, wall = timed(run, out)
+            walls.append(wall)
+            paths.add(result if isinstance(result, str) else result.get("path"))
+            os.remove(out)
+        results[f"{name}_{length:g}s"] = summarize(
+            [w * 1000 for w in walls], elapsed=None,
+            output_seconds=round(output_seconds, 2),
+            realtime_factor=round(output_seconds / median(walls), 1),
+            path_used=sorted(p for p in paths if p),
+        )
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--lengths", default="5,15,60", help="Comma-separated clip lengths in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per operation; the median is reported")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    lengths = [float(x) for x in args.lengths.split(",") if x.strip()]
+    workdir = tempfile.mkdtemp(prefix="media_bench_")
+    try:
+        odd_clip = make_clip(os.path.join(workdir, "odd.mp4"), 3, width=640, height=480, fps=30, audio=False)
+        results = {}
+        for length in lengths:
+            results.update(bench_length(workdir, length, odd_clip, args.repeat))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"Clips: {', '.join(f'{l:g}s' for l in lengths)} at 1280x720 24 fps, {args.repeat} run(s) each")
+    print_table(results, extra_columns=("realtime_factor", "path_used"))
+
+    config = {"lengths": lengths, "repeat": args.repeat}
+    document = {"benchmark": "media_bench", "meta": {}, "config": config, "results": results}
+    if args.json:
+        document = write_results(args.json, "media_bench", config, results)
+    if args.compare:
+        print_comparison(load_results(args.compare), document)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Shared helpers for benchmark results: latency summaries, run metadata, JSON files and comparisons.
+
+Every benchmark writes one JSON document:
+    {"benchmark": ..., "meta": {...}, "config": {...}, "results": {name: summary}}
+where each summary has count, errors, and latency percentiles in milliseconds.
+compare() lines up two such files so a run can be checked against a baseline.
+
+Usage:
+    summary = summarize(latencies_ms, errors=3, elapsed=60)
+    write_results("load.json", "load_test", config, results)
+    print_comparison(load_results("old.json"), document)
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from statistics import mean, quantiles
+from typing import Dict, Iterable, List, Optional
+
+def percentile(values: List[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return quantiles(values, n=100, method="inclusive")[q - 1]
+
+def summarize(latencies_ms: Iterable[float], errors: int = 0, elapsed: Optional[float] = None,
+              **extra) -> Dict[str, object]:
+    """
+    Count, throughput and latency percentiles of one scenario.
+
+    Args:
+        latencies_ms: Latency of every successful operation
+        errors: Failed operations
+        elapsed: Wall seconds the scenario ran, for throughput
+        **extra: Further fields to keep in the summary
+    """
+    values = sorted(latencies_ms)
+    summary = {
+        "count": len(values),
+        "errors": errors,
+        "p50_ms": round(percentile(values, 50), 1),
+        "p95_ms": round(percentile(values, 95), 1),
+        "p99_ms": round(percentile(values, 99), 1),
+        "mean_ms": round(mean(values), 1) if values else 0.0,
+        "max_ms": round(values[-1], 1) if values else 0.0,
+    }
+    if elapsed:
+        summary["throughput_per_s"] = round(len(values) / elapsed, 2)
+    summary.update(extra)
+    return summary
+
+def run_metadata() -> Dict[str, object]:
+    """Where and on what the run happened, so results from different machines aren't mixed up."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "argv": sys.argv[1:],
+    }
+
+def write_results(path: str, benchmark: str, config: Dict[str, object], results: Dict[str, object],
+                  **extra) -> Dict[str, object]:
+    document = {"benchmark": benchmark, "meta": run_metadata(), "config": config, "results": results, **extra}
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {path}")
+    return document
+
+def load_results(path: str) -> Dict[str, object]:
+    with open(path) as f:
+        return json.load(f)
+
+COMPARED_FIELDS = ("p50_ms", "p95_ms", "p99_ms", "throughput_per_s", "realtime_factor")
+
+def compare(baseline: Dict[str, object], current: Dict[str, object],
+            fields=COMPARED_FIELDS) -> Dict[str, Dict[str, object]]:
+    """Per result and field: baseline, current and relative change (negative latency change is better)."""
+    out = {}
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if not isinstance(before, dict) or not isinstance(now, dict):
+            continue
+        row = {}
+        for field in fields:
+            if field in before and field in now:
+                change = (now[field] - before[field]) / before[field] if before[field] else None
+                row[field] = {"baseline": before[field], "current": now[field],
+                              "change": round(change, 3) if change is not None else None}
+        out[name] = row
+    return out
+
+def print_comparison(baseline: Dict[str, object], current: Dict[str, object]) -> None:
+    rows = compare(baseline, current)
+    print(f"\nCompared with {baseline['meta'].get('timestamp')} (commit {baseline['meta'].get('commit')}):")
+    for name, row in rows.items():
+        cells = []
+        for field, values in row.items():
+            change = f"{values['change']:+.0%}" if values["change"] is not None else "n/a"
+            cells.append(f"{field} {values['baseline']}→{values['current']} ({change})")
+        print(f"  {name:<22} " + ", ".join(cells))
+
+def print_table(results: Dict[str, Dict[str, object]], extra_columns=()) -> None:
+    header = f"{'scenario':<22} {'count':>6} {'err':>4} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header + "".join(f" {c:>12}" for c in extra_columns))
+    for name, s in results.items():
+        line = (f"{name:<22} {s['count']:>6} {s['errors']:>4} {s.get('throughput_per_s', ''):>7} "
+                f"{s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9}")
+        print(line + "".join(f" {str(s.get(c, '')):>12}" for c in extra_columns))
@@ -0,0 +1,146 @@
+"""
+Cold start benchmark: import time and time to the first served request.
+
+Every run starts fresh interpreters in an isolated workspace (static and
+templates symlinked in, no media), with a fake GOOGLE_API_KEY, and times:
+    import_main         `import main` in a new interpreter, plus which SDKs it loaded
+    first_request_1w    a single uvicorn worker, from launch to the first 200 from /list-files
+    first_request_Nw    server.py with --workers N, from launch to the first 200
+
+--baseline REF repeats the scenarios on a git worktree of REF (server.py
+scenarios are skipped when REF has no server.py), reported as <scenario>@REF.
+
+Usage:
+    python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py --repeat 5 --workers 2 --baseline HEAD~1 --json startup.json
+    python benchmarks/startup_bench.py --compare startup.json
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.report import load_results, print_comparison, print_table, summarize, write_results
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy SDKs whose import cost the app should only pay on first use
+SDK_MODULES = ("openai", "google.genai", "httpx")
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def make_workspace(source: str) -> str:
+    workspace = tempfile.mkdtemp(prefix="startup_bench_")
+    for name in ("static", "templates"):
+        os.symlink(os.path.join(source, name), os.path.join(workspace, name))
+    return workspace
+
+def app_env(source: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=source, GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "fake"))
+    env.pop("SHARED_STORE_PATH", None)
+    return env
+
+def time_import(source: str, repeat: int) -> dict:
+    probe = ("import time, sys; t = time.perf_counter(); import main; "
+             "print(time.perf_counter() - t); "
+             f"print(','.join(m for m in {SDK_MODULES!r} if m in sys.modules))")
+    walls, loaded = [], ""
+    for _ in range(repeat):
+        workspace = make_workspace(source)
+        try:
+            started = time.perf_counter()
+            out = subprocess.run([sys.executable, "-c", probe], cwd=workspace, env=app_env(source),
+                                 capture_output=True, text=True, check=True).stdout.split("\n")
+            walls.append(time.perf_counter() - started)
+            loaded = out[1]
+        finally:
+            shutil.rmtree(workspace, ignore_errors=True)
+    return summarize([w * 1000 for w in walls], sdks_loaded=loaded or "none")
+
+def wait_until_ready(port: int, process: subprocess.Popen, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline and process.poll() is None:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/list-files", timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+def time_first_request(source: str, command: list, repeat: int, timeout: float) -> dict:
+    walls, errors = [], 0
+    for _ in range(repeat):
+        workspace = make_workspace(source)
+        port = free_port()
+        started = time.perf_counter()
+        process = subprocess.Popen(command + ["--port", str(port)], cwd=workspace, env=app_env(source),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if wait_until_ready(port, process, timeout):
+                walls.append(time.perf_counter() - started)
+            else:
+                errors += 1
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            shutil.rmtree(workspace, ignore_errors=True)
+    return summarize([w * 1000 for w in walls], errors=errors)
+
+def bench_tree(source: str, repeat: int, workers: int, timeout: float, suffix: str = "") -> dict:
+    results = {f"import_main{suffix}": time_import(source, repeat)}
+    uvicorn_cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--log-level", "warning"]
+    results[f"first_request_1w{suffix}"] = time_first_request(source, uvicorn_cmd, repeat, timeout)
+    if os.path.exists(os.path.join(source, "server.py")):
+        server_cmd = [sys.executable, os.path.join(source, "server.py"), "--host", "127.0.0.1",
+                      "--workers", str(workers)]
+        results[f"first_request_{workers}w{suffix}"] = time_first_request(source, server_cmd, repeat, timeout)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=5, help="Cold starts per scenario")
+    parser.add_argument("--workers", type=int, default=2, help="Workers for the server.py scenario")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for a server to answer")
+    parser.add_argument("--baseline", help="A git ref to run the same scenarios on, for comparison")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    results = bench_tree(REPO_DIR, args.repeat, args.workers, args.timeout)
+    if args.baseline:
+        worktree = tempfile.mkdtemp(prefix="startup_bench_ref_")
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, args.baseline],
+                       cwd=REPO_DIR, check=True, capture_output=True)
+        try:
+            results.update(bench_tree(worktree, args.repeat, args.workers, args.timeout, suffix=f"@{args.baseline}"))
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=REPO_DIR, capture_output=True)
+            shutil.rmtree(worktree, ignore_errors=True)
+
+    print(f"{args.repeat} cold start(s) per scenario on {os.cpu_count()} CPU(s)")
+    print_table(results, extra_columns=("sdks_loaded",))
+
+    config = {"repeat": args.repeat, "workers": args.workers, "baseline": args.baseline}
+    document = {"benchmark": "startup_bench", "meta": {}, "config": config, "results": results}
+    if args.json:
+        document = write_results(args.json, "startup_bench", config, results)
+    if args.compare:
+        print_comparison(load_results(args.compare), document)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Per-model concurrency limits for upstream generation calls.
+
+Each model gets a ConcurrencyLimiter that caps the number of in-flight calls
+and the number of requests allowed to wait for a slot. Once the wait queue is
+full, new requests are rejected with QueueFullError instead of piling up, and
+endpoints turn that into a 503 with a Retry-After header.
+
+Configuration (environment):
+    MODEL_MAX_CONCURRENCY=8          default in-flight cap per model
+    MODEL_MAX_QUEUE=32               default queue depth per model
+    MODEL_CONCURRENCY=gemini-2.5-flash-image-preview=16:64,veo-3.0-fast-generate-001=4:16
+                                     per-model overrides as model=concurrency:queue
+
+Usage:
+    async with get_model_limiter("gemini-2.5-flash-image-preview").slot():
+        response = await client.aio.models.generate_content(...)
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "8"))
+DEFAULT_MAX_QUEUE = int(os.getenv("MODEL_MAX_QUEUE", "32"))
+
+class QueueFullError(Exception):
+    """Raised when a limiter's wait queue is already at its depth limit."""
+
+    def __init__(self, name: str, retry_after: int = 5):
+        super().__init__(f"Too many pending requests for {name}, please retry later")
+        self.name = name
+        self.retry_after = retry_after
+
+class ConcurrencyLimiter:
+    """Caps in-flight calls and rejects callers once too many are waiting."""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        # Waiters in arrival order, each with an optional queue position callback
+        self._waiters: Dict[object, Optional[Callable[[int], None]]] = {}
+
+    def check(self) -> None:
+        """Raise QueueFullError now if a new caller would be turned away."""
+        if self.in_flight >= self.max_concurrent and self.waiting >= self.max_queue:
+            raise QueueFullError(self.name)
+
+    @asynccontextmanager
+    async def slot(self, on_position: Optional[Callable[[int], None]] = None):
+        """
+        Hold one of the limiter's slots.
+
+        Args:
+            on_position: Called with the caller's 1-based queue position whenever
+                it changes while waiting, and with 0 once the slot is acquired
+        """
+        self.check()
+
+        self.waiting += 1
+        token = object()
+        self._waiters[token] = on_position
+        self._notify_positions()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            del self._waiters[token]
+            self._notify_positions()
+        if on_position is not None:
+            on_position(0)
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def _notify_positions(self) -> None:
+        for position, callback in enumerate(self._waiters.values(), 1):
+            if callback is not None:
+                callback(position)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+        }
+
+def _parse_overrides(raw: str) -> Dict[str, Tuple[int, int]]:
+    """Parse MODEL_CONCURRENCY entries of the form model=concurrency:queue."""
+    overrides = {}
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry or "=" not in entry:
+            continue
+        model, limits = entry.rsplit("=", 1)
+        concurrency, _, queue = limits.partition(":")
+        overrides[model.strip()] = (
+            int(concurrency) if concurrency else DEFAULT_MAX_CONCURRENCY,
+            int(queue) if queue else DEFAULT_MAX_QUEUE,
+        )
+    return overrides
+
+MODEL_OVERRIDES = _parse_overrides(os.getenv("MODEL_CONCURRENCY", ""))
+
+# Limiter cache, one per model
+model_limiters: Dict[str, ConcurrencyLimiter] = {}
+
+def get_model_limiter(model: str) -> ConcurrencyLimiter:
+    """Get or create the limiter for a model."""
+    if model not in model_limiters:
+        max_concurrent, max_queue = MODEL_OVERRIDES.get(model, (DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_QUEUE))
+        model_limiters[model] = ConcurrencyLimiter(model, max_concurrent, max_queue)
+    return model_limiters[model]
@@ -0,0 +1,204 @@
+"""
+Content-addressed cache for paid generation calls.
+
+Results are keyed by a SHA-256 of everything that determines the output
+(kind, model, prompt, mode and the input image bytes). A hit returns the
+stored result without calling upstream, and concurrent identical requests
+share one in-flight upstream call instead of each making their own.
+
+The cache only indexes results; the generated files themselves stay in the
+gallery directories. Evicting an entry (LRU, once GENERATION_CACHE_MAX_ENTRIES
+is exceeded) just forgets it. Entries whose files are deleted are dropped
+right away through forget_files, or else on lookup.
+
+With a shared store (several worker processes, see shared_store.py) entries
+and in-flight video jobs are also written there, so a worker can hit on a
+result another worker generated, or join the job generating it. Lookups that
+miss locally read the store on its thread (so get() is a coroutine), and
+writes are queued there without waiting. Coalescing of in-flight image calls
+stays within each worker.
+
+Usage:
+    key = make_cache_key("image", model, prompt, mode, image_bytes)
+    result, status = await generation_cache.get_or_create(key, factory, files_of, bypass=False)
+"""
+
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from shared_store import SharedStore
+
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "1000"))
+# How long another worker may join an in-flight job; matches the Veo job timeout
+INFLIGHT_JOB_TTL = float(os.getenv("VIDEO_JOB_TIMEOUT", "900"))
+
+def make_cache_key(*parts: Any) -> str:
+    """Hash the parts (str, bytes or None) into a stable content address."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            data = b""
+        elif isinstance(part, bytes):
+            data = part
+        else:
+            data = str(part).encode("utf-8")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") differ
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+class GenerationCache:
+    """LRU index of generation results with in-flight request coalescing."""
+
+    def __init__(self, max_entries: int = GENERATION_CACHE_MAX_ENTRIES, store: Optional[SharedStore] = None):
+        self.max_entries = max_entries
+        self.store = store
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], List[str]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._inflight_jobs: Dict[str, str] = {}
+        self.counters: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "bypassed": 0,
+            "evictions": 0,
+        }
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result, dropping it if any of its files are gone."""
+        entry = self._entries.get(key)
+        if entry is None and self.store is not None:
+            shared = await self.store.call(self.store.get, "generation", key)
+            if shared is not None:
+                entry = self._entries[key] = (shared["result"], shared["files"])
+        if entry is None:
+            return None
+        result, files = entry
+        if not all(os.path.exists(path) for path in files):
+            self._entries.pop(key, None)
+            if self.store is not None:
+                self.store.submit(self.store.delete, "generation", key)
+            return None
+        self._entries.move_to_end(key)
+        return dict(result)
+
+    def put(self, key: str, result: Dict[str, Any], files: List[str]) -> None:
+        self._entries[key] = (dict(result), list(files))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+        if self.store is not None:
+            self.store.submit(self._share, key, {"result": dict(result), "files": list(files)})
+
+    def _share(self, key: str, entry: Dict[str, Any]) -> None:
+        """Write an entry to the shared store and trim it to max_entries. Runs on the store thread."""
+        self.store.put("generation", key, entry)
+        self.store.prune("generation", self.max_entries)
+
+    def forget_files(self, paths: Iterable[str]) -> int:
+        """Drop every entry that depends on one of these files; returns how many were dropped."""
+        gone = {os.path.normpath(path) for path in paths}
+        stale = [key for key, (_, files) in self._entries.items()
+                 if any(os.path.normpath(path) in gone for path in files)]
+        for key in stale:
+            del self._entries[key]
+        if self.store is not None:
+            self.store.submit(self._forget_shared, gone)
+        return len(stale)
+
+    def _forget_shared(self, gone: Set[str]) -> None:
+        for key, shared in self.store.items("generation"):
+            if any(os.path.normpath(path) in gone for path in shared["files"]):
+                self.store.delete("generation", key)
+
+    async def get_or_create(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Dict[str, Any]]],
+        files_of: Callable[[Dict[str, Any]], List[str]],
+        bypass: bool = False,
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        Return (result, status) where status is 'hit', 'miss', 'coalesced' or 'bypass'.
+
+        Args:
+            key: Content address from make_cache_key
+            factory: Coroutine function making the upstream call on a miss
+            files_of: Maps a result to the files it depends on
+            bypass: Skip lookup and coalescing to get a fresh sample
+
+        Returns:
+            The result dict and how it was obtained
+        """
+        if bypass:
+            self.counters["bypassed"] += 1
+            result = await factory()
+            self.put(key, result, files_of(result))
+            return result, "bypass"
+
+        while True:
+            cached = await self.get(key)
+            if cached is not None:
+                self.counters["hits"] += 1
+                return cached, "hit"
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self.counters["coalesced"] += 1
+            try:
+                return dict(await asyncio.shield(pending)), "coalesced"
+            except asyncio.CancelledError:
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                # The owner was cancelled, not this caller: look again, and the first
+                # waiter back becomes the new owner
+                self.counters["coalesced"] -= 1
+
+        self.counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        # Mark the exception as retrieved in case nobody else was waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        self.put(key, result, files_of(result))
+        future.set_result(result)
+        return result, "miss"
+
+    async def get_inflight_job(self, key: str) -> Optional[str]:
+        job_id = self._inflight_jobs.get(key)
+        if job_id is None and self.store is not None:
+            job_id = await self.store.call(self.store.get, "inflight_jobs", key)
+        return job_id
+
+    def set_inflight_job(self, key: str, job_id: str) -> None:
+        self._inflight_jobs[key] = job_id
+        if self.store is not None:
+            self.store.submit(self.store.put, "inflight_jobs", key, job_id, ttl=INFLIGHT_JOB_TTL)
+
+    def pop_inflight_job(self, key: str, job_id: str) -> None:
+        """Forget the job generating `key`, unless a newer job has taken its place."""
+        if self._inflight_jobs.get(key) == job_id:
+            del self._inflight_jobs[key]
+        if self.store is not None:
+            self.store.submit(self.store.delete_if, "inflight_jobs", key, job_id)
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self.counters)
+        stats["entries"] = len(self._entries)
+        stats["inflight"] = len(self._inflight) + len(self._inflight_jobs)
+        return stats
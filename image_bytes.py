@@ -0,0 +1,87 @@
+"""
+Zero-copy image byte path between disk and the Gemini/Veo APIs.
+
+Images travel as the bytes they already are: Gemini's inline_data is written
+to disk untouched (with the extension of its real format), and stored files
+are sent upstream as-is with their sniffed mime type. PIL is only used when
+a format has to be converted because the destination doesn't accept it.
+
+Usage:
+    part = image_part(source_bytes)                      # Gemini edit input
+    image = veo_image(source_bytes)                      # Veo image-to-video input
+    filename = save_image_bytes(data, "generated_images", mime_type)
+"""
+
+import os
+import uuid
+from io import BytesIO
+from typing import TYPE_CHECKING, Optional
+
+from PIL import Image
+
+from media_serving import sniff_content_type
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+# Stored extension for each image format we keep as-is
+IMAGE_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+# Formats each upstream API accepts without conversion
+GEMINI_IMAGE_TYPES = {"image/png", "image/jpeg", "image/webp"}
+VEO_IMAGE_TYPES = {"image/png", "image/jpeg"}
+
+def image_mime_type(data: bytes, declared: Optional[str] = None) -> Optional[str]:
+    """Mime type from the bytes themselves, falling back to what the sender declared."""
+    return sniff_content_type(data[:16]) or declared
+
+def to_png_bytes(data: bytes) -> bytes:
+    """Decode any image PIL can read and re-encode it as PNG."""
+    with Image.open(BytesIO(data)) as image:
+        buffer = BytesIO()
+        image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def image_part(data: bytes) -> "types.Part":
+    """Gemini content part for an image, converted to PNG only if Gemini can't take it as-is."""
+    from google.genai import types
+
+    mime_type = image_mime_type(data)
+    if mime_type not in GEMINI_IMAGE_TYPES:
+        data, mime_type = to_png_bytes(data), "image/png"
+    return types.Part.from_bytes(data=data, mime_type=mime_type)
+
+def veo_image(data: bytes) -> "types.Image":
+    """Veo input image, converted to PNG only if Veo can't take it as-is."""
+    from google.genai import types
+
+    mime_type = image_mime_type(data)
+    if mime_type not in VEO_IMAGE_TYPES:
+        data, mime_type = to_png_bytes(data), "image/png"
+    return types.Image(image_bytes=data, mime_type=mime_type)
+
+def save_image_bytes(data: bytes, directory: str, mime_type: Optional[str] = None) -> str:
+    """
+    Write image bytes to a new uuid file without re-encoding them.
+
+    Args:
+        data: Encoded image bytes, e.g. Gemini's inline_data.data
+        directory: Destination directory
+        mime_type: Declared mime type, used when the bytes can't be sniffed
+
+    Returns:
+        The new filename
+    """
+    mime_type = image_mime_type(data, mime_type)
+    if mime_type not in IMAGE_EXTENSIONS:
+        data, mime_type = to_png_bytes(data), "image/png"
+
+    filename = f"{uuid.uuid4()}{IMAGE_EXTENSIONS[mime_type]}"
+    with open(os.path.join(directory, filename), "wb") as f:
+        f.write(data)
+    return filename
@@ -0,0 +1,153 @@
+"""
+Tiered classifier deciding whether a prompt asks for a new image or an edit.
+
+Tiers, cheapest first:
+    1. LRU/TTL cache keyed by the normalized prompt, also kept in the shared
+       store when the app runs as several workers (see shared_store.py)
+    2. Local keyword/regex rules for obvious prompts ("make it ...", "change the ...",
+       or no current image to edit at all)
+    3. The LLM fallback, only for prompts the rules can't decide
+
+Usage:
+    classifier = IntentClassifier(llm_classify)
+    request_type = await classifier.classify(prompt, has_current_image=True)
+    classifier.stats()
+"""
+
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from shared_store import SharedStore
+
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "2048"))
+INTENT_CACHE_TTL = float(os.getenv("INTENT_CACHE_TTL", "3600"))
+
+# Phrases that almost always refer to an image that already exists
+EDIT_PATTERNS = [
+    r"^(now|also|then|and|but|instead)\b",
+    r"\b(make|turn|keep|leave) (it|this|that|him|her|them|the (image|picture|photo|background|sky|scene))\b",
+    r"\b(change|replace|remove|add|recolou?r|adjust|edit|modify|swap|erase|fix|brighten|darken|crop|tweak|update|move|rotate|flip|blur|sharpen|zoom) (the|this|that|it|its|his|her|their|them)\b",
+    r"\b(in|on|to|from) (this|the current|the same|the existing) (image|picture|photo)\b",
+    r"\b(same|current|existing|previous|last) (image|picture|photo|one)\b",
+    r"\b(more|less) (colou?rful|bright|dark|saturated|detailed|realistic)\b",
+    r"\b(bigger|smaller|brighter|darker|warmer|cooler)\b",
+]
+
+# Phrases that describe a fresh image from scratch
+NEW_PATTERNS = [
+    r"^(generate|create|draw|paint|render|imagine|design|illustrate|sketch|produce|make) (me )?(a|an|some|two|three|\d+)\b",
+    r"^(show|give) me (a|an|some)\b",
+    r"\b(a|another|brand) new (image|picture|photo|one)\b",
+    r"\bfrom scratch\b",
+    r"\bstart over\b",
+    r"^(a|an)\s+\w+",
+]
+
+_EDIT_RE = [re.compile(p) for p in EDIT_PATTERNS]
+_NEW_RE = [re.compile(p) for p in NEW_PATTERNS]
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and strip surrounding punctuation."""
+    text = re.sub(r"\s+", " ", prompt.lower()).strip()
+    return text.strip(" .!?,;:'\"")
+
+def classify_locally(normalized: str) -> Optional[str]:
+    """Return 'new' or 'edit' when the rules agree on one side, None if ambiguous."""
+    edit_hits = sum(1 for pattern in _EDIT_RE if pattern.search(normalized))
+    new_hits = sum(1 for pattern in _NEW_RE if pattern.search(normalized))
+    if edit_hits and not new_hits:
+        return "edit"
+    if new_hits and not edit_hits:
+        return "new"
+    return None
+
+class IntentClassifier:
+    """Cache, then local rules, then LLM; counts how often each tier answers."""
+
+    def __init__(
+        self,
+        llm_classify: Callable[[str], Awaitable[Optional[str]]],
+        max_entries: int = INTENT_CACHE_SIZE,
+        ttl: float = INTENT_CACHE_TTL,
+        store: Optional[SharedStore] = None,
+    ):
+        self._llm_classify = llm_classify
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.counters: Dict[str, int] = {
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "no_image": 0,
+            "local": 0,
+            "llm_fallbacks": 0,
+            "llm_failures": 0,
+        }
+
+    async def classify(self, prompt: str, has_current_image: bool = True) -> str:
+        # Nothing to edit, so it can only be a new image
+        if not has_current_image:
+            self.counters["no_image"] += 1
+            return "new"
+
+        normalized = normalize_prompt(prompt)
+
+        cached = await self._get_cached(normalized)
+        if cached is not None:
+            self.counters["cache_hits"] += 1
+            return cached
+        self.counters["cache_misses"] += 1
+
+        result = classify_locally(normalized)
+        if result is not None:
+            self.counters["local"] += 1
+            self._put_cached(normalized, result)
+            return result
+
+        self.counters["llm_fallbacks"] += 1
+        result = await self._llm_classify(prompt)
+        if result not in ("new", "edit"):
+            # Don't cache failures, the next request may reach the LLM
+            self.counters["llm_failures"] += 1
+            return "new"
+
+        self._put_cached(normalized, result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self.counters)
+        stats["llm_calls_saved"] = stats["cache_hits"] + stats["no_image"] + stats["local"]
+        stats["cache_size"] = len(self._cache)
+        return stats
+
+    async def _get_cached(self, key: str) -> Optional[str]:
+        entry = self._cache.get(key)
+        if entry is None and self.store is not None:
+            shared = await self.store.call(self.store.get, "intent", key)
+            if shared is not None:
+                entry = self._cache[key] = (shared, time.monotonic() + self.ttl)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return result
+
+    def _put_cached(self, key: str, result: str) -> None:
+        self._cache[key] = (result, time.monotonic() + self.ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        if self.store is not None:
+            self.store.submit(self._share, key, result)
+
+    def _share(self, key: str, result: str) -> None:
+        """Write a result to the shared store and trim it to max_entries. Runs on the store thread."""
+        self.store.put("intent", key, result, ttl=self.ttl)
+        self.store.prune("intent", self.max_entries)
@@ -0,0 +1,410 @@
+"""
+Background job registry for long-running generation work.
+
+Endpoints that would otherwise hold a request open for minutes create a job,
+hand the slow work to a background task and return the job id right away.
+Clients then poll GET /jobs/{job_id} for the status and the final result.
+
+Usage:
+    job = job_registry.create("video")
+    job_registry.spawn(job.id, some_coroutine())
+    job_registry.set_progress(job.id, percent=40, stage="encoding")
+    job_registry.get(job.id).to_dict()                # this process's jobs
+    (await job_registry.fetch(job_id)).to_dict()      # any worker's jobs
+
+    async for snapshot in job_registry.watch(job.id):
+        ...  # latest job state after each change; None on a heartbeat
+
+Progress lives in job.progress (queue position, Veo operation state, encode
+percentage and stage) and every change wakes the watchers, which is what the
+GET /jobs/{job_id}/events SSE stream is built on.
+
+Veo video operations are tracked by a single VeoOperationPoller task, which
+polls every in-flight operation concurrently instead of sleeping per request.
+
+With a shared store (several worker processes, see shared_store.py) job
+changes are also written there, so any worker can report a job (fetch()) and
+stream its events. Writes happen on the store thread, at most every
+JOB_PUBLISH_INTERVAL seconds per process with only each job's latest state,
+so a stream of progress ticks costs one write per interval. Watching a job
+another worker runs polls the store every JOB_WATCH_INTERVAL seconds.
+Cancelling one leaves a request in the store that the owning worker picks up
+within JOB_CANCEL_POLL seconds; snapshots say whether the job still has a
+task to cancel.
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from observability import log, upstream_call
+from shared_store import SharedStore
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+FINISHED_STATES = {JOB_SUCCEEDED, JOB_FAILED}
+
+# Poller configuration - overridable from the environment
+VIDEO_POLL_INTERVAL = float(os.getenv("VIDEO_POLL_INTERVAL", "10"))
+VIDEO_JOB_TIMEOUT = float(os.getenv("VIDEO_JOB_TIMEOUT", "900"))
+VIDEO_POLL_MAX_ERRORS = int(os.getenv("VIDEO_POLL_MAX_ERRORS", "5"))
+
+# Shared store settings, only used when the app runs as several workers
+JOB_STORE_TTL = float(os.getenv("JOB_STORE_TTL", "86400"))
+JOB_WATCH_INTERVAL = float(os.getenv("JOB_WATCH_INTERVAL", "0.5"))
+JOB_CANCEL_POLL = float(os.getenv("JOB_CANCEL_POLL", "1"))
+JOB_PUBLISH_INTERVAL = float(os.getenv("JOB_PUBLISH_INTERVAL", "0.25"))
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str = JOB_QUEUED
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    result: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    progress: Dict[str, Any] = field(default_factory=dict)
+    # Internal bookkeeping, never serialized
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job for API responses; result fields are flattened in."""
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "error": self.error,
+            "progress": self.progress,
+        }
+        data.update(self.result)
+        return data
+
+    def to_record(self) -> Dict[str, Any]:
+        """Everything needed to rebuild the job in another process."""
+        return {"kind": self.kind, "status": self.status, "created_at": self.created_at,
+                "updated_at": self.updated_at, "result": self.result, "error": self.error,
+                "progress": self.progress}
+
+class JobRegistry:
+    """Registry of this process's jobs and the background tasks running them, optionally shared."""
+
+    def __init__(self, max_finished: int = 1000, store: Optional[SharedStore] = None):
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._watchers: Dict[str, Set[asyncio.Event]] = {}
+        self._cancel_poller: Optional[asyncio.Task] = None
+        # Latest unpublished snapshot per job, written by the publisher task
+        self._unpublished: Dict[str, Dict[str, Any]] = {}
+        self._publisher: Optional[asyncio.Task] = None
+        self._failure_listeners: List[Callable[[Job], None]] = []
+        self.max_finished = max_finished
+        self.store = store
+
+    def create(self, kind: str) -> Job:
+        job = Job(id=uuid.uuid4().hex, kind=kind)
+        self._jobs[job.id] = job
+        self._publish(job)
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job of this process."""
+        return self._jobs.get(job_id)
+
+    async def fetch(self, job_id: str) -> Optional[Job]:
+        """A job of this process, or a snapshot of one another worker runs."""
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            record = await self.store.call(self.store.get, "jobs", job_id)
+            if record is not None:
+                cancellable = record.pop("cancellable", False)
+                job = Job(id=job_id, **record)
+                job.meta["cancellable"] = cancellable
+        return job
+
+    def _publish(self, job: Job) -> None:
+        """Queue the job's snapshot for the shared store; repeated changes collapse into one write."""
+        if self.store is None:
+            return
+        self._unpublished[job.id] = {**job.to_record(), "cancellable": job.id in self._tasks}
+        if self._publisher is None or self._publisher.done():
+            self._publisher = contextvars.Context().run(asyncio.create_task, self._publish_pending())
+
+    async def _publish_pending(self) -> None:
+        while self._unpublished:
+            batch, self._unpublished = self._unpublished, {}
+            try:
+                await self.store.call(self.store.put_many, "jobs", batch, ttl=JOB_STORE_TTL)
+            except Exception as e:
+                log(f"⚠️ Publishing {len(batch)} job(s) to the shared store failed: {e}", level="warning")
+            await asyncio.sleep(JOB_PUBLISH_INTERVAL)
+
+    async def flush(self) -> None:
+        """Wait until every job change so far is in the shared store, e.g. before handing out a job id."""
+        if self.store is None:
+            return
+        batch, self._unpublished = self._unpublished, {}
+        # The store thread runs calls in order, so this also waits out a write already under way
+        await self.store.call(self.store.put_many, "jobs", batch, ttl=JOB_STORE_TTL)
+
+    def update(self, job_id: str, **fields) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        for key, value in fields.items():
+            setattr(job, key, value)
+        job.updated_at = time.time()
+        self._publish(job)
+        for event in self._watchers.get(job_id, ()):
+            event.set()
+        return job
+
+    def set_progress(self, job_id: str, **progress) -> None:
+        """Merge progress fields into the job and notify watchers."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            self.update(job_id, progress={**job.progress, **progress})
+
+    def succeed(self, job_id: str, **result) -> None:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.result.update(result)
+            self.update(job_id, status=JOB_SUCCEEDED, progress={**job.progress, "stage": "done", "percent": 100})
+
+    def fail(self, job_id: str, error: str) -> None:
+        job = self.update(job_id, status=JOB_FAILED, error=error)
+        if job is not None:
+            for listener in self._failure_listeners:
+                listener(job)
+
+    def on_failure(self, listener: Callable[[Job], None]) -> None:
+        """Call listener(job) whenever a job fails, is cancelled or times out."""
+        self._failure_listeners.append(listener)
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancel a job's background task; returns False if it had none running."""
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+            return True
+        if self.store is not None and job_id not in self._jobs:
+            job = await self.fetch(job_id)
+            if job is not None and job.meta.get("cancellable"):
+                # Another worker runs it; it cancels the task when it sees the request
+                await self.store.call(self.store.put, "job_cancel", job_id, True, ttl=JOB_STORE_TTL)
+                return True
+        return False
+
+    async def _poll_cancellations(self) -> None:
+        """Cancel this process's jobs that other workers were asked to cancel."""
+        while self._tasks:
+            await asyncio.sleep(JOB_CANCEL_POLL)
+            for job_id, _ in await self.store.call(self.store.items, "job_cancel"):
+                task = self._tasks.get(job_id)
+                if task is not None:
+                    self.store.submit(self.store.delete, "job_cancel", job_id)
+                    task.cancel()
+
+    async def watch(self, job_id: str, heartbeat: float = 15.0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield the job's state now and after every change until it finishes.
+
+        Changes that happen while the consumer is busy are collapsed into one
+        snapshot. None is yielded after heartbeat seconds without a change.
+        """
+        if job_id not in self._jobs and self.store is not None:
+            async for snapshot in self._watch_remote(job_id, heartbeat):
+                yield snapshot
+            return
+
+        event = asyncio.Event()
+        self._watchers.setdefault(job_id, set()).add(event)
+        try:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return
+                event.clear()
+                yield job.to_dict()
+                if job.status in FINISHED_STATES:
+                    return
+                while True:
+                    try:
+                        await asyncio.wait_for(event.wait(), heartbeat)
+                        break
+                    except asyncio.TimeoutError:
+                        yield None
+        finally:
+            watchers = self._watchers.get(job_id)
+            if watchers is not None:
+                watchers.discard(event)
+                if not watchers:
+                    del self._watchers[job_id]
+
+    async def _watch_remote(self, job_id: str, heartbeat: float) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """watch() for a job another worker runs, polling its snapshot in the shared store."""
+        last_update = None
+        quiet = 0.0
+        while True:
+            job = await self.fetch(job_id)
+            if job is None:
+                return
+            if job.updated_at != last_update:
+                last_update, quiet = job.updated_at, 0.0
+                yield job.to_dict()
+                if job.status in FINISHED_STATES:
+                    return
+            elif quiet >= heartbeat:
+                quiet = 0.0
+                yield None
+            await asyncio.sleep(JOB_WATCH_INTERVAL)
+            quiet += JOB_WATCH_INTERVAL
+
+    def spawn(self, job_id: str, coro: Awaitable[Any]) -> asyncio.Task:
+        """Run a coroutine for a job in the background, failing the job if it raises."""
+        async def runner():
+            try:
+                await coro
+            except asyncio.CancelledError:
+                self.fail(job_id, "Job cancelled")
+                raise
+            except Exception as e:
+                log(f"❌ Job {job_id} failed: {e}", level="error")
+                self.fail(job_id, str(e))
+            finally:
+                self._tasks.pop(job_id, None)
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    # Other workers can no longer cancel it
+                    self._publish(job)
+
+        task = asyncio.create_task(runner())
+        self._tasks[job_id] = task
+        job = self._jobs.get(job_id)
+        if job is not None:
+            self._publish(job)
+        if self.store is not None and (self._cancel_poller is None or self._cancel_poller.done()):
+            # Serves every job, so it doesn't keep the request context it was started from
+            self._cancel_poller = contextvars.Context().run(asyncio.create_task, self._poll_cancellations())
+        return task
+
+    def active_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status not in FINISHED_STATES)
+
+    def status_counts(self) -> Dict[Tuple[str, str], int]:
+        """Number of jobs per (kind, status)."""
+        counts: Dict[Tuple[str, str], int] = {}
+        for job in self._jobs.values():
+            counts[(job.kind, job.status)] = counts.get((job.kind, job.status), 0) + 1
+        return counts
+
+    def _prune(self) -> None:
+        """Drop the oldest finished jobs once the registry grows past its limit."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+class VeoOperationPoller:
+    """
+    Tracks many in-flight Veo operations from one background task.
+
+    Every poll interval, all pending operations are refreshed concurrently with
+    the async genai client, so the event loop never sleeps on behalf of a single
+    request. Finished operations are handed to on_done(job_id, operation) in a
+    task of their own, so a slow download never holds up the next poll round.
+    """
+
+    def __init__(
+        self,
+        client_getter: Callable[[], Any],
+        registry: JobRegistry,
+        on_done: Callable[[str, Any], Awaitable[None]],
+        poll_interval: float = VIDEO_POLL_INTERVAL,
+        timeout: float = VIDEO_JOB_TIMEOUT,
+    ):
+        self._client_getter = client_getter
+        self._registry = registry
+        self._on_done = on_done
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._finishing: Set[asyncio.Task] = set()
+
+    def track(self, job_id: str, operation: Any) -> None:
+        """Start tracking an operation; the poll loop is started lazily."""
+        self._pending[job_id] = {"operation": operation, "started": time.monotonic(), "errors": 0, "polls": 0}
+        self._registry.update(job_id, status=JOB_RUNNING)
+        self._registry.set_progress(job_id, stage="generating", veo_state="submitted", elapsed=0)
+        if self._task is None or self._task.done():
+            # The poll loop serves every job, so it doesn't keep the request context it was started from
+            self._task = contextvars.Context().run(asyncio.create_task, self._run())
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def _run(self) -> None:
+        while self._pending:
+            await asyncio.sleep(self.poll_interval)
+            job_ids = list(self._pending)
+            log(f"Polling {len(job_ids)} video operation(s)...")
+            await asyncio.gather(*(self._poll_one(job_id) for job_id in job_ids))
+
+    async def _poll_one(self, job_id: str) -> None:
+        entry = self._pending.get(job_id)
+        if entry is None:
+            return
+
+        if time.monotonic() - entry["started"] > self.timeout:
+            self._pending.pop(job_id, None)
+            self._registry.fail(job_id, f"Video generation timed out after {self.timeout:.0f}s")
+            return
+
+        try:
+            with upstream_call("veo_poll"):
+                operation = await self._client_getter().aio.operations.get(entry["operation"])
+        except Exception as e:
+            entry["errors"] += 1
+            log(f"Error polling video operation for job {job_id}: {e}", level="error")
+            if entry["errors"] >= VIDEO_POLL_MAX_ERRORS:
+                self._pending.pop(job_id, None)
+                self._registry.fail(job_id, f"Error polling video operation: {e}")
+            return
+
+        entry["operation"] = operation
+        entry["errors"] = 0
+        entry["polls"] += 1
+        self._registry.set_progress(
+            job_id,
+            veo_state="done" if operation.done else "running",
+            elapsed=round(time.monotonic() - entry["started"]),
+            polls=entry["polls"],
+        )
+        if not operation.done:
+            return
+
+        self._pending.pop(job_id, None)
+        self._registry.set_progress(job_id, stage="downloading")
+        task = asyncio.create_task(self._finish(job_id, operation))
+        # The loop only keeps weak references to tasks
+        self._finishing.add(task)
+        task.add_done_callback(self._finishing.discard)
+
+    async def _finish(self, job_id: str, operation: Any) -> None:
+        try:
+            await self._on_done(job_id, operation)
+        except Exception as e:
+            log(f"❌ Error finishing video job {job_id}: {e}", level="error")
+            self._registry.fail(job_id, str(e))
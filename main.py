@@ -4,23 +4,67 @@ from dotenv import load_dotenv
 load_dotenv('.env.local')
 
 from fastapi import FastAPI, Request, HTTPException, UploadFile, File, Form
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import Query
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from google import genai
-from google.genai import types
-from PIL import Image
-from io import BytesIO
 import os
 import uuid
 import base64
+import asyncio
+import hashlib
+import json
 import time
-from API_client import make_API_call
-from typing import List
+from contextlib import asynccontextmanager
+from API_client import close_clients, get_client_stats, make_API_call
+from jobs import FINISHED_STATES, JOB_RUNNING, JOB_SUCCEEDED, Job, JobRegistry, VeoOperationPoller
+from concurrency import QueueFullError, get_model_limiter, model_limiters
+from admission import (RateLimitedError, admission_queues, admission_stats, admit, check_admission, client_id_var,
+                       priority_var)
+from intent_classifier import IntentClassifier
+from generation_cache import GenerationCache, make_cache_key
+from video_editing import TRIM_MODES, export_sequence_file, precut_segment, trim_video_file
+from segment_cache import SegmentCache
+from retention import RetentionService
+from shared_store import shared_store
+from media_worker import MediaJobError, MediaWorkerPool
+from media_catalog import MEDIA_DIRS, MediaCatalog
+from renditions import POSTER, RenditionService
+from scrub_previews import SCRUB_KINDS, ScrubPreviewService
+from media_serving import serve_media
+from uploads import UPLOAD_MAX_BYTES, UploadError, save_upload
+from image_bytes import image_part, save_image_bytes, veo_image
+from observability import (ACCESS_LOG, HTTP_REQUEST_SECONDS, HTTP_RESPONSE_BYTES, SERVER_TIMING, RequestTimings,
+                           accept_request_id, log, metrics, observe_encode, request_id_var, timings_var,
+                           upstream_call)
+from typing import List, Optional, Tuple
+
+# Directories the app writes media to
+MEDIA_OUTPUT_DIRS = ("generated_images", "uploaded_images", "generated_videos")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for directory in MEDIA_OUTPUT_DIRS:
+        os.makedirs(directory, exist_ok=True)
+
+    # Backfill the media catalog and thumbnails from disk without delaying startup
+    async def backfill():
+        # With several workers, one of them does it for all
+        if shared_store is not None and not await shared_store.call(shared_store.acquire_lease, "startup_backfill", 600):
+            return
+        await asyncio.to_thread(media_catalog.sync)
+        await rendition_service.backfill(await asyncio.to_thread(media_catalog.assets))
+
+    sync_task = asyncio.create_task(backfill())
+    retention.start()
+    yield
+    sync_task.cancel()
+    await retention.stop()
+    await close_clients()
 
 # Initialize FastAPI app
-app = FastAPI(title="Image Generator", description="Generate images using Google Gemini API")
+app = FastAPI(title="Image Generator", description="Generate images using Google Gemini API", lifespan=lifespan)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -28,13 +72,53 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Initialize Jinja2 templates
 templates = Jinja2Templates(directory="templates")
 
-# Initialize Gemini client
-client = genai.Client()
+# Gemini client, created on first use: google.genai takes a quarter of the app's import time
+client = None
 
-# Create images directory if it doesn't exist
-os.makedirs("generated_images", exist_ok=True)
-os.makedirs("uploaded_images", exist_ok=True)
-os.makedirs("generated_videos", exist_ok=True)
+def get_genai_client():
+    global client
+    if client is None:
+        from google import genai
+        client = genai.Client()
+    return client
+
+# Registry of background jobs (video generation runs as a job)
+job_registry = JobRegistry(store=shared_store)
+
+# Content-addressed cache of generated images and videos
+generation_cache = GenerationCache(store=shared_store)
+
+# Rendered export segments, reused when a sequence is re-exported
+segment_cache = SegmentCache()
+
+# Worker processes for MoviePy/ffmpeg trims and exports
+media_pool = MediaWorkerPool()
+
+# Persistent index of every media file, backing /list-files
+media_catalog = MediaCatalog()
+
+# WebP thumbnails and video poster frames for the gallery
+rendition_service = RenditionService()
+
+# Low-resolution proxies and sprite sheets for scrubbing videos in the trimmer
+scrub_service = ScrubPreviewService(rendition_service.thumb_dir)
+
+# Byte budgets and LRU eviction for the media directories, plus temp file sweeping
+retention = RetentionService(media_catalog, lambda path: delete_asset(path), rendition_service.thumb_dir,
+                             store=shared_store)
+
+# Gemini model used for image generation and editing
+IMAGE_MODEL = "gemini-2.5-flash-image-preview"
+# Veo model used for image-to-video generation
+VIDEO_MODEL = "veo-3.0-fast-generate-001"
+
+# Batch generation limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "16"))
+BATCH_MAX_VARIANTS = int(os.getenv("BATCH_MAX_VARIANTS", "8"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# Storyboard pipeline limits
+STORYBOARD_MAX_SCENES = int(os.getenv("STORYBOARD_MAX_SCENES", "12"))
 
 class ImageRequest(BaseModel):
     prompt: str
@@ -51,12 +135,35 @@ class SceneItem(BaseModel):
 class ExportSequenceRequest(BaseModel):
     scenes: List[SceneItem]
 
+class StoryboardScene(BaseModel):
+    prompt: str  # image prompt for the scene
+    video_prompt: Optional[str] = None  # motion prompt for Veo; defaults to the image prompt
+    image_path: Optional[str] = None  # start from this image instead of generating one
+    start_time: float = 0
+    end_time: Optional[float] = None  # None keeps the clip to its end
+
+class StoryboardRequest(BaseModel):
+    scenes: List[StoryboardScene]
+    no_cache: bool = False
+
 class DeleteRequest(BaseModel):
     path: str
 
-async def determine_request_type(prompt: str) -> str:
+class PinRequest(BaseModel):
+    path: str
+    pinned: bool = True
+
+class BatchGenerateRequest(BaseModel):
+    prompts: List[str]
+    variants: int = 1  # images per prompt
+    mode: str = "auto"  # "auto", "new", or "edit"
+    current_image: Optional[str] = None  # Path to current image for editing
+    no_cache: bool = False
+
+async def classify_request_with_llm(prompt: str) -> Optional[str]:
     """
     Use AI to determine if the user wants to generate a new image or edit an existing one.
+    Returns None if the AI determination fails.
     """
     try:
         messages = [
@@ -75,38 +182,107 @@ async def determine_request_type(prompt: str) -> str:
         if response and response.choices:
             result = response.choices[0].message.content.strip().lower()
             if result in ['new', 'edit']:
-                print(f"Request type: {result}")
+                log(f"Request type: {result}")
                 return result
 
-        # Default to 'new' if AI determination fails
-        return 'new'
+        return None
 
     except Exception as e:
-        print(f"Error determining request type: {e}")
-        return 'new'
+        log(f"Error determining request type: {e}", level="error")
+        return None
+
+# Cache and local rules in front of the LLM intent call
+intent_classifier = IntentClassifier(classify_request_with_llm, store=shared_store)
+
+async def determine_request_type(prompt: str, has_current_image: bool = True) -> str:
+    """
+    Determine if the user wants to generate a new image or edit an existing one.
+    Defaults to 'new' if the determination fails.
+    """
+    return await intent_classifier.classify(prompt, has_current_image=has_current_image)
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Reject oversized uploads from Content-Length before the body is read
+    if request.url.path == "/upload-image":
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > UPLOAD_MAX_BYTES + 64 * 1024:
+            return JSONResponse({"detail": "Upload is too large"}, status_code=413)
+    return await call_next(request)
+
+@app.middleware("http")
+async def identify_client(request: Request, call_next):
+    # Rate limiting queues each client fairly. The key is the peer address (uvicorn has already
+    # applied X-Forwarded-For from trusted proxies); an unauthenticated header like X-Client-ID
+    # would let a caller claim a fresh round-robin slot and queue allowance on every request
+    client_id = request.client.host if request.client else "anonymous"
+    client_id_var.set(client_id)
+    return await call_next(request)
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    # Outermost middleware: request id, latency and bytes per route, and the Server-Timing breakdown
+    request_id = accept_request_id(request.headers.get("x-request-id"))
+    request_id_var.set(request_id)
+    timings = RequestTimings()
+    timings_var.set(timings)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        timings.closed = True
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        elapsed = time.perf_counter() - started
+        HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status="500")
+        log(f"❌ Unhandled error on {request.method} {request.url.path}", level="error", exc_info=True,
+            method=request.method, route=route, path=request.url.path, status=500,
+            elapsed_ms=round(elapsed * 1000, 1))
+        raise
+
+    elapsed = time.perf_counter() - started
+    timings.add("app", elapsed)
+    # Steps still running in a streamed body or background job can't be reported any more
+    timings.closed = True
+    # Label by route template, never the raw path, to keep the number of series bounded
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=str(response.status_code))
+    content_length = response.headers.get("content-length")
+    if content_length and content_length.isdigit() and request.method != "HEAD":
+        HTTP_RESPONSE_BYTES.inc(int(content_length), route=route)
+
+    if ACCESS_LOG:
+        status = response.status_code
+        log(f"[{request_id}] {request.method} {request.url.path} {status} {elapsed * 1000:.1f}ms",
+            level="error" if status >= 500 else "warning" if status >= 400 else "info",
+            method=request.method, route=route, path=request.url.path, status=status,
+            elapsed_ms=round(elapsed * 1000, 1))
+
+    response.headers["X-Request-ID"] = request_id
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = timings.header()
+    return response
+
 @app.post("/upload-image")
 async def upload_image(file: UploadFile = File(...)):
     try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
+        # Stream the upload to disk; the format is sniffed from its bytes
+        upload = await save_upload(file, "uploaded_images")
 
-        # Generate unique filename
-        filename = f"{uuid.uuid4()}.png"
-        filepath = os.path.join("uploaded_images", filename)
+        await record_asset(upload["path"], dimensions=(upload["width"], upload["height"]))
 
-        # Read and save the uploaded image
-        contents = await file.read()
-        with open(filepath, "wb") as f:
-            f.write(contents)
-
-        return {"image_path": f"/uploaded_images/{filename}"}
+        return {
+            "image_path": f"/uploaded_images/{upload['filename']}",
+            "width": upload["width"],
+            "height": upload["height"],
+            "downscaled": upload["downscaled"]
+        }
 
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading image: {str(e)}")
 
@@ -114,90 +290,211 @@ async def upload_image(file: UploadFile = File(...)):
 async def generate_image(
     prompt: str = Form(...),
     mode: str = Form("auto"),  # "auto", "new", or "edit"
-    current_image: str = Form(None)  # Path to current image for editing
+    current_image: str = Form(None),  # Path to current image for editing
+    no_cache: bool = Form(False)  # Skip the generation cache for a fresh sample
 ):
     try:
-        # Determine request type if auto mode
-        if mode == "auto":
-            request_type = await determine_request_type(prompt)
-        else:
-            request_type = mode
-
-        contents = [prompt]
-
-        # If editing and we have a current image, add it to contents
-        if request_type == "edit" and current_image:
-            # Remove the "/generated_images/" or "/uploaded_images/" prefix to get filename
-            image_filename = current_image.replace("/generated_images/", "").replace("/uploaded_images/", "")
+        image_path = find_source_image(current_image) if current_image else None
+        request_type = await resolve_request_type(prompt, mode, current_image, image_path)
+        if request_type != "edit":
             image_path = None
 
-            # Check both directories
-            for dir_name in ["generated_images", "uploaded_images"]:
-                potential_path = os.path.join(dir_name, image_filename)
-                if os.path.exists(potential_path):
-                    image_path = potential_path
-                    break
+        # Identical prompt, mode and source image share one cached result
+        source_bytes = await asyncio.to_thread(read_file_bytes, image_path) if image_path else None
+        result, cache_status = await generate_cached_image(prompt, request_type, image_path, source_bytes, no_cache)
 
-            if image_path:
-                # Load the existing image
-                existing_image = Image.open(image_path)
-                contents.append(existing_image)
-            else:
-                # If image not found, treat as new generation
-                request_type = "new"
+        # Return the image path and request type
+        return {
+            "image_path": result["image_path"],
+            "request_type": request_type,
+            "cache": cache_status
+        }
 
-        # Generate image using Gemini API
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image-preview",
-            contents=contents,
-        )
+    except RateLimitedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except HTTPException:
+        raise
+    except Exception as e:
+        log(f"❌ Error generating image: {str(e)}", level="error", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error generating image: {str(e)}")
 
-        # Process the response to find the image
-        for part in response.candidates[0].content.parts:
-            if part.inline_data is not None:
-                # Convert bytes to PIL Image
-                image = Image.open(BytesIO(part.inline_data.data))
+def find_source_image(current_image: str) -> Optional[str]:
+    """Map a "/generated_images/..." or "/uploaded_images/..." URL to the file on disk, if it exists."""
+    # Remove the "/generated_images/" or "/uploaded_images/" prefix to get filename
+    image_filename = current_image.replace("/generated_images/", "").replace("/uploaded_images/", "")
+
+    # Check both directories
+    for dir_name in ["generated_images", "uploaded_images"]:
+        potential_path = os.path.join(dir_name, image_filename)
+        if os.path.exists(potential_path):
+            # Being edited from counts as a use for retention
+            retention.touch(potential_path)
+            return potential_path
+    return None
+
+async def resolve_request_type(prompt: str, mode: str, current_image: Optional[str], image_path: Optional[str]) -> str:
+    """Decide between "new" and "edit"; an edit without a source image on disk becomes "new"."""
+    # Determine request type if auto mode
+    if mode == "auto":
+        request_type = await determine_request_type(prompt, has_current_image=bool(current_image))
+    else:
+        request_type = mode
+
+    if request_type == "edit" and not image_path:
+        # If image not found, treat as new generation
+        request_type = "new"
+    return request_type
+
+async def generate_cached_image(
+    prompt: str,
+    request_type: str,
+    image_path: Optional[str],
+    source_bytes: Optional[bytes],
+    no_cache: bool = False,
+    variant: int = 0
+):
+    """Generate through the generation cache; returns (result, cache status). Variants > 0 get their own cache entries."""
+    key_parts = ["image", IMAGE_MODEL, request_type, prompt, source_bytes]
+    if variant:
+        key_parts.append(f"variant-{variant}")
+    cache_key = make_cache_key(*key_parts)
 
-                # Generate unique filename
-                filename = f"{uuid.uuid4()}.png"
-                filepath = os.path.join("generated_images", filename)
+    async def generate():
+        return await generate_image_upstream(prompt, image_path, source_bytes)
 
-                # Save the image
-                image.save(filepath)
+    return await generation_cache.get_or_create(
+        cache_key, generate, lambda r: [r["image_path"].lstrip("/")], bypass=no_cache
+    )
 
-                # Return the image path and request type
-                return {
-                    "image_path": f"/generated_images/{filename}",
-                    "request_type": request_type
-                }
+@app.post("/generate-batch")
+async def generate_batch(payload: BatchGenerateRequest):
+    """
+    Generate several prompts and/or variants of a prompt, streaming results as NDJSON.
 
-        # If no image was found in the response
-        raise HTTPException(status_code=500, detail="No image generated in response")
+    The first line reports the batch size; then one line per image, in
+    completion order, as soon as it is ready; the last line summarizes the
+    batch. Intent detection and the source image read happen once per batch,
+    and at most BATCH_CONCURRENCY images are generated at a time.
+    """
+    prompts = [prompt.strip() for prompt in payload.prompts if prompt.strip()]
+    if not prompts:
+        raise HTTPException(status_code=400, detail="At least one prompt is required")
+    if not 1 <= payload.variants <= BATCH_MAX_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"Variants must be between 1 and {BATCH_MAX_VARIANTS}")
+    items = [(prompt, variant) for prompt in prompts for variant in range(payload.variants)]
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can have at most {BATCH_MAX_ITEMS} images")
 
+    try:
+        # Shared work, done once for the whole batch
+        image_path = find_source_image(payload.current_image) if payload.current_image else None
+        source_bytes = await asyncio.to_thread(read_file_bytes, image_path) if image_path else None
+        distinct_prompts = list(dict.fromkeys(prompts))
+        request_types = dict(zip(distinct_prompts, await asyncio.gather(*(
+            resolve_request_type(prompt, payload.mode, payload.current_image, image_path) for prompt in distinct_prompts
+        ))))
     except Exception as e:
-        print(f"❌ Error generating image: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Error generating image: {str(e)}")
+        log(f"❌ Error preparing batch: {str(e)}", level="error")
+        raise HTTPException(status_code=500, detail=f"Error preparing batch: {str(e)}")
 
-@app.get("/generated_images/{filename}")
-async def get_generated_image(filename: str):
-    filepath = os.path.join("generated_images", filename)
-    if os.path.exists(filepath):
-        return FileResponse(filepath, media_type="image/png")
-    else:
-        raise HTTPException(status_code=404, detail="Image not found")
-
-@app.get("/uploaded_images/{filename}")
-async def get_uploaded_image(filename: str):
-    filepath = os.path.join("uploaded_images", filename)
-    if os.path.exists(filepath):
-        return FileResponse(filepath, media_type="image/png")
-    else:
-        raise HTTPException(status_code=404, detail="Image not found")
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
 
-@app.post("/generate-video")
-async def generate_video(image_path: str = Form(...), prompt: str = Form(...)):
+    async def run_item(index: int, prompt: str, variant: int) -> dict:
+        # Batch items yield the upstream quotas to interactive requests
+        priority_var.set("batch")
+        request_type = request_types[prompt]
+        item = {"index": index, "prompt": prompt, "variant": variant, "request_type": request_type}
+        async with semaphore:
+            try:
+                is_edit = request_type == "edit"
+                result, cache_status = await generate_cached_image(
+                    prompt, request_type, image_path if is_edit else None, source_bytes if is_edit else None,
+                    payload.no_cache, variant
+                )
+                item.update(image_path=result["image_path"], cache=cache_status)
+            except RateLimitedError as e:
+                item.update(error=str(e), retry_after=e.retry_after)
+            except HTTPException as e:
+                item["error"] = e.detail
+            except Exception as e:
+                log(f"❌ Error generating batch image {index}: {str(e)}", level="error")
+                item["error"] = str(e)
+        return item
+
+    async def stream():
+        tasks = [asyncio.create_task(run_item(index, prompt, variant)) for index, (prompt, variant) in enumerate(items)]
+        succeeded = 0
+        try:
+            yield json.dumps({"total": len(items)}) + "\n"
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                succeeded += "error" not in item
+                yield json.dumps(item) + "\n"
+            yield json.dumps({"done": True, "succeeded": succeeded, "failed": len(items) - succeeded}) + "\n"
+        finally:
+            # Stop outstanding work if the client went away
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def generate_image_upstream(prompt: str, image_path: Optional[str] = None,
+                                  image_bytes: Optional[bytes] = None) -> dict:
+    """Call Gemini for a new image (or an edit of image_path, whose bytes are image_bytes) and save the result."""
+    contents = [prompt]
+
+    if image_path:
+        # Send the stored bytes as they are instead of decoding them into PIL
+        if image_bytes is None:
+            image_bytes = await asyncio.to_thread(read_file_bytes, image_path)
+        contents.append(await asyncio.to_thread(image_part, image_bytes))
+
+    # Generate image using Gemini API, within the model's rate limit and concurrency limit
+    await admit(IMAGE_MODEL)
+    async with get_model_limiter(IMAGE_MODEL).slot():
+        with upstream_call("gemini_image"):
+            response = await get_genai_client().aio.models.generate_content(
+                model=IMAGE_MODEL,
+                contents=contents,
+            )
+
+    # Process the response to find the image
+    for part in response.candidates[0].content.parts:
+        if part.inline_data is not None:
+            # Store Gemini's bytes untouched, with the extension of their real format
+            filename = await asyncio.to_thread(save_image_bytes, part.inline_data.data, "generated_images",
+                                               part.inline_data.mime_type)
+            await record_asset(os.path.join("generated_images", filename), prompt=prompt,
+                               parent_path=f"/{image_path}" if image_path else None)
+            return {"image_path": f"/generated_images/{filename}"}
+
+    # If no image was found in the response
+    raise HTTPException(status_code=500, detail="No image generated in response")
+
+def read_file_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+@app.api_route("/generated_images/{filename}", methods=["GET", "HEAD"])
+async def get_generated_image(request: Request, filename: str):
+    retention.touch(f"/generated_images/{filename}")
+    return await serve_media(request, "generated_images", filename)
+
+@app.api_route("/uploaded_images/{filename}", methods=["GET", "HEAD"])
+async def get_uploaded_image(request: Request, filename: str):
+    retention.touch(f"/uploaded_images/{filename}")
+    return await serve_media(request, "uploaded_images", filename)
+
+@app.post("/generate-video", status_code=202)
+async def generate_video(
+    image_path: str = Form(...),
+    prompt: str = Form(...),
+    no_cache: bool = Form(False)  # Skip the generation cache for a fresh sample
+):
+    """Queue a Veo video generation job and return its id immediately."""
     try:
         # Load the image from the provided path
         image_filename = image_path.replace("/generated_images/", "").replace("/uploaded_images/", "")
@@ -212,103 +509,405 @@ async def generate_video(image_path: str = Form(...), prompt: str = Form(...)):
 
         if not image_full_path:
             raise HTTPException(status_code=404, detail="Image not found")
+        retention.touch(image_full_path)
+
+        # Turn the request away now rather than fail the job later
+        check_admission(VIDEO_MODEL, priority="batch")
+        get_model_limiter(VIDEO_MODEL).check()
 
-        # Load and prepare the image using SDK field names (image_bytes + mime_type)
-        image = Image.open(image_full_path)
-        buffer = BytesIO()
-        image.save(buffer, format="PNG")
-        formatted_image = types.Image(
-            image_bytes=buffer.getvalue(),
-            mime_type="image/png",
-        )
-
-        # Generate video using Gemini Veo 3 (text+image to video)
-        operation = client.models.generate_videos(
-            model="veo-3.0-fast-generate-001",
-            prompt=prompt,
-            image=formatted_image,
-            config=types.GenerateVideosConfig(negative_prompt="cartoon, drawing, low quality"),
-        )
-
-        # Poll the operation status until the video is ready
-        while not operation.done:
-            print("Waiting for video generation to complete...")
-            time.sleep(10)
-            operation = client.operations.get(operation)
-
-        # Check if operation completed successfully
-        if not operation.response:
-            raise Exception(f"Video generation failed: No response from operation. Operation error: {operation.error if hasattr(operation, 'error') else 'Unknown error'}")
-
-        if not hasattr(operation.response, 'generated_videos') or not operation.response.generated_videos:
-            raise Exception(f"Video generation failed: No videos in response. Response: {operation.response}")
-
-        # Get the generated video
-        generated_video = operation.response.generated_videos[0]
-
-        # Generate unique filename for video
-        video_filename = f"{uuid.uuid4()}.mp4"
-        video_filepath = os.path.join("generated_videos", video_filename)
-
-        # Download and save the video
-        client.files.download(file=generated_video.video)
-        generated_video.video.save(video_filepath)
-
-        return {"video_path": f"/generated_videos/{video_filename}"}
+        source_bytes = await asyncio.to_thread(read_file_bytes, image_full_path)
+        job = await submit_video_job(image_full_path, source_bytes, prompt, no_cache)
+        await job_registry.flush()
+        return job.to_dict()
 
+    except RateLimitedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error generating video: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log(f"❌ Error generating video: {str(e)}", level="error", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error generating video: {str(e)}")
 
-@app.get("/generated_videos/{filename}")
-async def get_generated_video(filename: str):
-    filepath = os.path.join("generated_videos", filename)
-    if os.path.exists(filepath):
-        return FileResponse(filepath, media_type="video/mp4")
+async def submit_video_job(image_full_path: str, source_bytes: bytes, prompt: str, no_cache: bool = False):
+    """
+    Get a video job for an image and prompt: a finished one for a cached video,
+    the job already generating an identical video, or a newly started one.
+    """
+    cache_key = make_cache_key("video", VIDEO_MODEL, prompt, source_bytes)
+
+    if not no_cache:
+        # Identical image and prompt: reuse the stored video...
+        cached = await generation_cache.get(cache_key)
+        if cached is not None:
+            generation_cache.counters["hits"] += 1
+            job = job_registry.create("video")
+            job_registry.succeed(job.id, cache="hit", **cached)
+            return job
+
+        # ...or join the job that is already generating it
+        inflight = await job_registry.fetch(await generation_cache.get_inflight_job(cache_key) or "")
+        if inflight is not None and inflight.status not in FINISHED_STATES:
+            generation_cache.counters["coalesced"] += 1
+            return inflight
+
+        generation_cache.counters["misses"] += 1
     else:
-        raise HTTPException(status_code=404, detail="Video not found")
+        generation_cache.counters["bypassed"] += 1
+
+    job = job_registry.create("video")
+    job.meta.update(cache_key=cache_key, prompt=prompt, image_path=f"/{image_full_path}")
+    generation_cache.set_inflight_job(cache_key, job.id)
+    job_registry.spawn(job.id, start_video_job(job.id, prompt, source_bytes))
+    return job
+
+async def start_video_job(job_id: str, prompt: str, image_bytes: bytes):
+    """Submit the Veo operation and hand it to the background poller."""
+    # Pass the stored bytes straight through; only formats Veo can't take are converted
+    formatted_image = await asyncio.to_thread(veo_image, image_bytes)
+
+    def on_position(position: int):
+        job_registry.set_progress(job_id, stage="queued" if position else "submitting", queue_position=position)
+
+    # Video jobs are batch work: interactive image requests get the Veo quota first
+    job_registry.set_progress(job_id, stage="rate_limited")
+    await admit(VIDEO_MODEL, priority="batch")
+
+    from google.genai import types
+
+    # Generate video using Gemini Veo 3 (text+image to video)
+    async with get_model_limiter(VIDEO_MODEL).slot(on_position=on_position):
+        with upstream_call("veo_create"):
+            operation = await get_genai_client().aio.models.generate_videos(
+                model=VIDEO_MODEL,
+                prompt=prompt,
+                image=formatted_image,
+                config=types.GenerateVideosConfig(negative_prompt="cartoon, drawing, low quality"),
+            )
+    video_poller.track(job_id, operation)
+
+async def finish_video_job(job_id: str, operation):
+    """Download the finished Veo video and record its path on the job."""
+    # Check if operation completed successfully
+    if not operation.response:
+        raise Exception(f"Video generation failed: No response from operation. Operation error: {operation.error if hasattr(operation, 'error') else 'Unknown error'}")
+
+    if not hasattr(operation.response, 'generated_videos') or not operation.response.generated_videos:
+        raise Exception(f"Video generation failed: No videos in response. Response: {operation.response}")
+
+    # Get the generated video
+    generated_video = operation.response.generated_videos[0]
+
+    # Generate unique filename for video
+    video_filename = f"{uuid.uuid4()}.mp4"
+    video_filepath = os.path.join("generated_videos", video_filename)
+
+    # Download and save the video without blocking the event loop
+    with upstream_call("veo_download"):
+        await get_genai_client().aio.files.download(file=generated_video.video)
+    await asyncio.to_thread(generated_video.video.save, video_filepath)
+
+    result = {"video_path": f"/generated_videos/{video_filename}"}
+    job = job_registry.get(job_id)
+    if job is not None:
+        await record_asset(video_filepath, prompt=job.meta.get("prompt"), parent_path=job.meta.get("image_path"))
+    cache_key = job.meta.get("cache_key") if job else None
+    if cache_key:
+        generation_cache.put(cache_key, result, [video_filepath])
+        generation_cache.pop_inflight_job(cache_key, job_id)
+
+    job_registry.succeed(job_id, **result)
+
+video_poller = VeoOperationPoller(get_genai_client, job_registry, finish_video_job)
+
+def release_inflight_video(job: Job) -> None:
+    # A failed, timed-out or cancelled video job must not be joined by later identical requests
+    cache_key = job.meta.get("cache_key")
+    if cache_key:
+        generation_cache.pop_inflight_job(cache_key, job.id)
+
+job_registry.on_failure(release_inflight_video)
+
+@app.get("/intent-stats")
+async def intent_stats():
+    """Counters showing how many intent decisions skipped the LLM call."""
+    return intent_classifier.stats()
+
+@app.get("/upstream-stats")
+async def upstream_stats():
+    """Per-provider retry, hedge, failover and breaker state, and rate limit queues per quota."""
+    return {"providers": get_client_stats(), "admission": admission_stats()}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics in the text exposition format."""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def collect_app_metrics():
+    """Queue depths, cache counters and provider health, read from the components at scrape time."""
+    limiters = list(model_limiters.values()) + [media_pool.limiter]
+    yield ("upstream_in_flight", "gauge", "Calls holding a concurrency slot",
+           [({"limiter": l.name}, l.in_flight) for l in limiters])
+    yield ("upstream_waiting", "gauge", "Calls waiting for a concurrency slot",
+           [({"limiter": l.name}, l.waiting) for l in limiters])
+
+    queues = list(admission_queues.values())
+    yield ("admission_waiting", "gauge", "Calls waiting for a rate limit token",
+           [({"quota": q.name, "priority": p}, n) for q in queues for p, n in q.stats()["waiting"].items()])
+    yield ("admission_tokens", "gauge", "Tokens left in each rate limit bucket",
+           [({"quota": q.name}, q.stats()["tokens"]) for q in queues])
+    yield ("admission_decisions_total", "counter", "Rate limit admissions, queued calls and rejections",
+           [({"quota": q.name, "decision": k}, v) for q in queues for k, v in q.counters.items()])
+
+    yield ("jobs", "gauge", "Jobs in the registry by kind and status",
+           [({"kind": kind, "status": status}, n) for (kind, status), n in job_registry.status_counts().items()])
+    yield ("veo_operations_pending", "gauge", "Veo operations being polled", [({}, video_poller.pending_count())])
+
+    caches = {
+        "generation": generation_cache.stats(),
+        "segments": segment_cache.stats(),
+        "renditions": rendition_service.stats(),
+        "scrub_previews": scrub_service.stats(),
+    }
+    intent = intent_classifier.stats()
+    caches["intent"] = {"hits": intent["cache_hits"], "misses": intent["cache_misses"]}
+    yield ("cache_events_total", "counter", "Cache lookups by outcome",
+           [({"cache": name, "event": event}, stats[event]) for name, stats in caches.items()
+            for event in ("hits", "misses", "coalesced", "evictions", "rendered") if event in stats])
+    yield ("cache_hit_ratio", "gauge", "Hits over hits plus misses since startup",
+           [({"cache": name}, stats["hits"] / (stats["hits"] + stats["misses"])) for name, stats in caches.items()
+            if stats.get("hits", 0) + stats.get("misses", 0)])
+
+    providers = get_client_stats()
+    yield ("upstream_circuit_open", "gauge", "1 while a provider's circuit breaker is open",
+           [({"provider": name}, int(p["circuit"] == "open")) for name, p in providers.items()])
+    yield ("upstream_events_total", "counter", "LLM provider calls, retries, hedges and failovers",
+           [({"provider": name, "event": k}, v) for name, p in providers.items()
+            for k, v in p.items() if isinstance(v, int) and not k.startswith("circuit")])
+
+    usage = retention.stats()
+    yield ("media_directory_bytes", "gauge", "Bytes of catalogued media per directory",
+           [({"directory": name}, d["bytes"]) for name, d in usage["directories"].items()])
+    yield ("media_directory_budget_bytes", "gauge", "Retention byte budget per directory (0 is unlimited)",
+           [({"directory": name}, d["budget"]) for name, d in usage["directories"].items()])
+    yield ("retention_events_total", "counter", "Assets evicted and temp files swept by retention",
+           [({"event": event}, usage[event]) for event in ("evicted", "evicted_bytes", "temp_swept",
+                                                           "temp_swept_bytes", "orphan_renditions")])
+
+metrics.add_collector(collect_app_metrics)
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """Hit, miss and coalescing counters for the generation and segment caches."""
+    return {
+        "generation": generation_cache.stats(),
+        "segments": segment_cache.stats(),
+        "renditions": rendition_service.stats(),
+        "scrub_previews": scrub_service.stats(),
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the status of a background job and, once finished, its result."""
+    job = await job_registry.fetch(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-sent events for a job: a "progress" event with the full job state
+    on every change (queue position, Veo state, encode percentage), then a
+    final "done" event once it has succeeded or failed.
+    """
+    if await job_registry.fetch(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        # Ask EventSource to wait a few seconds before reconnecting
+        yield "retry: 3000\n\n"
+        async for snapshot in job_registry.watch(job_id):
+            if snapshot is None:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            event = "done" if snapshot["status"] in FINISHED_STATES else "progress"
+            yield f"event: {event}\ndata: {json.dumps(snapshot)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a running job; trims and exports kill their worker process."""
+    job = await job_registry.fetch(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status in FINISHED_STATES:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    if not await job_registry.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job can't be cancelled at this stage")
+    return {"cancelled": True}
+
+@app.api_route("/generated_videos/{filename}", methods=["GET", "HEAD"])
+async def get_generated_video(request: Request, filename: str):
+    retention.touch(f"/generated_videos/{filename}")
+    return await serve_media(request, "generated_videos", filename)
 
 @app.get("/list-files")
-async def list_files():
-    """List all generated images and videos."""
+async def list_files(
+    request: Request,
+    media_type: Optional[str] = Query(None, alias="type"),  # "image" or "video"
+    sort: str = "created_at",  # "created_at", "size" or "filename"
+    order: str = "desc",
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_uploads: bool = False
+):
+    """List generated images and videos from the media catalog, one page at a time."""
     try:
-        images = []
-        videos = []
-
-        # Get all image files
-        if os.path.exists("generated_images"):
-            for filename in os.listdir("generated_images"):
-                if filename.endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-                    images.append({
-                        "filename": filename,
-                        "path": f"/generated_images/{filename}",
-                        "type": "image"
-                    })
-
-        # Get all video files
-        if os.path.exists("generated_videos"):
-            for filename in os.listdir("generated_videos"):
-                if filename.endswith('.mp4'):
-                    videos.append({
-                        "filename": filename,
-                        "path": f"/generated_videos/{filename}",
-                        "type": "video"
-                    })
-
-        return {
-            "images": images,
-            "videos": videos
-        }
+        if media_type not in (None, "image", "video"):
+            raise HTTPException(status_code=400, detail="Type must be 'image' or 'video'")
+
+        # The catalog version changes on every write, so unchanged galleries revalidate for free
+        query_hash = hashlib.sha256(str(request.url.query).encode("utf-8")).hexdigest()[:16]
+        etag = f'"{await asyncio.to_thread(media_catalog.version)}-{query_hash}"'
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+        directories = ["generated_images", "generated_videos"]
+        if include_uploads:
+            directories.append("uploaded_images")
+
+        items, next_cursor = await asyncio.to_thread(media_catalog.list, directories, media_type=media_type,
+                                                     sort=sort, order=order, limit=limit, cursor=cursor)
+
+        return JSONResponse({
+            "items": items,
+            "images": [item for item in items if item["type"] == "image"],
+            "videos": [item for item in items if item["type"] == "video"],
+            "next_cursor": next_cursor
+        }, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing files: {str(e)}")
 
-@app.post("/trim-video")
-async def trim_video(video_path: str = Form(...), start_time: float = Form(...), end_time: float = Form(...)):
-    """Trim a video file based on start and end times."""
+async def record_asset(fs_path: str, prompt: Optional[str] = None, parent_path: Optional[str] = None,
+                       dimensions: Optional[Tuple[int, int]] = None):
+    """Add a new file to the media catalog and start its thumbnails; a failure here never fails the request."""
     try:
+        asset = await asyncio.to_thread(media_catalog.add, fs_path, prompt, parent_path, dimensions)
+        rendition_service.schedule(asset["directory"], asset["filename"], asset["type"])
+        if asset["type"] == "video":
+            scrub_service.schedule(asset["directory"], asset["filename"])
+    except Exception as e:
+        log(f"Error recording {fs_path} in media catalog: {e}", level="error")
+
+@app.api_route("/thumbs/{size}/{directory}/{filename}", methods=["GET", "HEAD"])
+async def get_thumbnail(request: Request, size: str, directory: str, filename: str):
+    """
+    Serve a WebP rendition of a media file, rendering it on first request.
+
+    size is one of the THUMB_WIDTHS (e.g. 128, 256, 512), or "poster" for a
+    video's full poster frame. Video thumbnails are cut from the poster frame.
+    """
+    media_type = MEDIA_DIRS.get(directory)
+    if media_type is None or filename != os.path.basename(filename):
+        raise HTTPException(status_code=404, detail="File not found")
+    if size not in [str(w) for w in rendition_service.widths] + ([POSTER] if media_type == "video" else []):
+        raise HTTPException(status_code=404, detail="Unknown thumbnail size")
+    if not os.path.isfile(os.path.join(directory, filename)):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    try:
+        path = await rendition_service.get(directory, filename, size, media_type)
+    except Exception as e:
+        log(f"Error rendering thumbnail for {directory}/{filename}: {e}", level="error")
+        raise HTTPException(status_code=500, detail=f"Error rendering thumbnail: {str(e)}")
+
+    return await serve_media(request, os.path.dirname(path), os.path.basename(path))
+
+@app.api_route("/scrub/{kind}/{directory}/{filename}", methods=["GET", "HEAD"])
+async def get_scrub_preview(request: Request, kind: str, directory: str, filename: str):
+    """
+    Serve a video's scrub proxy, sprite sheet or sprite index, rendering them on first request.
+
+    kind is "proxy" (small short-GOP MP4), "sprite" (WebP grid of evenly
+    spaced frames) or "index" (JSON with the grid layout and frame times).
+    """
+    if MEDIA_DIRS.get(directory) != "video" or filename != os.path.basename(filename):
+        raise HTTPException(status_code=404, detail="File not found")
+    if kind not in SCRUB_KINDS:
+        raise HTTPException(status_code=404, detail="Unknown preview kind")
+    if not os.path.isfile(os.path.join(directory, filename)):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    try:
+        path = await scrub_service.get(directory, filename, kind)
+    except Exception as e:
+        log(f"Error rendering scrub previews for {directory}/{filename}: {e}", level="error")
+        raise HTTPException(status_code=500, detail=f"Error rendering scrub previews: {str(e)}")
+
+    return await serve_media(request, os.path.dirname(path), os.path.basename(path))
+
+async def run_media_job(job_id: str, out_path: str, func, *args,
+                        percent_range: Tuple[float, float] = (0, 100), **kwargs):
+    """
+    Run a media function in the worker pool, reporting its queue position and
+    encode progress on the job. A partially written out_path is removed
+    whenever the job doesn't succeed.
+
+    Args:
+        percent_range: Job percentages the encode's 0-100% maps onto, for jobs with earlier stages
+
+    Returns:
+        The function's result and the seconds it ran for, not counting time queued
+    """
+    started = {"at": time.perf_counter()}
+    low, high = percent_range
+
+    def on_progress(update: dict):
+        position = update.get("queue_position")
+        if position == 0:
+            started["at"] = time.perf_counter()
+            job_registry.update(job_id, status=JOB_RUNNING)
+            job_registry.set_progress(job_id, stage="starting", queue_position=0, percent=low)
+        elif position is not None:
+            job_registry.set_progress(job_id, stage="queued", queue_position=position)
+        else:
+            if "percent" in update:
+                update = {**update, "percent": round(low + (high - low) * update["percent"] / 100, 1)}
+            job_registry.set_progress(job_id, **update)
+
+    try:
+        result = await media_pool.run(func, *args, on_progress=on_progress, **kwargs)
+        return result, time.perf_counter() - started["at"]
+    except BaseException:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        raise
+
+@app.post("/trim-video", status_code=202)
+async def trim_video(
+    video_path: str = Form(...),
+    start_time: float = Form(...),
+    end_time: float = Form(...),
+    mode: str = Form("fast")  # "fast" (smart cut) or "precise" (full re-encode)
+):
+    """Queue a trim job; follow it at /jobs/{job_id}/events or poll /jobs/{job_id}."""
+    try:
+        if mode not in TRIM_MODES:
+            raise HTTPException(status_code=400, detail="Mode must be 'fast' or 'precise'")
+        if start_time < 0 or end_time <= start_time:
+            raise HTTPException(status_code=400, detail="End time must be after start time")
+
         # Extract filename from path
         video_filename = video_path.replace("/generated_videos/", "").replace("/uploaded_images/", "")
         video_full_path = None
@@ -322,52 +921,42 @@ async def trim_video(video_path: str = Form(...), start_time: float = Form(...),
 
         if not video_full_path:
             raise HTTPException(status_code=404, detail="Video file not found")
+        retention.touch(video_full_path)
 
-        # Import moviepy here to avoid import errors if not installed
-        try:
-            from moviepy.editor import VideoFileClip
-        except ImportError:
-            raise HTTPException(status_code=500, detail="Video trimming requires moviepy. Please install with: pip install moviepy")
-
-        # Load and trim the video
-        video_clip = VideoFileClip(video_full_path)
-        trimmed_clip = video_clip.subclip(start_time, end_time)
-
-        # Generate unique filename for trimmed video
-        trimmed_filename = f"trimmed_{uuid.uuid4()}.mp4"
-        trimmed_filepath = os.path.join("generated_videos", trimmed_filename)
-
-        # Export the trimmed video
-        trimmed_clip.write_videofile(
-            trimmed_filepath,
-            codec="libx264",
-            audio_codec="aac",
-            temp_audiofile=f"temp_audio_{uuid.uuid4()}.m4a",
-            remove_temp=True,
-            verbose=False,
-            logger=None
-        )
-
-        # Close the clips to free resources
-        video_clip.close()
-        trimmed_clip.close()
-
-        return {"video_path": f"/generated_videos/{trimmed_filename}"}
+        # Turn the request away now if the media queue is full
+        media_pool.limiter.check()
+
+        job = job_registry.create("trim")
+        job_registry.spawn(job.id, trim_video_job(job.id, video_full_path, start_time, end_time, mode))
+        await job_registry.flush()
+        return job.to_dict()
 
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
-        print(f"Error trimming video: {str(e)}")
+        log(f"Error trimming video: {str(e)}", level="error")
         raise HTTPException(status_code=500, detail=f"Error trimming video: {str(e)}")
 
-@app.post("/export-sequence")
+async def trim_video_job(job_id: str, video_full_path: str, start_time: float, end_time: float, mode: str):
+    # Generate unique filename for trimmed video
+    trimmed_filename = f"trimmed_{uuid.uuid4()}.mp4"
+    trimmed_filepath = os.path.join("generated_videos", trimmed_filename)
+
+    # Smart cut by default, MoviePy re-encode for precise mode or as fallback
+    mode_used, encode_seconds = await run_media_job(job_id, trimmed_filepath, trim_video_file,
+                                                    video_full_path, start_time, end_time, trimmed_filepath, mode)
+    observe_encode(f"trim_{mode_used}", encode_seconds, end_time - start_time)
+
+    await record_asset(trimmed_filepath, parent_path=f"/{video_full_path}")
+    job_registry.succeed(job_id, video_path=f"/generated_videos/{trimmed_filename}", mode=mode_used)
+
+@app.post("/export-sequence", status_code=202)
 async def export_sequence(payload: ExportSequenceRequest):
-    """Concatenate multiple trimmed video segments into one video."""
+    """Queue a job joining trimmed scenes into one video; follow it at /jobs/{job_id}/events."""
     try:
-        try:
-            from moviepy.editor import VideoFileClip, concatenate_videoclips
-        except ImportError:
-            raise HTTPException(status_code=500, detail="MoviePy not installed. Please install moviepy and imageio-ffmpeg.")
-
-        clips = []
+        scenes = []
         for item in payload.scenes:
             # locate file
             filename = item.path.replace("/generated_videos/", "").replace("/uploaded_images/", "")
@@ -379,48 +968,192 @@ async def export_sequence(payload: ExportSequenceRequest):
                     break
             if not full_path:
                 raise HTTPException(status_code=404, detail=f"File not found: {item.path}")
+            retention.touch(full_path)
 
-            clip = VideoFileClip(full_path)
-            start = max(0, min(item.start_time, clip.duration))
-            end = max(start, min(item.end_time, clip.duration))
-            clips.append(clip.subclip(start, end))
+            scenes.append((full_path, item.start_time, item.end_time))
 
-        if not clips:
+        if not scenes:
             raise HTTPException(status_code=400, detail="No valid scenes to export")
 
-        # Concatenate
-        final = concatenate_videoclips(clips, method="compose")
+        # Turn the request away now if the media queue is full
+        media_pool.limiter.check()
 
-        # Save
-        out_name = f"sequence_{uuid.uuid4()}.mp4"
-        out_path = os.path.join("generated_videos", out_name)
+        job = job_registry.create("export")
+        job_registry.spawn(job.id, export_sequence_job(job.id, scenes))
+        await job_registry.flush()
+        return job.to_dict()
 
-        final.write_videofile(
-            out_path,
-            codec="libx264",
-            audio_codec="aac",
-            temp_audiofile=f"temp_audio_{uuid.uuid4()}.m4a",
-            remove_temp=True,
-            verbose=False,
-            logger=None
-        )
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        log(f"Error exporting sequence: {str(e)}", level="error")
+        raise HTTPException(status_code=500, detail=f"Error exporting sequence: {str(e)}")
 
-        # Close all clips
-        try:
-            final.close()
-        except Exception:
-            pass
-        for c in clips:
-            try:
-                c.close()
-            except Exception:
-                pass
+async def export_sequence_job(job_id: str, scenes: List[Tuple[str, float, float]]):
+    # Save
+    out_name = f"sequence_{uuid.uuid4()}.mp4"
+    out_path = os.path.join("generated_videos", out_name)
+
+    # Stream-copy concat when the segments match, parallel render otherwise
+    report, encode_seconds = await run_media_job(job_id, out_path, export_sequence_file,
+                                                 scenes, out_path, cache=segment_cache)
+    observe_encode(f"export_{report['path']}", encode_seconds, report.get("duration"))
+    segment_cache.record_export(report)
+    await record_asset(out_path)
+    job_registry.succeed(job_id, video_path=f"/generated_videos/{out_name}", **report)
+
+@app.post("/storyboard", status_code=202)
+async def storyboard(payload: StoryboardRequest):
+    """
+    Queue a storyboard job that turns a prompt per scene into one exported video.
 
-        return {"video_path": f"/generated_videos/{out_name}"}
+    Every scene gets an image (or uses image_path), a Veo video and a trim to
+    its range, then the scenes are joined in order. Follow it at
+    /jobs/{job_id}/events; the progress lists the stage of every scene.
+    """
+    if not payload.scenes:
+        raise HTTPException(status_code=400, detail="At least one scene is required")
+    if len(payload.scenes) > STORYBOARD_MAX_SCENES:
+        raise HTTPException(status_code=400, detail=f"A storyboard can have at most {STORYBOARD_MAX_SCENES} scenes")
+    for number, scene in enumerate(payload.scenes, 1):
+        if not scene.prompt.strip():
+            raise HTTPException(status_code=400, detail=f"Scene {number} needs a prompt")
+        if scene.start_time < 0 or (scene.end_time is not None and scene.end_time <= scene.start_time):
+            raise HTTPException(status_code=400, detail=f"Scene {number}: end time must be after start time")
+        if scene.image_path and not find_source_image(scene.image_path):
+            raise HTTPException(status_code=404, detail=f"Scene {number}: image not found")
 
-    except Exception as e:
-        print(f"Error exporting sequence: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error exporting sequence: {str(e)}")
+    try:
+        # Turn the request away now rather than fail the job later
+        check_admission(VIDEO_MODEL, priority="batch")
+        get_model_limiter(VIDEO_MODEL).check()
+    except RateLimitedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    job = job_registry.create("storyboard")
+    job_registry.spawn(job.id, storyboard_job(job.id, payload.scenes, payload.no_cache))
+    await job_registry.flush()
+    return job.to_dict()
+
+async def wait_for_job(job_id: str) -> dict:
+    """Wait for another job to finish and return its final state; raises if it didn't succeed."""
+    final = None
+    async for snapshot in job_registry.watch(job_id):
+        if snapshot is not None:
+            final = snapshot
+    if final is None or final["status"] != JOB_SUCCEEDED:
+        raise Exception((final or {}).get("error") or "Job disappeared")
+    return final
+
+async def storyboard_job(job_id: str, scenes: List[StoryboardScene], no_cache: bool):
+    """
+    Run a storyboard as a DAG: each scene is its own image -> video -> cut
+    chain, all chains run at once, and the join waits for the last one.
+
+    The model limiters and quotas pace the chains, so images for later scenes
+    are generated while Veo renders earlier ones, and each clip is cut into
+    the segment cache as soon as it arrives. The final export then only joins
+    the parts, and wall time tracks the slowest scene rather than the sum.
+
+    Video jobs are ordinary jobs that outlive a failed or cancelled storyboard;
+    their videos land in the generation cache, so resubmitting reuses them.
+    """
+    # Storyboards are batch work: interactive requests get the quotas first
+    priority_var.set("batch")
+    job_registry.update(job_id, status=JOB_RUNNING)
+    started = time.perf_counter()
+    states = [{"index": index, "stage": "queued"} for index in range(len(scenes))]
+
+    def publish():
+        ready = sum(state["stage"] == "ready" for state in states)
+        job_registry.set_progress(job_id, stage="scenes", scenes=[dict(state) for state in states],
+                                  scenes_ready=ready, percent=round(90 * ready / len(states), 1))
+
+    def report(index: int, **fields):
+        states[index].update(fields)
+        publish()
+
+    async def run_scene(index: int, scene: StoryboardScene) -> Tuple[str, float, float]:
+        timings = {}
+        try:
+            stage_started = time.perf_counter()
+            if scene.image_path:
+                image_full_path = find_source_image(scene.image_path)
+                if not image_full_path:
+                    raise Exception("Image not found")
+            else:
+                report(index, stage="image")
+                result, _ = await generate_cached_image(scene.prompt.strip(), "new", None, None, no_cache)
+                image_full_path = result["image_path"].lstrip("/")
+            timings["image"] = round(time.perf_counter() - stage_started, 3)
+
+            stage_started = time.perf_counter()
+            source_bytes = await asyncio.to_thread(read_file_bytes, image_full_path)
+            video_job = await submit_video_job(image_full_path, source_bytes,
+                                               (scene.video_prompt or scene.prompt).strip(), no_cache)
+            report(index, stage="video", image_path=f"/{image_full_path}", video_job_id=video_job.id)
+            video = await wait_for_job(video_job.id)
+            video_full_path = video["video_path"].lstrip("/")
+            timings["video"] = round(time.perf_counter() - stage_started, 3)
+
+            # Cut now, while other scenes are still rendering; the export finds the segment cached
+            stage_started = time.perf_counter()
+            end_time = scene.end_time if scene.end_time is not None else float("inf")
+            report(index, stage="cutting", video_path=video["video_path"])
+            try:
+                cut = await media_pool.run(precut_segment, video_full_path, scene.start_time, end_time, segment_cache)
+                if cut["segment"] is not None:
+                    segment_cache.record_export({"cached_segments": int(cut["cached"]),
+                                                 "rendered_segments": int(not cut["cached"])})
+            except (QueueFullError, MediaJobError) as e:
+                # Not fatal: the export cuts whatever wasn't cut ahead
+                log(f"⚠️ Storyboard scene {index + 1} not cut ahead: {e}", level="warning", job_id=job_id)
+            timings["cut"] = round(time.perf_counter() - stage_started, 3)
+
+            report(index, stage="ready", timings=timings)
+            return video_full_path, scene.start_time, end_time
+        except Exception as e:
+            report(index, stage="failed", error=str(e))
+            raise Exception(f"Scene {index + 1} failed: {e}")
+
+    publish()
+    tasks = [asyncio.create_task(run_scene(index, scene)) for index, scene in enumerate(scenes)]
+    try:
+        parts = await asyncio.gather(*tasks)
+    finally:
+        # One failed scene (or a cancelled job) stops the other chains
+        for task in tasks:
+            task.cancel()
+    scenes_done = time.perf_counter()
+
+    out_name = f"storyboard_{uuid.uuid4()}.mp4"
+    out_path = os.path.join("generated_videos", out_name)
+    job_registry.set_progress(job_id, stage="joining", percent=90)
+    export_report, encode_seconds = await run_media_job(job_id, out_path, export_sequence_file, list(parts), out_path,
+                                                        cache=segment_cache, percent_range=(90, 100))
+    observe_encode(f"export_{export_report['path']}", encode_seconds, export_report.get("duration"))
+    segment_cache.record_export(export_report)
+    await record_asset(out_path, prompt=" | ".join(scene.prompt.strip() for scene in scenes))
+
+    scene_seconds = [sum(state["timings"].values()) for state in states]
+    job_registry.succeed(
+        job_id,
+        video_path=f"/generated_videos/{out_name}",
+        scenes=[{key: state.get(key) for key in ("index", "image_path", "video_path")} for state in states],
+        export=export_report,
+        timings={
+            "total": round(time.perf_counter() - started, 3),
+            "scenes": round(scenes_done - started, 3),
+            "join": round(time.perf_counter() - scenes_done, 3),
+            "slowest_scene": round(max(scene_seconds), 3),
+            # What running the scenes one after another would have taken
+            "scenes_sequential": round(sum(scene_seconds), 3),
+        },
+    )
 
 @app.post("/delete-file")
 async def delete_file_endpoint(payload: DeleteRequest):
@@ -469,15 +1202,57 @@ async def delete_file_endpoint(payload: DeleteRequest):
         if not os.path.exists(filepath):
             raise HTTPException(status_code=404, detail="File not found")
 
-        os.remove(filepath)
+        await delete_asset(f"/{target_dir}/{filename}")
         return {"deleted": True}
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting file: {str(e)}")
+        log(f"Error deleting file: {str(e)}", level="error")
         raise HTTPException(status_code=500, detail=f"Error deleting file: {str(e)}")
 
+async def delete_asset(path: str) -> bool:
+    """
+    Delete a media file by URL path along with everything that indexes it: its
+    catalog row, thumbnails, scrub previews and generation cache entries. Shared by
+    /delete-file and retention, so neither leaves dangling references.
+
+    Returns:
+        Whether the file was still on disk
+    """
+    directory, filename = path.strip("/").split("/", 1)
+    fs_path = os.path.join(directory, filename)
+    try:
+        await asyncio.to_thread(os.remove, fs_path)
+        existed = True
+    except FileNotFoundError:
+        existed = False
+    await asyncio.to_thread(media_catalog.remove, f"/{directory}/{filename}")
+    rendition_service.remove(directory, filename)
+    scrub_service.remove(directory, filename)
+    generation_cache.forget_files([fs_path])
+    return existed
+
+@app.post("/pin")
+async def pin_asset(payload: PinRequest):
+    """Pin an asset so retention never evicts it, or unpin it."""
+    path = payload.path.strip()
+    if not await asyncio.to_thread(media_catalog.set_pinned, path, payload.pinned):
+        raise HTTPException(status_code=404, detail="File not found")
+    return {"path": path, "pinned": payload.pinned}
+
+@app.get("/retention-stats")
+async def retention_stats():
+    """Usage and budget per media directory, eviction and sweep counters, and the last run."""
+    return await asyncio.to_thread(retention.stats)
+
+@app.post("/retention/run")
+async def run_retention():
+    """Run eviction and the temp sweep now instead of waiting for the next interval."""
+    return await retention.run_once()
+
 if __name__ == "__main__":
+    # Development server; run `python server.py` for the multi-worker production mode.
+    # The app writes its own access lines, so uvicorn's are off
     import uvicorn
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True, access_log=False)
@@ -0,0 +1,325 @@
+"""
+Persistent SQLite catalog of generated and uploaded media.
+
+Every asset the server writes (generated, uploaded, trimmed, exported) is
+recorded with its size, dimensions, duration, creation time, source prompt and
+parent asset, and removed again when deleted. Retention adds each asset's last
+access time and whether the user pinned it. /list-files reads from here
+instead of listing directories, with keyset (cursor) pagination, sorting,
+type filters and a catalog version for ETags.
+
+Usage:
+    media_catalog.add("generated_images/x.png", prompt="a cat")
+    items, next_cursor = media_catalog.list(media_type="image", limit=50)
+    media_catalog.set_pinned("/generated_images/x.png", True)
+    media_catalog.remove("/generated_images/x.png")
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from observability import log
+
+MEDIA_CATALOG_PATH = os.getenv("MEDIA_CATALOG_PATH", "media_catalog.db")
+
+# Directories the catalog tracks, and the media type of each
+MEDIA_DIRS = {
+    "generated_images": "image",
+    "uploaded_images": "image",
+    "generated_videos": "video",
+}
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+VIDEO_EXTS = (".mp4",)
+
+SORT_COLUMNS = {"created_at", "size", "filename"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    path TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    duration REAL,
+    created_at REAL NOT NULL,
+    prompt TEXT,
+    parent_path TEXT,
+    accessed_at REAL,
+    pinned INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS assets_created ON assets (directory, created_at, path);
+CREATE INDEX IF NOT EXISTS assets_size ON assets (directory, size, path);
+CREATE INDEX IF NOT EXISTS assets_filename ON assets (directory, filename, path);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+
+# Columns added after the first release, created on catalogs that predate them
+MIGRATIONS = {
+    "accessed_at": "ALTER TABLE assets ADD COLUMN accessed_at REAL",
+    "pinned": "ALTER TABLE assets ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0",
+}
+
+# Retention walks each directory's unpinned assets from least recently used
+LRU_INDEX = "CREATE INDEX IF NOT EXISTS assets_lru ON assets (directory, pinned, COALESCE(accessed_at, created_at))"
+
+def url_path(directory: str, filename: str) -> str:
+    return f"/{directory}/{filename}"
+
+def media_type_for(filename: str) -> Optional[str]:
+    lower = filename.lower()
+    if lower.endswith(IMAGE_EXTS):
+        return "image"
+    if lower.endswith(VIDEO_EXTS):
+        return "video"
+    return None
+
+def describe_file(fs_path: str, dimensions: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+    """Read size, dimensions and duration of a media file on disk (dimensions can be passed in if already known)."""
+    stat = os.stat(fs_path)
+    info: Dict[str, Any] = {"size": stat.st_size, "width": None, "height": None, "duration": None,
+                            "created_at": stat.st_mtime}
+    media_type = media_type_for(fs_path)
+    try:
+        if dimensions is not None:
+            info["width"], info["height"] = dimensions
+        elif media_type == "image":
+            from PIL import Image
+            # Image.open only parses the header here
+            with Image.open(fs_path) as image:
+                info["width"], info["height"] = image.size
+        elif media_type == "video":
+            from video_editing import probe
+            stream = probe(fs_path)
+            info["width"], info["height"], info["duration"] = stream.width, stream.height, stream.duration
+    except Exception as e:
+        log(f"Could not read media metadata for {fs_path}: {e}", level="error")
+    return info
+
+def encode_cursor(sort_value: Any, path: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, path]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        sort_value, path = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return sort_value, path
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+class MediaCatalog:
+    """Thread-safe SQLite catalog of media assets."""
+
+    def __init__(self, db_path: str = MEDIA_CATALOG_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(assets)")}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                self._conn.execute(statement)
+        self._conn.execute(LRU_INDEX)
+
+    def add(self, fs_path: str, prompt: Optional[str] = None, parent_path: Optional[str] = None,
+            dimensions: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+        """
+        Record (or refresh) an asset from its file on disk.
+
+        Args:
+            fs_path: Relative file path, e.g. "generated_images/x.png"
+            prompt: Prompt the asset was generated from
+            parent_path: URL path of the asset it was derived from
+            dimensions: (width, height) when the caller already knows them
+
+        Returns:
+            The stored asset row
+        """
+        directory, filename = os.path.split(os.path.normpath(fs_path))
+        info = describe_file(fs_path, dimensions)
+        row = {
+            "path": url_path(directory, filename),
+            "filename": filename,
+            "directory": directory,
+            "type": MEDIA_DIRS.get(directory) or media_type_for(filename) or "file",
+            "prompt": prompt,
+            "parent_path": parent_path,
+            **info,
+        }
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # An upsert, so refreshing an asset keeps its pin and access time
+                self._conn.execute(
+                    """INSERT INTO assets
+                       (path, filename, directory, type, size, width, height, duration, created_at, prompt, parent_path)
+                       VALUES (:path, :filename, :directory, :type, :size, :width, :height, :duration, :created_at, :prompt, :parent_path)
+                       ON CONFLICT (path) DO UPDATE SET
+                           size = excluded.size, width = excluded.width, height = excluded.height,
+                           duration = excluded.duration, created_at = excluded.created_at,
+                           prompt = excluded.prompt, parent_path = excluded.parent_path""",
+                    row,
+                )
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def remove(self, path: str) -> bool:
+        """Forget an asset by URL path; returns whether it was catalogued."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = self._conn.execute("DELETE FROM assets WHERE path = ?", (path,)).rowcount > 0
+                if removed:
+                    self._bump_version()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM assets WHERE path = ?", (path,)).fetchone()
+        return dict(row) if row else None
+
+    def assets(self) -> List[Dict[str, Any]]:
+        """Every catalogued asset, oldest first."""
+        with self._lock:
+            return [dict(row) for row in self._conn.execute("SELECT * FROM assets ORDER BY created_at")]
+
+    def set_pinned(self, path: str, pinned: bool) -> bool:
+        """Pin or unpin an asset by URL path; returns whether it was catalogued."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                updated = self._conn.execute("UPDATE assets SET pinned = ? WHERE path = ?",
+                                             (int(pinned), path)).rowcount > 0
+                if updated:
+                    self._bump_version()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return updated
+
+    def touch(self, accesses: Dict[str, float]) -> None:
+        """Record last access times ({path: timestamp}) in one transaction; the version doesn't change."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "UPDATE assets SET accessed_at = MAX(COALESCE(accessed_at, 0), ?) WHERE path = ?",
+                    [(at, path) for path, at in accesses.items()],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """Asset count and bytes per directory, with the pinned share of each."""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT directory, COUNT(*) AS files, COALESCE(SUM(size), 0) AS bytes,
+                          COALESCE(SUM(CASE WHEN pinned THEN size ELSE 0 END), 0) AS pinned_bytes
+                   FROM assets GROUP BY directory""").fetchall()
+        return {row["directory"]: {"files": row["files"], "bytes": row["bytes"], "pinned_bytes": row["pinned_bytes"]}
+                for row in rows}
+
+    def least_recently_used(self, directory: str, used_before: float, limit: int = 500) -> List[Dict[str, Any]]:
+        """Unpinned assets of a directory not created or used since used_before, least recently used first."""
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                """SELECT * FROM assets
+                   WHERE directory = ? AND pinned = 0 AND COALESCE(accessed_at, created_at) < ?
+                   ORDER BY COALESCE(accessed_at, created_at), path LIMIT ?""",
+                (directory, used_before, limit))]
+
+    def version(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def list(
+        self,
+        directories: List[str],
+        media_type: Optional[str] = None,
+        sort: str = "created_at",
+        order: str = "desc",
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Return one page of assets and the cursor for the next page (None on the last page).
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort: {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unsupported order: {order}")
+
+        clauses = [f"directory IN ({', '.join('?' for _ in directories)})"]
+        params: List[Any] = list(directories)
+        if media_type:
+            clauses.append("type = ?")
+            params.append(media_type)
+        if cursor:
+            sort_value, path = decode_cursor(cursor)
+            op = "<" if order == "desc" else ">"
+            clauses.append(f"({sort} {op} ? OR ({sort} = ? AND path {op} ?))")
+            params += [sort_value, sort_value, path]
+
+        query = (f"SELECT * FROM assets WHERE {' AND '.join(clauses)} "
+                 f"ORDER BY {sort} {order.upper()}, path {order.upper()} LIMIT ?")
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute(query, params + [limit + 1])]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][sort], rows[-1]["path"])
+        return rows, next_cursor
+
+    def sync(self) -> Dict[str, int]:
+        """Reconcile the catalog with the files on disk (backfill new files, drop missing ones)."""
+        started = time.perf_counter()
+        with self._lock:
+            known = {row["path"] for row in self._conn.execute("SELECT path FROM assets")}
+
+        on_disk = set()
+        added = 0
+        for directory in MEDIA_DIRS:
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if not entry.is_file() or media_type_for(entry.name) is None:
+                    continue
+                path = url_path(directory, entry.name)
+                on_disk.add(path)
+                if path not in known:
+                    self.add(entry.path)
+                    added += 1
+
+        removed = 0
+        for path in known - on_disk:
+            removed += self.remove(path)
+
+        log(f"Media catalog synced: {added} added, {removed} removed in {time.perf_counter() - started:.2f}s")
+        return {"added": added, "removed": removed}
+
+    def _bump_version(self) -> None:
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
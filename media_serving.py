@@ -0,0 +1,110 @@
+"""
+HTTP serving for media files with caching, validators and byte ranges.
+
+Media files are named with uuids and never rewritten, so every response is
+marked immutable and carries a strong ETag plus Last-Modified. The ETag is
+derived from the file name, size and modification time, so it costs a stat
+rather than a read of the whole file. Conditional requests get
+a 304 without touching the file body. Range requests (video scrubbing in the
+trimmer) are served as 206 partial content by Starlette's FileResponse,
+honouring If-Range.
+
+Content types are sniffed from the file's leading bytes rather than guessed
+from the extension, so an uploaded JPEG saved as .png is still served as
+image/jpeg.
+
+Usage:
+    return await serve_media(request, "generated_videos", filename)
+"""
+
+import asyncio
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# (offset, signature, content type), checked in order
+MAGIC_SIGNATURES = (
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (4, b"ftyp", "video/mp4"),
+)
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    """Content type from a file's first bytes, or None if unrecognised."""
+    for offset, signature, content_type in MAGIC_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if content_type == "image/webp" and not head.startswith(b"RIFF"):
+                continue
+            return content_type
+    return None
+
+def media_etag(path: str, stat_result: os.stat_result) -> str:
+    """Strong validator for an immutable file: a digest of its name, size and mtime."""
+    identity = f"{os.path.basename(path)}:{stat_result.st_size}:{stat_result.st_mtime_ns}"
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+def read_media_headers(path: str) -> Tuple[os.stat_result, Dict[str, str]]:
+    """Stat and sniff a media file. Runs in a worker thread."""
+    stat_result = os.stat(path)
+    with open(path, "rb") as f:
+        head = f.read(16)
+    content_type = sniff_content_type(head) or guess_type(path)[0] or "application/octet-stream"
+    headers = {
+        "content-type": content_type,
+        "etag": f'"{media_etag(path, stat_result)}"',
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": IMMUTABLE_CACHE_CONTROL,
+    }
+    return stat_result, headers
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/ prefixes are ignored."""
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+def not_modified_since(if_modified_since: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+async def serve_media(request: Request, directory: str, filename: str) -> Response:
+    """
+    Serve one media file with caching headers, 304s and byte ranges.
+
+    Args:
+        request: The incoming request (for conditional and Range headers)
+        directory: Media directory, e.g. "generated_images"
+        filename: File name inside that directory
+
+    Returns:
+        A 304 response, or a FileResponse (200, 206 or 416)
+    """
+    path = os.path.join(directory, filename)
+    if filename != os.path.basename(filename) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    stat_result, headers = await asyncio.to_thread(read_media_headers, path)
+
+    # If-None-Match takes precedence over If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if (if_none_match is not None and etag_matches(if_none_match, headers["etag"])) or (
+        if_none_match is None and if_modified_since and not_modified_since(if_modified_since, stat_result.st_mtime)
+    ):
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "content-type"})
+
+    media_type = headers.pop("content-type")
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
@@ -0,0 +1,217 @@
+"""
+Process-based worker pool for MoviePy/ffmpeg media jobs.
+
+Every job runs in its own worker process (a fresh `python -m media_worker`
+interpreter), so encodes never block the event
+loop and a stuck or abandoned job can be killed outright. The pool bounds the
+number of concurrent jobs and the number waiting for a slot (QueueFullError
+past that), enforces a per-job timeout, and kills the job when its awaiting
+coroutine is cancelled. Trims and exports run as background jobs, so a client
+disconnecting no longer stops them; cancelling the job (DELETE /jobs/{job_id})
+does.
+
+Cleanup is guaranteed whether the job succeeds, fails or is killed:
+    - the worker runs in a new session, so killing its process group also
+      kills the ffmpeg reader/writer subprocesses MoviePy spawned
+    - each job gets a private temp directory (TMPDIR in the worker), which
+      holds MoviePy's temp_audio_*.m4a files and is removed afterwards
+
+Progress: pass on_progress to run() and the job function receives a
+progress(fraction, stage) keyword argument. Calls to it in the worker are sent
+back over a pipe and delivered to on_progress as dicts in the server process.
+While the job waits for a worker, on_progress also gets its queue position.
+
+Configuration (environment):
+    MEDIA_WORKERS=2          concurrent media jobs
+    MEDIA_QUEUE_SIZE=8       jobs allowed to wait for a worker
+    MEDIA_JOB_TIMEOUT=600    seconds before a job is killed
+
+Usage:
+    result = await media_pool.run(trim_video_file, src, start, end, out_path, mode)
+    result = await media_pool.run(export_sequence_file, scenes, out_path, on_progress=print)
+"""
+
+import asyncio
+import json
+import os
+import pickle
+import shutil
+import signal
+import sys
+import tempfile
+from typing import Any, Callable, Dict, Optional
+
+from concurrency import ConcurrencyLimiter
+from observability import log
+
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+MEDIA_QUEUE_SIZE = int(os.getenv("MEDIA_QUEUE_SIZE", "8"))
+MEDIA_JOB_TIMEOUT = float(os.getenv("MEDIA_JOB_TIMEOUT", "600"))
+
+# Set in worker processes whose job reports progress
+PROGRESS_FD_ENV = "MEDIA_PROGRESS_FD"
+
+# Exceptions re-raised with their own type in the parent; anything else becomes MediaJobError
+PASSTHROUGH_ERRORS = {"ValueError": ValueError}
+
+class MediaJobError(Exception):
+    """Raised when a media job fails or its worker process dies."""
+
+class MediaJobTimeoutError(MediaJobError):
+    """Raised when a media job runs past its timeout and is killed."""
+
+class MediaWorkerPool:
+    """Runs media functions in separate processes with bounded concurrency and queueing."""
+
+    def __init__(
+        self,
+        max_workers: int = MEDIA_WORKERS,
+        max_queue: int = MEDIA_QUEUE_SIZE,
+        timeout: float = MEDIA_JOB_TIMEOUT,
+    ):
+        self.timeout = timeout
+        self.limiter = ConcurrencyLimiter("media worker", max_workers, max_queue)
+
+    async def run(
+        self,
+        func: Callable,
+        *args,
+        timeout: Optional[float] = None,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Run func(*args, **kwargs) in a worker process and return its result.
+
+        Args:
+            func: A picklable module-level function
+            timeout: Seconds before the job is killed (defaults to MEDIA_JOB_TIMEOUT)
+            on_progress: Called with {"queue_position": n} while waiting and
+                {"percent": p, "stage": s} as the job reports progress; func must
+                then accept a progress keyword argument
+
+        Returns:
+            Whatever func returned
+        """
+        timeout = timeout or self.timeout
+        if on_progress is not None:
+            kwargs["progress"] = report_progress
+        payload = pickle.dumps((func, args, kwargs))
+
+        def on_position(position: int) -> None:
+            on_progress({"queue_position": position})
+
+        async with self.limiter.slot(on_position=on_progress and on_position):
+            workdir = tempfile.mkdtemp(prefix="media_job_")
+            env = dict(os.environ, TMPDIR=workdir)
+            env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), env.get("PYTHONPATH")]))
+            process = None
+            progress_read_fd = progress_write_fd = None
+            progress_reader = None
+            try:
+                if on_progress is not None:
+                    progress_read_fd, progress_write_fd = os.pipe()
+                    env[PROGRESS_FD_ENV] = str(progress_write_fd)
+
+                # A fresh interpreter imports only what the job needs, and its own
+                # session lets us kill the ffmpeg children along with it
+                process = await asyncio.create_subprocess_exec(
+                    sys.executable, "-m", "media_worker",
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    env=env,
+                    start_new_session=True,
+                    pass_fds=(progress_write_fd,) if progress_write_fd is not None else (),
+                )
+                if progress_write_fd is not None:
+                    # Only the worker keeps the write end, so the reader sees EOF when it exits
+                    os.close(progress_write_fd)
+                    progress_write_fd = None
+                    progress_reader = asyncio.create_task(self._read_progress(progress_read_fd, on_progress))
+                    progress_read_fd = None
+                try:
+                    output, _ = await asyncio.wait_for(process.communicate(payload), timeout)
+                except asyncio.TimeoutError:
+                    raise MediaJobTimeoutError(f"Media job timed out after {timeout:.0f}s")
+            finally:
+                if process is not None:
+                    self._kill(process.pid)
+                    await process.wait()
+                if progress_reader is not None:
+                    await asyncio.gather(progress_reader, return_exceptions=True)
+                for fd in (progress_read_fd, progress_write_fd):
+                    if fd is not None:
+                        os.close(fd)
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        try:
+            message = pickle.loads(output)
+        except Exception:
+            raise MediaJobError(f"Media worker exited unexpectedly (exit code {process.returncode})")
+        if message[0] == "ok":
+            return message[1]
+        _, error_type, error_message = message
+        raise PASSTHROUGH_ERRORS.get(error_type, MediaJobError)(error_message)
+
+    @staticmethod
+    async def _read_progress(fd: int, on_progress: Callable[[Dict[str, Any]], None]) -> None:
+        """Forward JSON progress lines from a worker's pipe until it closes."""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", buffering=0)
+        )
+        try:
+            async for line in reader:
+                try:
+                    on_progress(json.loads(line))
+                except Exception as e:
+                    log(f"Ignoring media job progress update: {e}", level="warning")
+        finally:
+            transport.close()
+
+    @staticmethod
+    def _kill(pid: int) -> None:
+        """Kill the worker and anything still running in its process group."""
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def stats(self) -> dict:
+        return self.limiter.stats()
+
+_progress_stream = None
+_last_progress = (-1.0, None)
+
+def report_progress(fraction: float, stage: str = "") -> None:
+    """Progress callback handed to job functions; sends updates to the server over a pipe."""
+    global _progress_stream, _last_progress
+    fd = os.environ.get(PROGRESS_FD_ENV)
+    if fd is None:
+        return
+    percent = round(max(0.0, min(1.0, fraction)) * 100, 1)
+    # Skip updates that wouldn't change what clients see
+    if (percent, stage) == _last_progress or (stage == _last_progress[1] and percent - _last_progress[0] < 1):
+        return
+    _last_progress = (percent, stage)
+    if _progress_stream is None:
+        _progress_stream = os.fdopen(int(fd), "w", buffering=1)
+    _progress_stream.write(json.dumps({"percent": percent, "stage": stage}) + "\n")
+
+def _worker_main() -> None:
+    """Entry point of a worker process: read a pickled job on stdin, write the result on stdout."""
+    # Keep the real stdout for the result and send anything the job prints to stderr
+    result_stream = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    func, args, kwargs = pickle.load(sys.stdin.buffer)
+    try:
+        message = ("ok", func(*args, **kwargs))
+    except BaseException as e:
+        message = ("error", type(e).__name__, str(e))
+    pickle.dump(message, result_stream)
+    result_stream.close()
+
+if __name__ == "__main__":
+    _worker_main()
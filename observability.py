@@ -0,0 +1,277 @@
+"""
+Metrics, structured logs and per-request timings.
+
+Metrics are kept in-process and rendered in the Prometheus text exposition
+format at /metrics. Counters and histograms are updated as things happen.
+Values that already live elsewhere (queue depths, cache counters) are read by
+collector functions at scrape time.
+
+Every HTTP request gets a request id: the caller's X-Request-ID if it sent a
+sane one, otherwise a new one. The id is held in a context variable, so it
+follows the request into upstream calls, background jobs it starts and every
+log line. Logs are the familiar text lines by default, or one JSON object per
+line with LOG_FORMAT=json. Each finished request writes one access line with
+its method, route, status and elapsed time (ACCESS_LOG=0 turns it off).
+
+Timed steps of a request (upstream calls, quota waits, ...) are also collected
+per request and returned in a Server-Timing header, so browser dev tools show
+where a slow request spent its time.
+
+Configuration (environment):
+    LOG_FORMAT=text          "text" or "json"
+    SERVER_TIMING=1          0 turns the Server-Timing header off
+    ACCESS_LOG=1             0 turns the per-request access line off
+
+Usage:
+    log("✅ Image generated", path=image_path)
+    with upstream_call("gemini_image"):
+        response = await client.aio.models.generate_content(...)
+    metrics.render()
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+ACCESS_LOG = os.getenv("ACCESS_LOG", "1") == "1"
+
+# Seconds; spans quick API calls through multi-minute Veo generations and encodes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def accept_request_id(header: Optional[str]) -> str:
+    """The caller's request id when it is a short token, otherwise a fresh one."""
+    return header if header and _REQUEST_ID_RE.match(header) else new_request_id()
+
+class RequestTimings:
+    """Durations of named steps in one request, summed per name, for the Server-Timing header."""
+
+    MAX_ENTRIES = 16
+
+    def __init__(self):
+        self.entries: Dict[str, float] = {}
+        self.closed = False
+
+    def add(self, name: str, seconds: float) -> None:
+        # Background work started by the request can outlive it; its timings are dropped
+        if self.closed or (name not in self.entries and len(self.entries) >= self.MAX_ENTRIES):
+            return
+        self.entries[name] = self.entries.get(name, 0.0) + seconds
+
+    def header(self) -> str:
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.entries.items())
+
+timings_var: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+def record_timing(name: str, seconds: float) -> None:
+    """Add a step to the current request's Server-Timing breakdown, if there is a request."""
+    timings = timings_var.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+def log(message: str, level: str = "info", exc_info: bool = False, **fields) -> None:
+    """
+    Write one log line.
+
+    Args:
+        message: Human-readable message; the whole line in text format
+        level: "info", "warning" or "error"
+        exc_info: Include the traceback of the exception being handled
+        **fields: Structured fields, only written in JSON format
+    """
+    if LOG_FORMAT != "json":
+        print(message)
+        if exc_info:
+            traceback.print_exc()
+        return
+
+    record = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "level": level,
+        "message": message,
+    }
+    request_id = request_id_var.get()
+    if request_id:
+        record["request_id"] = request_id
+    record.update(fields)
+    if exc_info:
+        record["exception"] = traceback.format_exc()
+    print(json.dumps(record, default=str, ensure_ascii=False), flush=True)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+# One (labels, value) sample of a collected metric family
+Sample = Tuple[Dict[str, str], float]
+
+class Metric:
+    """Base for labelled metrics; values are keyed by the tuple of label values."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def lines(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}"
+                for key, value in items]
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        lines = []
+        for key, counts, total, count in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+# A collector returns metric families read at scrape time: (name, type, help, samples)
+Collector = Callable[[], Iterable[Tuple[str, str, str, Iterable[Sample]]]]
+
+class MetricsRegistry:
+    """Holds metrics and scrape-time collectors and renders them for Prometheus."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Collector] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        out = []
+        for metric in self._metrics:
+            out += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.type}"]
+            out += metric.lines()
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                log(f"Metrics collector failed: {e}", level="error")
+                continue
+            for name, metric_type, help, samples in families:
+                out += [f"# HELP {name} {help}", f"# TYPE {name} {metric_type}"]
+                out += [f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples]
+        return "\n".join(out) + "\n"
+
+metrics = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Time from request to response start, by route template",
+    ("method", "route", "status"))
+HTTP_RESPONSE_BYTES = metrics.counter(
+    "http_response_bytes_total", "Response body bytes sent (responses with a Content-Length)", ("route",))
+UPSTREAM_SECONDS = metrics.histogram(
+    "upstream_call_duration_seconds", "Latency of calls to Gemini, Veo and the LLM providers",
+    ("call", "outcome"))
+ENCODE_SECONDS = metrics.histogram(
+    "media_encode_duration_seconds", "Wall time of trims and exports in the worker pool, excluding queueing",
+    ("operation",))
+ENCODE_REALTIME_FACTOR = metrics.histogram(
+    "media_encode_realtime_factor", "Seconds of output video produced per second of encoding",
+    ("operation",), buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128))
+
+@contextmanager
+def upstream_call(call: str):
+    """Time one upstream call into UPSTREAM_SECONDS and the request's Server-Timing."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_SECONDS.observe(elapsed, call=call, outcome=outcome)
+        record_timing(call, elapsed)
+
+def observe_encode(operation: str, wall_seconds: float, media_seconds: Optional[float] = None) -> None:
+    """Record one trim or export: its encode time and, if known, how fast it ran relative to realtime."""
+    ENCODE_SECONDS.observe(wall_seconds, operation=operation)
+    if media_seconds and wall_seconds > 0:
+        ENCODE_REALTIME_FACTOR.observe(media_seconds / wall_seconds, operation=operation)
@@ -0,0 +1,218 @@
+"""
+WebP thumbnails and video poster frames for the gallery.
+
+Every image gets WebP thumbnails at a few fixed widths; every video gets a
+poster frame (grabbed with ffmpeg) plus thumbnails of that frame. Renditions
+are written once to THUMB_DIR, keyed by the asset's directory and filename,
+and never change afterwards because asset filenames are never reused.
+
+Renditions are made eagerly when an asset is created, lazily on the first
+/thumbs request for an asset that has none yet, and by a startup backfill for
+files that predate this service. Concurrent requests for the same asset share
+one render.
+
+Configuration (environment):
+    THUMB_DIR=thumbnails
+    THUMB_WIDTHS=128,256,512
+    THUMB_QUALITY=80
+    THUMB_WORKERS=2           renders allowed to run at once
+
+Usage:
+    path = await rendition_service.get("generated_videos", "x.mp4", "256")
+    await rendition_service.ensure("generated_images", "y.png")
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from PIL import Image
+
+from observability import log
+
+THUMB_DIR = os.getenv("THUMB_DIR", "thumbnails")
+THUMB_WIDTHS = tuple(int(w) for w in os.getenv("THUMB_WIDTHS", "128,256,512").split(","))
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", "80"))
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "2"))
+
+# Poster frames are taken a little way in (Veo clips can open on a fade) and capped in size
+POSTER_OFFSET = 1.0
+POSTER_MAX_WIDTH = 1280
+
+POSTER = "poster"
+
+class RenditionError(Exception):
+    """Raised when renditions can't be made for an asset."""
+
+def rendition_path(directory: str, filename: str, size: str, thumb_dir: str = THUMB_DIR) -> str:
+    """Path of one rendition on disk; size is a width from THUMB_WIDTHS or "poster"."""
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(thumb_dir, directory, f"{stem}.{size}.webp")
+
+def rendition_sizes(media_type: str, widths: Iterable[int] = THUMB_WIDTHS) -> List[str]:
+    sizes = [str(w) for w in widths]
+    return sizes + [POSTER] if media_type == "video" else sizes
+
+def save_webp(image: Image.Image, path: str, quality: int = THUMB_QUALITY) -> None:
+    """Write atomically so a reader never sees a half-written file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    image.save(tmp_path, format="WEBP", quality=quality, method=4)
+    os.replace(tmp_path, path)
+
+def render_thumbnails(image: Image.Image, directory: str, filename: str,
+                      widths: Iterable[int] = THUMB_WIDTHS, thumb_dir: str = THUMB_DIR) -> None:
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+    for width in widths:
+        thumb = image.copy()
+        # Fits the width, keeps the aspect ratio and never upscales
+        thumb.thumbnail((width, image.height), Image.LANCZOS)
+        save_webp(thumb, rendition_path(directory, filename, str(width), thumb_dir))
+
+def grab_poster_frame(src: str, out_path: str) -> None:
+    """Extract one frame near the start of a video as PNG."""
+    from video_editing import probe, run_ffmpeg
+
+    duration = probe(src).duration
+    offset = min(POSTER_OFFSET, duration / 10) if duration else 0
+    run_ffmpeg(["-ss", f"{offset:.3f}", "-i", src, "-frames:v", "1", "-an", out_path])
+
+def render_asset(directory: str, filename: str, media_type: str,
+                 widths: Iterable[int] = THUMB_WIDTHS, thumb_dir: str = THUMB_DIR) -> None:
+    """
+    Make every rendition of one asset. Runs in a worker thread.
+
+    Args:
+        directory: Asset directory, e.g. "generated_videos"
+        filename: Asset filename
+        media_type: "image" or "video"
+    """
+    src = os.path.join(directory, filename)
+    if not os.path.isfile(src):
+        raise RenditionError(f"{src} not found")
+    os.makedirs(os.path.join(thumb_dir, directory), exist_ok=True)
+
+    if media_type == "video":
+        workdir = tempfile.mkdtemp(prefix="poster_")
+        try:
+            frame_path = os.path.join(workdir, "frame.png")
+            grab_poster_frame(src, frame_path)
+            with Image.open(frame_path) as frame:
+                frame.load()
+                poster = frame.convert("RGB")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        if poster.width > POSTER_MAX_WIDTH:
+            poster.thumbnail((POSTER_MAX_WIDTH, poster.height), Image.LANCZOS)
+        save_webp(poster, rendition_path(directory, filename, POSTER, thumb_dir))
+        render_thumbnails(poster, directory, filename, widths, thumb_dir)
+    else:
+        with Image.open(src) as image:
+            # Let JPEG decode at reduced scale when the largest thumbnail allows it
+            image.draft("RGB", (max(widths), max(widths)))
+            image.load()
+            render_thumbnails(image, directory, filename, widths, thumb_dir)
+
+class RenditionService:
+    """Makes, finds and removes renditions, with one render per asset at a time."""
+
+    def __init__(self, thumb_dir: str = THUMB_DIR, widths: Iterable[int] = THUMB_WIDTHS,
+                 max_workers: int = THUMB_WORKERS):
+        self.thumb_dir = thumb_dir
+        self.widths = tuple(widths)
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+        self.counters: Dict[str, int] = {"rendered": 0, "coalesced": 0, "failed": 0, "backfilled": 0}
+        os.makedirs(thumb_dir, exist_ok=True)
+
+    def path_for(self, directory: str, filename: str, size: str) -> str:
+        return rendition_path(directory, filename, size, self.thumb_dir)
+
+    def has_all(self, directory: str, filename: str, media_type: str) -> bool:
+        return all(os.path.exists(self.path_for(directory, filename, size))
+                   for size in rendition_sizes(media_type, self.widths))
+
+    async def ensure(self, directory: str, filename: str, media_type: Optional[str] = None) -> None:
+        """Make the asset's renditions unless they already exist."""
+        media_type = media_type or ("video" if filename.lower().endswith(".mp4") else "image")
+        if self.has_all(directory, filename, media_type):
+            return
+
+        key = f"{directory}/{filename}"
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            # The render runs as its own task so a disconnecting client doesn't abort it for the others
+            task = asyncio.create_task(self._render(directory, filename, media_type))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        await asyncio.shield(task)
+
+    async def _render(self, directory: str, filename: str, media_type: str) -> None:
+        try:
+            async with self._semaphore:
+                await asyncio.to_thread(render_asset, directory, filename, media_type,
+                                        self.widths, self.thumb_dir)
+        except Exception:
+            self.counters["failed"] += 1
+            raise
+        self.counters["rendered"] += 1
+
+    def schedule(self, directory: str, filename: str, media_type: Optional[str] = None) -> None:
+        """Render an asset's renditions in the background, e.g. right after it was created."""
+        async def run():
+            try:
+                await self.ensure(directory, filename, media_type)
+            except Exception as e:
+                log(f"Could not render thumbnails for {directory}/{filename}: {e}", level="error")
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def get(self, directory: str, filename: str, size: str, media_type: Optional[str] = None) -> str:
+        """Return the path of one rendition, rendering the asset's renditions first if needed."""
+        path = self.path_for(directory, filename, size)
+        if not os.path.exists(path):
+            await self.ensure(directory, filename, media_type)
+        return path
+
+    def remove(self, directory: str, filename: str) -> int:
+        """Delete every rendition of an asset; returns how many files were removed."""
+        removed = 0
+        for size in [str(w) for w in self.widths] + [POSTER]:
+            try:
+                os.remove(self.path_for(directory, filename, size))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def backfill(self, assets: Iterable[Dict[str, str]]) -> int:
+        """Render missing renditions for existing assets (catalog rows with directory, filename, type)."""
+        started = time.perf_counter()
+        pending = [a for a in assets if not self.has_all(a["directory"], a["filename"], a["type"])]
+
+        async def one(asset):
+            try:
+                await self.ensure(asset["directory"], asset["filename"], asset["type"])
+                return 1
+            except Exception as e:
+                log(f"Could not render thumbnails for {asset['directory']}/{asset['filename']}: {e}", level="error")
+                return 0
+
+        done = sum(await asyncio.gather(*(one(a) for a in pending)))
+        self.counters["backfilled"] += done
+        if pending:
+            log(f"🖼️ Backfilled renditions for {done}/{len(pending)} assets in {time.perf_counter() - started:.2f}s")
+        return done
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self.counters)
+        stats["inflight"] = len(self._inflight)
+        return stats
@@ -0,0 +1,279 @@
+"""
+Disk budgets, LRU eviction and temp file sweeping for generated media.
+
+Each media directory has a byte budget. A background task checks usage every
+RETENTION_INTERVAL seconds, and a directory over its budget has its least
+recently used assets evicted until it is down to RETENTION_LOW_WATER of the
+budget. An asset is "used" when it is served in full or is the source of an
+edit, video, trim or export; gallery thumbnails don't count. Accesses are
+buffered in memory and written to the media catalog in one batch per run.
+
+Never evicted:
+    - pinned assets (the ones a user saved with POST /pin)
+    - assets created or used in the last RETENTION_MIN_AGE seconds, so nothing
+      is pulled out from under a running job
+
+Evictions go through the same delete path as /delete-file, so the catalog,
+thumbnails and generation cache stay consistent with the files on disk.
+
+The same task sweeps leftovers of interrupted work older than TEMP_SWEEP_MIN_AGE:
+    - MoviePy temp_audio_*.m4a files in the working and temp directories
+    - private temp directories of killed media workers (media_job_*)
+    - partial uploads (.upload-*.part) in the media directories
+    - segments half moved into the segment cache (.*.partial)
+    - thumbnails whose asset no longer exists
+
+With several worker processes each one buffers and flushes its own accesses,
+but only the worker holding the "retention" lease in the shared store evicts
+and sweeps.
+
+Configuration (environment):
+    RETENTION_BUDGETS=generated_images=2G,uploaded_images=1G,generated_videos=10G
+                                   bytes per directory (K/M/G suffixes, 0 = unlimited)
+    RETENTION_INTERVAL=300         seconds between runs (0 disables the background task)
+    RETENTION_LOW_WATER=0.9        fraction of the budget eviction frees down to
+    RETENTION_MIN_AGE=3600         seconds an asset is safe after it was created or used
+    TEMP_SWEEP_MIN_AGE=3600        seconds before a temp file counts as orphaned
+
+Usage:
+    retention = RetentionService(media_catalog, delete_asset, rendition_service.thumb_dir)
+    retention.start()
+    retention.touch("/generated_videos/x.mp4")
+    report = await retention.run_once()
+"""
+
+import asyncio
+import fnmatch
+import os
+import shutil
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from media_catalog import MEDIA_DIRS, MediaCatalog
+from observability import log
+from segment_cache import SEGMENT_CACHE_DIR
+from shared_store import SharedStore
+
+SIZE_SUFFIXES = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+DEFAULT_BUDGETS = "generated_images=2G,uploaded_images=1G,generated_videos=10G"
+
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "300"))
+RETENTION_LOW_WATER = float(os.getenv("RETENTION_LOW_WATER", "0.9"))
+RETENTION_MIN_AGE = float(os.getenv("RETENTION_MIN_AGE", "3600"))
+TEMP_SWEEP_MIN_AGE = float(os.getenv("TEMP_SWEEP_MIN_AGE", "3600"))
+
+# Leftovers of interrupted work: (directory, glob pattern)
+TEMP_PATTERNS = [
+    (".", "temp_audio_*.m4a"),
+    (tempfile.gettempdir(), "temp_audio_*.m4a"),
+    (tempfile.gettempdir(), "media_job_*"),
+    (SEGMENT_CACHE_DIR, ".*.partial"),
+] + [(directory, ".upload-*.part") for directory in MEDIA_DIRS]
+
+def parse_size(raw: str) -> int:
+    """Bytes from "500M", "2G", "1048576"; 0 means unlimited."""
+    raw = raw.strip().upper().removesuffix("B")
+    if raw and raw[-1] in SIZE_SUFFIXES:
+        return int(float(raw[:-1]) * SIZE_SUFFIXES[raw[-1]])
+    return int(float(raw or 0))
+
+def parse_budgets(raw: str) -> Dict[str, int]:
+    """Parse RETENTION_BUDGETS entries of the form directory=size."""
+    budgets = {}
+    for entry in raw.split(","):
+        if "=" in entry:
+            directory, size = entry.split("=", 1)
+            budgets[directory.strip()] = parse_size(size)
+    return budgets
+
+RETENTION_BUDGETS = {**parse_budgets(DEFAULT_BUDGETS), **parse_budgets(os.getenv("RETENTION_BUDGETS", ""))}
+
+def catalog_path(path: str) -> str:
+    """The catalog's URL path for a URL path or a relative file path."""
+    return path if path.startswith("/") else "/" + os.path.normpath(path).replace(os.sep, "/")
+
+def path_size(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+class RetentionService:
+    """Keeps the media directories within their byte budgets and sweeps orphaned temp files."""
+
+    def __init__(
+        self,
+        catalog: MediaCatalog,
+        delete: Callable[[str], Awaitable[bool]],
+        thumb_dir: Optional[str] = None,
+        budgets: Optional[Dict[str, int]] = None,
+        interval: float = RETENTION_INTERVAL,
+        low_water: float = RETENTION_LOW_WATER,
+        min_age: float = RETENTION_MIN_AGE,
+        temp_min_age: float = TEMP_SWEEP_MIN_AGE,
+        temp_patterns: Iterable[Tuple[str, str]] = TEMP_PATTERNS,
+        store: Optional[SharedStore] = None,
+    ):
+        """
+        Args:
+            catalog: The media catalog, source of sizes, access times and pins
+            delete: Coroutine deleting one asset by URL path and cleaning every index; returns
+                whether there was something to delete
+            thumb_dir: Rendition directory to sweep for thumbnails of deleted assets
+            store: Shared store whose lease picks the one worker that evicts, if there are several
+        """
+        self.catalog = catalog
+        self.delete = delete
+        self.thumb_dir = thumb_dir
+        self.budgets = budgets if budgets is not None else RETENTION_BUDGETS
+        self.interval = interval
+        self.low_water = low_water
+        self.min_age = min_age
+        self.temp_min_age = temp_min_age
+        self.temp_patterns = list(temp_patterns)
+        self.store = store
+        self._accesses: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.last_run: Optional[Dict[str, object]] = None
+        self.counters: Dict[str, int] = {"runs": 0, "evicted": 0, "evicted_bytes": 0,
+                                         "temp_swept": 0, "temp_swept_bytes": 0, "orphan_renditions": 0}
+
+    def touch(self, path: str) -> None:
+        """Note that an asset (URL or relative file path) was just used."""
+        self._accesses[catalog_path(path)] = time.time()
+
+    def flush(self) -> int:
+        """Write buffered access times to the catalog; returns how many were written."""
+        accesses, self._accesses = self._accesses, {}
+        if accesses:
+            self.catalog.touch(accesses)
+        return len(accesses)
+
+    async def run_once(self) -> Dict[str, object]:
+        """Flush access times, evict over-budget directories and sweep temp files."""
+        async with self._lock:
+            started = time.perf_counter()
+            await asyncio.to_thread(self.flush)
+            evicted = await self.evict()
+            swept = await asyncio.to_thread(self.sweep_temp)
+            self.counters["runs"] += 1
+            self.last_run = {"at": time.time(), "evicted": evicted, "swept": swept,
+                             "seconds": round(time.perf_counter() - started, 3)}
+            if evicted or swept["files"]:
+                log(f"🧹 Retention: evicted {len(evicted)} assets, swept {swept['files']} temp files",
+                    evicted=len(evicted), swept=swept["files"], freed=sum(a["size"] for a in evicted) + swept["bytes"])
+            return self.last_run
+
+    async def evict(self) -> List[Dict[str, object]]:
+        """Delete least recently used, unpinned assets from every directory over its budget."""
+        evicted = []
+        usage = await asyncio.to_thread(self.catalog.usage)
+        for directory, budget in self.budgets.items():
+            used = usage.get(directory, {}).get("bytes", 0)
+            if not budget or used <= budget:
+                continue
+            target = budget * self.low_water
+            candidates = await asyncio.to_thread(self.catalog.least_recently_used, directory,
+                                                 time.time() - self.min_age)
+            for asset in candidates:
+                if used <= target:
+                    break
+                # Used again since the candidates were read
+                if asset["path"] in self._accesses:
+                    continue
+                if await self.delete(asset["path"]):
+                    used -= asset["size"]
+                    self.counters["evicted"] += 1
+                    self.counters["evicted_bytes"] += asset["size"]
+                    evicted.append({"path": asset["path"], "size": asset["size"]})
+            if used > budget:
+                log(f"⚠️ {directory} is still over its {budget} byte budget ({used} bytes): the rest is pinned or in use",
+                    level="warning", directory=directory, budget=budget, used=used)
+        return evicted
+
+    def sweep_temp(self) -> Dict[str, int]:
+        """Remove orphaned temp files and thumbnails of deleted assets."""
+        cutoff = time.time() - self.temp_min_age
+        files = size = 0
+        for directory, pattern in self.temp_patterns:
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if not fnmatch.fnmatch(entry.name, pattern):
+                    continue
+                try:
+                    if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                        continue
+                    entry_size = path_size(entry.path)
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                files += 1
+                size += entry_size
+
+        orphans = self.sweep_renditions(cutoff)
+        self.counters["temp_swept"] += files
+        self.counters["temp_swept_bytes"] += size
+        self.counters["orphan_renditions"] += orphans
+        return {"files": files + orphans, "bytes": size, "orphan_renditions": orphans}
+
+    def sweep_renditions(self, cutoff: float) -> int:
+        """Delete thumbnails whose asset is gone (e.g. removed from disk by hand)."""
+        if not self.thumb_dir:
+            return 0
+        removed = 0
+        for directory in MEDIA_DIRS:
+            thumbs = os.path.join(self.thumb_dir, directory)
+            if not os.path.isdir(thumbs) or not os.path.isdir(directory):
+                continue
+            stems = {os.path.splitext(name)[0] for name in os.listdir(directory)}
+            for entry in os.scandir(thumbs):
+                # "<stem>.<size>.webp", plus in-progress temp files that share the stem
+                stem = entry.name.split(".", 1)[0]
+                try:
+                    if stem not in stems and entry.stat().st_mtime <= cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if self.store is not None and not await self.store.call(
+                        self.store.acquire_lease, "retention", self.interval * 2):
+                    await asyncio.to_thread(self.flush)
+                    continue
+                await self.run_once()
+            except Exception as e:
+                log(f"❌ Retention run failed: {e}", level="error", exc_info=True)
+
+    def stats(self) -> Dict[str, object]:
+        usage = self.catalog.usage()
+        return {
+            **self.counters,
+            "directories": {directory: {**usage.get(directory, {"files": 0, "bytes": 0, "pinned_bytes": 0}),
+                                        "budget": self.budgets.get(directory, 0)}
+                            for directory in MEDIA_DIRS},
+            "pending_accesses": len(self._accesses),
+            "last_run": self.last_run,
+        }
@@ -0,0 +1,240 @@
+"""
+Scrub proxies and frame sprite sheets for the trimmer timeline.
+
+Dragging a trim handle over the full-resolution Veo MP4 makes the browser
+fetch and decode long GOPs at 720p for every seek. Each video gets two
+lightweight stand-ins instead:
+    - a proxy: a small, low-bitrate H.264 copy with a keyframe every
+      SCRUB_PROXY_GOP frames, so any seek decodes only a few frames
+    - a sprite sheet: evenly spaced frames tiled into one WebP, plus a JSON
+      index of the grid and each frame's timestamp, so the handle preview
+      is a background-position change with no seek at all
+
+Previews live next to the thumbnails in THUMB_DIR, as <stem>.proxy.mp4,
+<stem>.sprite.webp and <stem>.sprite.json, and are never rewritten because
+asset filenames are never reused. The index is written last, so its presence
+means the set is complete. Like renditions, previews are made eagerly when a
+video is created and lazily on the first request, and concurrent requests
+for one video share a single render.
+
+Configuration (environment):
+    SCRUB_PROXY_WIDTH=480          proxy width in pixels (never upscaled)
+    SCRUB_PROXY_CRF=32             x264 quality of the proxy
+    SCRUB_PROXY_GOP=6              frames between proxy keyframes (1 = all-intra)
+    SCRUB_SPRITE_WIDTH=160         width of one sprite frame
+    SCRUB_SPRITE_INTERVAL=0.25     seconds between sprite frames
+    SCRUB_SPRITE_MAX_FRAMES=120    cap on frames per sheet; long videos get a wider interval
+    SCRUB_SPRITE_COLUMNS=10
+    SCRUB_WORKERS=1                preview renders allowed to run at once
+
+Usage:
+    path = await scrub_service.get("generated_videos", "x.mp4", "index")
+    scrub_service.schedule("generated_videos", "x.mp4")
+"""
+
+import asyncio
+import glob
+import json
+import math
+import os
+import shutil
+import tempfile
+from typing import Dict, Set
+
+from PIL import Image
+
+from observability import log
+from renditions import THUMB_DIR, THUMB_QUALITY, save_webp
+
+SCRUB_PROXY_WIDTH = int(os.getenv("SCRUB_PROXY_WIDTH", "480"))
+SCRUB_PROXY_CRF = os.getenv("SCRUB_PROXY_CRF", "32")
+SCRUB_PROXY_GOP = int(os.getenv("SCRUB_PROXY_GOP", "6"))
+SCRUB_SPRITE_WIDTH = int(os.getenv("SCRUB_SPRITE_WIDTH", "160"))
+SCRUB_SPRITE_INTERVAL = float(os.getenv("SCRUB_SPRITE_INTERVAL", "0.25"))
+SCRUB_SPRITE_MAX_FRAMES = int(os.getenv("SCRUB_SPRITE_MAX_FRAMES", "120"))
+SCRUB_SPRITE_COLUMNS = int(os.getenv("SCRUB_SPRITE_COLUMNS", "10"))
+SCRUB_WORKERS = int(os.getenv("SCRUB_WORKERS", "1"))
+
+# Preview kind -> file suffix after the asset's stem
+SCRUB_KINDS = {
+    "proxy": "proxy.mp4",
+    "sprite": "sprite.webp",
+    "index": "sprite.json",
+}
+
+class ScrubPreviewError(Exception):
+    """Raised when scrub previews can't be made for a video."""
+
+def scrub_path(directory: str, filename: str, kind: str, preview_dir: str = THUMB_DIR) -> str:
+    """Path of one preview on disk; kind is "proxy", "sprite" or "index"."""
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(preview_dir, directory, f"{stem}.{SCRUB_KINDS[kind]}")
+
+def render_proxy(src: str, out_path: str, width: int = SCRUB_PROXY_WIDTH,
+                 crf: str = SCRUB_PROXY_CRF, gop: int = SCRUB_PROXY_GOP) -> None:
+    """Encode a small short-GOP copy of a video, with mono low-bitrate audio if it has any."""
+    from video_editing import run_ffmpeg
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    try:
+        run_ffmpeg([
+            "-i", src, "-map", "0:v:0", "-map", "0:a:0?",
+            "-vf", f"scale='min({width},iw)':-2", "-pix_fmt", "yuv420p",
+            "-c:v", "libx264", "-preset", "veryfast", "-tune", "fastdecode", "-crf", crf,
+            # Fixed keyframe spacing so every seek lands at most gop - 1 frames from a keyframe
+            "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+            "-c:a", "aac", "-b:a", "48k", "-ac", "1",
+            "-movflags", "+faststart", "-f", "mp4", tmp_path,
+        ])
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def render_sprite(src: str, sprite_path: str, index_path: str, duration: float,
+                  frame_width: int = SCRUB_SPRITE_WIDTH, interval: float = SCRUB_SPRITE_INTERVAL,
+                  max_frames: int = SCRUB_SPRITE_MAX_FRAMES, columns: int = SCRUB_SPRITE_COLUMNS) -> Dict[str, object]:
+    """
+    Tile evenly spaced frames of a video into one WebP and write its JSON index.
+
+    Frame i shows the video at times[i], which is i * interval. The index is
+    written after the sheet, so a reader that finds it can rely on the sheet.
+
+    Returns:
+        The index
+    """
+    from video_editing import run_ffmpeg
+
+    if duration > interval * max_frames:
+        interval = duration / max_frames
+    workdir = tempfile.mkdtemp(prefix="sprite_")
+    try:
+        # One decoding pass; the fps filter picks the frame nearest each multiple of the interval
+        run_ffmpeg(["-i", src, "-map", "0:v:0", "-an",
+                    "-vf", f"fps=1/{interval:.6f},scale={frame_width}:-2",
+                    "-frames:v", str(max_frames), "-q:v", "3",
+                    os.path.join(workdir, "frame_%05d.jpg")])
+        frames = sorted(glob.glob(os.path.join(workdir, "frame_*.jpg")))
+        if not frames:
+            raise ScrubPreviewError(f"No frames could be read from {src}")
+
+        with Image.open(frames[0]) as first:
+            frame_size = first.size
+        columns = min(columns, len(frames))
+        rows = math.ceil(len(frames) / columns)
+        sheet = Image.new("RGB", (frame_size[0] * columns, frame_size[1] * rows))
+        for i, frame_path in enumerate(frames):
+            with Image.open(frame_path) as frame:
+                sheet.paste(frame.convert("RGB"), ((i % columns) * frame_size[0], (i // columns) * frame_size[1]))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    save_webp(sheet, sprite_path, quality=THUMB_QUALITY)
+    index = {
+        "duration": round(duration, 3),
+        "interval": round(interval, 6),
+        "count": len(frames),
+        "columns": columns,
+        "rows": rows,
+        "frame_width": frame_size[0],
+        "frame_height": frame_size[1],
+        "times": [round(i * interval, 3) for i in range(len(frames))],
+    }
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    return index
+
+def render_previews(directory: str, filename: str, preview_dir: str = THUMB_DIR) -> None:
+    """Make the proxy, sprite sheet and index of one video. Runs in a worker thread."""
+    from video_editing import probe
+
+    src = os.path.join(directory, filename)
+    if not os.path.isfile(src):
+        raise ScrubPreviewError(f"{src} not found")
+    duration = probe(src).duration
+    if not duration:
+        raise ScrubPreviewError(f"Could not read the duration of {src}")
+    os.makedirs(os.path.join(preview_dir, directory), exist_ok=True)
+
+    render_proxy(src, scrub_path(directory, filename, "proxy", preview_dir))
+    render_sprite(src, scrub_path(directory, filename, "sprite", preview_dir),
+                  scrub_path(directory, filename, "index", preview_dir), duration)
+
+class ScrubPreviewService:
+    """Makes, finds and removes scrub previews, with one render per video at a time."""
+
+    def __init__(self, preview_dir: str = THUMB_DIR, max_workers: int = SCRUB_WORKERS):
+        self.preview_dir = preview_dir
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+        self.counters: Dict[str, int] = {"rendered": 0, "coalesced": 0, "failed": 0}
+        os.makedirs(preview_dir, exist_ok=True)
+
+    def path_for(self, directory: str, filename: str, kind: str) -> str:
+        return scrub_path(directory, filename, kind, self.preview_dir)
+
+    def has_all(self, directory: str, filename: str) -> bool:
+        return all(os.path.exists(self.path_for(directory, filename, kind)) for kind in SCRUB_KINDS)
+
+    async def ensure(self, directory: str, filename: str) -> None:
+        """Make the video's previews unless they already exist."""
+        if self.has_all(directory, filename):
+            return
+
+        key = f"{directory}/{filename}"
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            # The render runs as its own task so a disconnecting client doesn't abort it for the others
+            task = asyncio.create_task(self._render(directory, filename))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        await asyncio.shield(task)
+
+    async def _render(self, directory: str, filename: str) -> None:
+        try:
+            async with self._semaphore:
+                await asyncio.to_thread(render_previews, directory, filename, self.preview_dir)
+        except Exception:
+            self.counters["failed"] += 1
+            raise
+        self.counters["rendered"] += 1
+
+    def schedule(self, directory: str, filename: str) -> None:
+        """Render a video's previews in the background, e.g. right after it was created."""
+        async def run():
+            try:
+                await self.ensure(directory, filename)
+            except Exception as e:
+                log(f"Could not render scrub previews for {directory}/{filename}: {e}", level="error")
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def get(self, directory: str, filename: str, kind: str) -> str:
+        """Return the path of one preview, rendering the video's previews first if needed."""
+        path = self.path_for(directory, filename, kind)
+        if not os.path.exists(path):
+            await self.ensure(directory, filename)
+        return path
+
+    def remove(self, directory: str, filename: str) -> int:
+        """Delete every preview of a video; returns how many files were removed."""
+        removed = 0
+        for kind in SCRUB_KINDS:
+            try:
+                os.remove(self.path_for(directory, filename, kind))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self.counters)
+        stats["inflight"] = len(self._inflight)
+        return stats
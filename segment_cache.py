@@ -0,0 +1,145 @@
+"""
+Disk cache of rendered export segments.
+
+Segments are keyed by (source file content hash, start_time, end_time, encode
+settings), so re-exporting a sequence after editing one scene only renders
+that scene and reuses every other segment. The cache lives in its own
+directory with a byte budget; once it is exceeded the least recently used
+segments are deleted.
+
+Configuration (environment):
+    SEGMENT_CACHE_DIR=segment_cache
+    SEGMENT_CACHE_MAX_BYTES=2147483648
+
+Usage:
+    key = segment_cache.key(src, start, end, {"mode": "smart_cut"})
+    cached_path = segment_cache.lookup(key)
+    cached_path = segment_cache.store(key, rendered_path)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional
+
+SEGMENT_CACHE_DIR = os.getenv("SEGMENT_CACHE_DIR", "segment_cache")
+SEGMENT_CACHE_MAX_BYTES = int(os.getenv("SEGMENT_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file's content, streamed in 1 MB chunks."""
+    stat = os.stat(path)
+    return _hash_file(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+# Memoized by (path, size, mtime) so unchanged files are read once; bounded, so
+# entries of deleted or evicted files age out
+@lru_cache(maxsize=1024)
+def _hash_file(path: str, size: int, mtime_ns: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class SegmentCache:
+    """Rendered segments on disk, evicted least recently used first past a byte budget."""
+
+    def __init__(self, directory: str = SEGMENT_CACHE_DIR, max_bytes: int = SEGMENT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "passthroughs": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        # Locks can't be pickled; media worker processes get a fresh one
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def record_export(self, report: Dict[str, Any]) -> None:
+        """Fold the counts of an export run in a worker process into this cache's counters."""
+        self.counters["hits"] += report.get("cached_segments", 0)
+        self.counters["misses"] += report.get("rendered_segments", 0)
+        self.counters["passthroughs"] += report.get("passthrough_segments", 0)
+        self.counters["evictions"] += report.get("evicted_segments", 0)
+
+    def key(self, src: str, start: float, end: float, settings: Dict[str, Any]) -> str:
+        parts = {
+            "source": file_hash(src),
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "settings": settings,
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp4")
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Return the cached segment path and mark it as recently used, or None."""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        return path
+
+    def store(self, key: str, rendered_path: str) -> str:
+        """
+        Move a freshly rendered segment into the cache and return its cached path.
+
+        The segment is usually rendered in a temp directory that may be on
+        another filesystem, so it is first moved (copied if need be) to a
+        partial file in the cache directory, then renamed into place.
+        """
+        path = self.path_for(key)
+        partial = os.path.join(self.directory, f".{key}.{os.getpid()}.partial")
+        shutil.move(rendered_path, partial)
+        os.replace(partial, path)
+        return path
+
+    def evict(self, keep: Iterable[str] = ()) -> int:
+        """Delete least recently used segments until the cache fits its budget."""
+        keep = {os.path.abspath(p) for p in keep}
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                # Skip partial files another process is still moving in
+                if not entry.is_file() or entry.name.startswith("."):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if os.path.abspath(path) in keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self.counters["evictions"] += removed
+            return removed
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self.counters)
+        files = [entry for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.startswith(".")]
+        stats["entries"] = len(files)
+        stats["bytes"] = sum(entry.stat().st_size for entry in files)
+        stats["max_bytes"] = self.max_bytes
+        return stats
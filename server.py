@@ -0,0 +1,96 @@
+"""
+Production launcher: the app on several uvicorn worker processes with tuned settings.
+
+`python main.py` is the development server (one worker, auto-reload). This
+runs the app for real:
+    - WEB_WORKERS processes (default: one per CPU) share one listening socket
+    - uvloop and httptools are used when installed (uvicorn[standard])
+    - uvicorn's access log is off: the app writes its own access line per
+      request (method, route, status, elapsed time and request id; JSON with
+      LOG_FORMAT=json, off with ACCESS_LOG=0)
+    - keep-alive and the listen backlog are sized for running behind a proxy
+    - with more than one worker, state the workers must agree on (jobs, caches,
+      rate limit buckets) goes through the shared store at SHARED_STORE_PATH,
+      whose runtime state is cleared at launch
+    - MEDIA_WORKERS and EXPORT_WORKERS default to a share of the CPUs per
+      worker, so N web workers don't each start a full set of encoders
+
+Workers are never recycled after a number of requests: jobs run inside the
+worker that accepted them, and recycling would kill them mid-flight.
+
+Configuration (environment, or the matching flag):
+    HOST=0.0.0.0
+    PORT=8000
+    WEB_WORKERS=<cpus>
+    UVICORN_BACKLOG=2048
+    UVICORN_KEEPALIVE=30             seconds an idle keep-alive connection stays open
+    UVICORN_LIMIT_CONCURRENCY=       connections per worker before 503s (unset = unlimited)
+    UVICORN_GRACEFUL_TIMEOUT=30      seconds to finish requests on shutdown
+    FORWARDED_ALLOW_IPS=127.0.0.1    proxies trusted for X-Forwarded-* headers
+    SHARED_STORE_PATH=shared_state.db
+
+Usage:
+    python server.py
+    python server.py --workers 4 --port 8080
+"""
+
+import argparse
+import os
+
+import uvicorn
+
+from shared_store import SharedStore
+
+DEFAULT_SHARED_STORE_PATH = "shared_state.db"
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+def prepare_environment(workers: int) -> None:
+    """Environment the worker processes inherit: shared store and per-worker pool sizes."""
+    cpus = os.cpu_count() or 1
+    for name in ("MEDIA_WORKERS", "EXPORT_WORKERS"):
+        os.environ.setdefault(name, str(max(1, cpus // workers)))
+
+    if workers > 1:
+        os.environ.setdefault("SHARED_STORE_PATH", DEFAULT_SHARED_STORE_PATH)
+    if os.getenv("SHARED_STORE_PATH"):
+        # Jobs, leases and buckets from a previous launch belong to processes that are gone
+        SharedStore(os.environ["SHARED_STORE_PATH"]).reset()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=env_int("PORT", 8000))
+    parser.add_argument("--workers", type=int, default=env_int("WEB_WORKERS", os.cpu_count() or 1))
+    parser.add_argument("--backlog", type=int, default=env_int("UVICORN_BACKLOG", 2048))
+    parser.add_argument("--keepalive", type=int, default=env_int("UVICORN_KEEPALIVE", 30))
+    parser.add_argument("--limit-concurrency", type=int, default=env_int("UVICORN_LIMIT_CONCURRENCY", 0) or None)
+    parser.add_argument("--graceful-timeout", type=int, default=env_int("UVICORN_GRACEFUL_TIMEOUT", 30))
+    parser.add_argument("--log-level", default=os.getenv("UVICORN_LOG_LEVEL", "warning"))
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    prepare_environment(workers)
+    print(f"🚀 Serving on {args.host}:{args.port} with {workers} worker(s)"
+          f"{', shared store ' + os.environ['SHARED_STORE_PATH'] if os.getenv('SHARED_STORE_PATH') else ''}")
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keepalive,
+        limit_concurrency=args.limit_concurrency,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        server_header=False,
+        access_log=False,
+        log_level=args.log_level,
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Local shared state for running the app as several worker processes.
+
+With one worker, jobs, caches and rate limit buckets live in each module's own
+objects. With several, consecutive requests from one client can land on
+different workers, so state that every worker has to agree on also goes
+through a SQLite database on the local disk (WAL mode, so reads never wait for
+the writer):
+    - job snapshots, so GET /jobs/{job_id} and its event stream work from any
+      worker, and cancellation requests for jobs another worker is running
+    - generation cache entries and in-flight video jobs
+    - intent classifier results
+    - token buckets, so a quota is shared by all workers instead of multiplied by them
+    - leases, so singleton background work (startup backfill, retention) runs in one worker
+
+SDK clients and their connection pools, in-flight futures, fair queues,
+circuit breakers and counters stay per process.
+
+SQLite calls block, for up to SHARED_STORE_TIMEOUT seconds while another
+worker writes, so the event loop never makes them itself. Each process has a
+single store thread: `await store.call(...)` runs a method there, and
+`store.submit(...)` queues a write without waiting for it. One thread keeps
+a process's writes in order and lets its reads see them.
+
+The store is off unless SHARED_STORE_PATH is set. server.py sets it when it
+starts more than one worker.
+
+Configuration (environment):
+    SHARED_STORE_PATH=             database file; empty keeps all state in process
+    SHARED_STORE_TIMEOUT=5         seconds to wait for another worker's write
+
+Usage:
+    shared_store.put("jobs", job_id, snapshot, ttl=86400)
+    snapshot = shared_store.get("jobs", job_id)
+    snapshot = await shared_store.call(shared_store.get, "jobs", job_id)    # from the event loop
+    shared_store.submit(shared_store.delete, "jobs", job_id)                # write-behind
+    taken, tokens_left = shared_store.take_token("openrouter", rate=2.0, burst=20)
+    if shared_store.acquire_lease("retention", ttl=600):
+        ...
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from observability import log
+
+SHARED_STORE_PATH = os.getenv("SHARED_STORE_PATH", "")
+SHARED_STORE_TIMEOUT = float(os.getenv("SHARED_STORE_TIMEOUT", "5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS kv_updated ON kv (namespace, updated_at);
+CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at) WHERE expires_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Namespaces that only make sense for the processes that wrote them
+RUNTIME_NAMESPACES = ("jobs", "job_cancel", "inflight_jobs")
+
+class SharedStore:
+    """Namespaced JSON values with optional TTLs, token buckets and leases in one SQLite file."""
+
+    def __init__(self, path: str, timeout: float = SHARED_STORE_TIMEOUT):
+        self.path = path
+        self.owner = str(os.getpid())
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _thread(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared_store")
+        return self._executor
+
+    async def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a store method on the store thread and wait for its result without blocking the loop."""
+        return await asyncio.wrap_future(self._thread().submit(func, *args, **kwargs))
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """Queue a store write on the store thread; failures are logged, not raised."""
+        future = self._thread().submit(func, *args, **kwargs)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future: Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            log(f"⚠️ Shared store write failed: {future.exception()}", level="warning")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """A write transaction that takes the database lock up front, so read-modify-write is atomic."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?",
+                                     (namespace, key)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def put(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now, now + ttl if ttl else None),
+            )
+
+    def put_many(self, namespace: str, values: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """Write several values of a namespace in one transaction."""
+        if not values:
+            return
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                [(namespace, key, json.dumps(value), now, now + ttl if ttl else None) for key, value in values.items()],
+            )
+
+    def delete(self, namespace: str, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?",
+                                      (namespace, key)).rowcount > 0
+
+    def delete_if(self, namespace: str, key: str, expected: Any) -> bool:
+        """Delete a value only while it still equals `expected`."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            if row is None or json.loads(row[0]) != expected:
+                return False
+            conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+            return True
+
+    def items(self, namespace: str) -> List[Tuple[str, Any]]:
+        """Every live (key, value) in a namespace, most recently written first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM kv WHERE namespace = ? AND (expires_at IS NULL OR expires_at >= ?) "
+                "ORDER BY updated_at DESC", (namespace, time.time())).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def prune(self, namespace: str, keep: int) -> int:
+        """Delete expired values everywhere and all but the `keep` newest of a namespace."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM kv WHERE expires_at < ?", (time.time(),)).rowcount
+            removed += self._conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key NOT IN "
+                "(SELECT key FROM kv WHERE namespace = ? ORDER BY updated_at DESC LIMIT ?)",
+                (namespace, namespace, keep)).rowcount
+        return removed
+
+    def take_token(self, name: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """
+        Take one token from a shared bucket refilled at `rate` per second.
+
+        Returns:
+            Whether a token was taken, and the tokens left in the bucket
+        """
+        with self._transaction() as conn:
+            tokens = self._refill(conn, name, rate, burst)
+            if tokens >= 1:
+                conn.execute("UPDATE buckets SET tokens = ? WHERE name = ?", (tokens - 1, name))
+                return True, tokens - 1
+            return False, tokens
+
+    def give_back_token(self, name: str, rate: float, burst: int) -> None:
+        with self._transaction() as conn:
+            tokens = self._refill(conn, name, rate, burst)
+            conn.execute("UPDATE buckets SET tokens = ? WHERE name = ?", (min(burst, tokens + 1), name))
+
+    def _refill(self, conn: sqlite3.Connection, name: str, rate: float, burst: int) -> float:
+        """Bring a bucket up to date and return its tokens; a new bucket starts full."""
+        now = time.time()
+        row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        tokens = float(burst) if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+        conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, tokens, now))
+        return tokens
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        """Take or renew a named lease for this process; False while another live process holds it."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != self.owner and row[1] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                         (name, self.owner, now + ttl))
+            return True
+
+    def reset(self) -> None:
+        """Forget runtime state left by a previous launch: jobs, in-flight markers, buckets and leases."""
+        with self._transaction() as conn:
+            conn.execute(f"DELETE FROM kv WHERE namespace IN ({','.join('?' * len(RUNTIME_NAMESPACES))})",
+                         RUNTIME_NAMESPACES)
+            conn.execute("DELETE FROM buckets")
+            conn.execute("DELETE FROM leases")
+
+def open_shared_store(path: str = SHARED_STORE_PATH) -> Optional[SharedStore]:
+    """The shared store at path, or None when it is not configured."""
+    return SharedStore(path) if path else None
+
+# Set when the app runs as several workers; None keeps every module's state in process
+shared_store = open_shared_store()
@@ -10,6 +10,7 @@ const generatedVideo = document.getElementById('generated-video');
 const modeRadios = document.querySelectorAll('input[name="mode"]');
 const imageUploadSection = document.getElementById('image-upload-section');
 const imageUpload = document.getElementById('image-upload');
+const variantsSelect = document.getElementById('variants-select');
 
 // New elements for sidebar and unified display
 const mediaDisplay = document.getElementById('media-display');
@@ -20,6 +21,8 @@ const imagesGallery = document.getElementById('images-gallery');
 const videosGallery = document.getElementById('videos-gallery');
 const galleryLoading = document.getElementById('gallery-loading');
 const galleryEmpty = document.getElementById('gallery-empty');
+const galleryMoreBtn = document.getElementById('gallery-more-btn');
+let galleryCursor = null;
 
 // Video trimmer elements
 const videoTrimmer = document.getElementById('video-trimmer');
@@ -59,6 +62,8 @@ let trimStart = 0; // in seconds
 let trimEnd = 0; // in seconds
 let isPlayingTrimmed = false;
 let trimmedPlaybackInterval = null;
+let scrubIndex = null; // sprite sheet index of the displayed video, once its scrub previews are ready
+let pendingSeekTime = null; // handle position to seek to when a sprite-previewed drag ends
 let scenes = []; // array of { id, title, media: {type:'image'|'video', path, filename}, trimStart, trimEnd, duration }
 let activeSceneId = null;
 let playlist = [];
@@ -68,21 +73,31 @@ let recognition = null;
 let isListening = false;
 
 // Gallery management functions
-async function loadGalleryFiles() {
+// Pass append=true to fetch the next page instead of reloading from the top
+async function loadGalleryFiles(append = false) {
     try {
         galleryLoading.classList.remove('hidden');
         galleryEmpty.classList.add('hidden');
 
-        const response = await fetch('/list-files');
+        const params = new URLSearchParams({ limit: '50' });
+        if (append && galleryCursor) {
+            params.set('cursor', galleryCursor);
+        }
+
+        const response = await fetch(`/list-files?${params}`);
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
 
         const data = await response.json();
+        galleryCursor = data.next_cursor;
+        galleryMoreBtn.classList.toggle('hidden', !galleryCursor);
 
-        // Clear existing galleries
-        imagesGallery.innerHTML = '';
-        videosGallery.innerHTML = '';
+        // Clear existing galleries unless this is the next page
+        if (!append) {
+            imagesGallery.innerHTML = '';
+            videosGallery.innerHTML = '';
+        }
 
         // Populate images
         if (data.images && data.images.length > 0) {
@@ -101,7 +116,7 @@ async function loadGalleryFiles() {
         }
 
         // Show empty message if no files
-        if ((!data.images || data.images.length === 0) && (!data.videos || data.videos.length === 0)) {
+        if (imagesGallery.children.length === 0 && videosGallery.children.length === 0) {
             galleryEmpty.classList.remove('hidden');
         }
 
@@ -113,6 +128,8 @@ async function loadGalleryFiles() {
     }
 }
 
+galleryMoreBtn.addEventListener('click', () => loadGalleryFiles(true));
+
 function createGalleryItem(file, type) {
     const item = document.createElement('div');
     item.className = 'gallery-item bg-gray-700 rounded-lg p-2 flex items-center space-x-2';
@@ -120,20 +137,13 @@ function createGalleryItem(file, type) {
     item.dataset.type = type;
     item.dataset.filename = file.filename;
 
-    // Create thumbnail/preview
-    const preview = document.createElement(type === 'image' ? 'img' : 'video');
+    // Create thumbnail/preview from the server-side WebP renditions (poster frame for videos)
+    const preview = document.createElement('img');
     preview.className = 'w-12 h-12 object-cover rounded';
-    preview.src = file.path;
-
-    if (type === 'video') {
-        preview.muted = true;
-        preview.preload = 'metadata';
-        // Force video to show first frame as thumbnail
-        preview.currentTime = 0.1;
-        preview.addEventListener('loadeddata', function() {
-            this.currentTime = 0.1;
-        });
-    }
+    preview.src = `/thumbs/128${file.path}`;
+    preview.srcset = `/thumbs/128${file.path} 1x, /thumbs/256${file.path} 2x`;
+    preview.loading = 'lazy';
+    preview.alt = file.filename;
 
     // Create filename text
     const filename = document.createElement('span');
@@ -151,6 +161,35 @@ function createGalleryItem(file, type) {
     item.appendChild(filename);
     item.appendChild(icon);
 
+    // Pin button: pinned files are never removed by disk retention
+    const pin = document.createElement('button');
+    const setPinned = (pinned) => {
+        file.pinned = pinned;
+        pin.classList.toggle('pinned', pinned);
+        pin.title = pinned ? 'Pinned: kept when disk space is reclaimed (click to unpin)' : 'Pin to keep this file';
+    };
+    pin.className = 'pin-btn';
+    pin.textContent = '📌';
+    setPinned(Boolean(file.pinned));
+    pin.addEventListener('click', async (e) => {
+        e.stopPropagation();
+        e.preventDefault();
+        try {
+            const res = await fetch('/pin', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ path: file.path, pinned: !file.pinned })
+            });
+            if (!res.ok) throw new Error(`HTTP ${res.status}`);
+            setPinned((await res.json()).pinned);
+        } catch (err) {
+            console.error('pin error', err);
+            showStatus('Failed to pin file.', false);
+            setTimeout(() => hideStatus(), 2000);
+        }
+    });
+    item.appendChild(pin);
+
     // Delete button
     const del = document.createElement('button');
     del.className = 'delete-btn';
@@ -221,6 +260,8 @@ function displayFileInMainArea(file, type) {
     // Hide trimmer by default
     videoTrimmer.classList.add('hidden');
     stopTrimmedPlayback();
+    scrubIndex = null;
+    hideScrubFrame();
 
     // Show appropriate media
     if (type === 'image') {
@@ -229,6 +270,7 @@ function displayFileInMainArea(file, type) {
         downloadBtn.textContent = 'Download Image';
         generateVideoBtn.classList.remove('hidden');
     } else if (type === 'video') {
+        generatedVideo.poster = `/thumbs/poster${file.path}`;
         generatedVideo.src = file.path;
         generatedVideo.classList.remove('hidden');
         downloadBtn.textContent = 'Download Video';
@@ -236,6 +278,7 @@ function displayFileInMainArea(file, type) {
 
         // Initialize trimmer when video loads
         generatedVideo.addEventListener('loadedmetadata', initializeTrimmer, { once: true });
+        loadScrubPreviews(file);
     }
 
     // Show result container and download button
@@ -322,6 +365,56 @@ function updateTrimmerDisplay() {
     endTime.textContent = formatTime(trimEnd);
 }
 
+// Scrub previews: the trimmer plays a small short-GOP proxy and shows sprite
+// sheet frames while a handle is dragged, instead of seeking the full video
+const scrubPreview = document.createElement('div');
+scrubPreview.id = 'scrub-preview';
+scrubPreview.className = 'hidden';
+timelineContainer.parentElement.appendChild(scrubPreview);
+
+async function loadScrubPreviews(file) {
+    try {
+        const response = await fetch(`/scrub/index${file.path}`);
+        if (!response.ok) return;
+        const index = await response.json();
+        // The user may have moved on while the previews were rendering
+        if (!currentDisplayedFile || currentDisplayedFile.path !== file.path) return;
+
+        scrubIndex = { ...index, sprite: `/scrub/sprite${file.path}` };
+        new Image().src = scrubIndex.sprite;
+
+        // Swap the player to the proxy, keeping its position; downloads and exports still use the original
+        const position = generatedVideo.currentTime;
+        const wasPlaying = !generatedVideo.paused;
+        generatedVideo.addEventListener('loadedmetadata', () => {
+            generatedVideo.currentTime = position;
+            if (wasPlaying) generatedVideo.play();
+        }, { once: true });
+        generatedVideo.src = `/scrub/proxy${file.path}`;
+    } catch (error) {
+        console.error('Error loading scrub previews:', error);
+    }
+}
+
+function showScrubFrame(time) {
+    if (!scrubIndex || !videoDuration) return;
+    const index = Math.max(0, Math.min(scrubIndex.count - 1, Math.round(time / scrubIndex.interval)));
+    const column = index % scrubIndex.columns;
+    const row = Math.floor(index / scrubIndex.columns);
+
+    scrubPreview.style.width = `${scrubIndex.frame_width}px`;
+    scrubPreview.style.height = `${scrubIndex.frame_height}px`;
+    scrubPreview.style.backgroundImage = `url(${scrubIndex.sprite})`;
+    scrubPreview.style.backgroundPosition = `-${column * scrubIndex.frame_width}px -${row * scrubIndex.frame_height}px`;
+    scrubPreview.style.left = `${(time / videoDuration) * 100}%`;
+    scrubPreview.dataset.time = formatTime(time);
+    scrubPreview.classList.remove('hidden');
+}
+
+function hideScrubFrame() {
+    scrubPreview.classList.add('hidden');
+}
+
 function formatTime(seconds) {
     const mins = Math.floor(seconds / 60);
     const secs = Math.floor(seconds % 60);
@@ -373,6 +466,13 @@ function handleDrag(event) {
         }
     }
 
+    // With a sprite sheet, show the frame at the handle and seek the video once, when the drag ends
+    if (scrubIndex) {
+        showScrubFrame(seekTime);
+        pendingSeekTime = seekTime;
+        return;
+    }
+
     // Provide real-time feedback by seeking video to the handle position
     if (generatedVideo && !isNaN(seekTime) && seekTime >= 0 && seekTime <= videoDuration) {
         // Temporarily pause video to prevent conflicts during seeking
@@ -409,6 +509,11 @@ function stopDrag() {
 
     isDragging = false;
     timelineContainer.classList.remove('dragging');
+    hideScrubFrame();
+    if (pendingSeekTime !== null) {
+        generatedVideo.currentTime = pendingSeekTime;
+        pendingSeekTime = null;
+    }
 
     if (dragHandle) {
         dragHandle.classList.remove('trim-handle-active');
@@ -550,7 +655,11 @@ async function exportTrimmedVideo() {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
 
-        const data = await response.json();
+        // The trim runs as a background job; follow its progress
+        const job = await response.json();
+        const data = await waitForJob(job.job_id, (update) => {
+            showStatus(describeJobProgress(update, 'Exporting trimmed video'), true);
+        });
 
         // Display the trimmed video
         displayFileInMainArea({
@@ -647,6 +756,18 @@ generateBtn.addEventListener('click', async function() {
 
     generateBtn.disabled = true;
     generateBtn.textContent = 'Generating...';
+
+    const variants = parseInt(variantsSelect.value, 10) || 1;
+    if (variants > 1) {
+        try {
+            await generateVariants(prompt, selectedMode, variants);
+        } finally {
+            generateBtn.disabled = false;
+            generateBtn.textContent = 'Generate';
+        }
+        return;
+    }
+
     showStatus('Generating your image...', true);
 
     try {
@@ -691,6 +812,68 @@ generateBtn.addEventListener('click', async function() {
     }
 });
 
+// Generate several variants through /generate-batch, showing each image as soon as it streams in
+async function generateVariants(prompt, mode, variants) {
+    showStatus(`Generating ${variants} variants...`, true);
+    let ready = 0;
+    let failed = 0;
+
+    try {
+        const response = await fetch('/generate-batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                prompts: [prompt],
+                variants,
+                mode,
+                current_image: currentUploadedImagePath
+            })
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        // Results arrive as newline-delimited JSON
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const item = JSON.parse(line);
+                if (item.image_path) {
+                    ready += 1;
+                    const file = { path: item.image_path, filename: item.image_path.split('/').pop() };
+                    // Show the first variant right away; the rest go into the gallery
+                    if (ready === 1) {
+                        displayFileInMainArea(file, 'image');
+                    }
+                    imagesGallery.prepend(createGalleryItem(file, 'image'));
+                    galleryEmpty.classList.add('hidden');
+                    showStatus(`${ready}/${variants} variants ready...`, true);
+                } else if (item.error) {
+                    failed += 1;
+                    console.error('Variant failed:', item.error);
+                }
+            }
+        }
+
+        loadGalleryFiles();
+        showStatus(failed ? `${ready} variants ready, ${failed} failed.` : `${ready} variants ready!`, false);
+        setTimeout(() => hideStatus(), 3000);
+
+    } catch (error) {
+        console.error('Error generating variants:', error);
+        showStatus('Failed to generate variants. Please try again.', false);
+    }
+}
+
 // Mode change handler
 modeRadios.forEach(radio => {
     radio.addEventListener('change', function() {
@@ -726,6 +909,12 @@ imageUpload.addEventListener('change', async function(e) {
                 body: formData
             });
 
+            if (response.status === 400 || response.status === 413) {
+                // Rejected upload (unsupported format or too large): show the server's reason
+                const error = await response.json().catch(() => ({}));
+                showStatus(error.detail || 'Image was rejected.', false);
+                return;
+            }
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
@@ -783,7 +972,11 @@ generateVideoBtn.addEventListener('click', async function() {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
 
-        const data = await response.json();
+        // The server queues a job; poll it until the video is ready
+        const job = await response.json();
+        const data = await waitForJob(job.job_id, (update) => {
+            showStatus(describeJobProgress(update, 'Generating video'), true);
+        });
 
         // Display the generated video in the unified display
         displayFileInMainArea({
@@ -814,6 +1007,68 @@ generateVideoBtn.addEventListener('click', async function() {
 });
 
 
+// Follow a background job over server-sent events until it finishes.
+// onProgress receives the job state on every update; falls back to polling if SSE isn't available.
+function waitForJob(jobId, onProgress = null, intervalMs = 5000) {
+    if (!window.EventSource) {
+        return pollJob(jobId, onProgress, intervalMs);
+    }
+
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`/jobs/${jobId}/events`);
+        let settled = false;
+
+        source.addEventListener('progress', (e) => {
+            if (onProgress) onProgress(JSON.parse(e.data));
+        });
+        source.addEventListener('done', (e) => {
+            settled = true;
+            source.close();
+            const job = JSON.parse(e.data);
+            if (job.status === 'succeeded') resolve(job);
+            else reject(new Error(job.error || 'Job failed'));
+        });
+        source.onerror = () => {
+            // EventSource reconnects by itself; only give up on it once it has closed
+            if (!settled && source.readyState === EventSource.CLOSED) {
+                pollJob(jobId, onProgress, intervalMs).then(resolve, reject);
+            }
+        };
+    });
+}
+
+async function pollJob(jobId, onProgress = null, intervalMs = 5000) {
+    while (true) {
+        const res = await fetch(`/jobs/${jobId}`);
+        if (!res.ok) {
+            throw new Error(`HTTP error! status: ${res.status}`);
+        }
+        const job = await res.json();
+        if (job.status === 'succeeded') return job;
+        if (job.status === 'failed') throw new Error(job.error || 'Job failed');
+        if (onProgress) onProgress(job);
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
+// Status line for a job update: queue position, Veo state or encode percentage
+function describeJobProgress(job, label) {
+    const progress = job.progress || {};
+    if (progress.stage === 'queued' && progress.queue_position) {
+        return `${label}: waiting in queue (position ${progress.queue_position})...`;
+    }
+    if (progress.stage === 'rate_limited') {
+        return `${label}: waiting for the model's rate limit...`;
+    }
+    if (progress.veo_state && progress.veo_state !== 'done') {
+        return `${label}: generating with Veo (${progress.elapsed || 0}s elapsed)...`;
+    }
+    if (typeof progress.percent === 'number') {
+        return `${label}: ${progress.stage || 'working'} ${Math.round(progress.percent)}%`;
+    }
+    return `${label}...`;
+}
+
 // Enter key handler
 promptInput.addEventListener('keypress', function(e) {
     if (e.key === 'Enter') {
@@ -922,13 +1177,11 @@ function updateScenesStrip() {
         const card = document.createElement('div');
         card.className = `scene-card ${scene.id === activeSceneId ? 'active' : ''}`;
 
-        const thumb = document.createElement(scene.media && scene.media.type === 'image' ? 'img' : 'video');
+        const thumb = document.createElement('img');
         thumb.className = 'scene-thumb';
         if (scene.media && scene.media.path) {
-            thumb.src = scene.media.path;
-            if (scene.media.type === 'video') {
-                thumb.muted = true; thumb.preload = 'metadata'; thumb.controls = false;
-            }
+            thumb.src = `/thumbs/256${scene.media.path}`;
+            thumb.srcset = `/thumbs/256${scene.media.path} 1x, /thumbs/512${scene.media.path} 2x`;
         } else {
             // placeholder
             const placeholder = document.createElement('div');
@@ -1060,7 +1313,10 @@ async function exportFullVideo() {
             body: JSON.stringify({ scenes: scenesPayload })
         });
         if (!res.ok) throw new Error(`HTTP ${res.status}`);
-        const data = await res.json();
+        const job = await res.json();
+        const data = await waitForJob(job.job_id, (update) => {
+            showStatus(describeJobProgress(update, 'Exporting full video'), true);
+        });
 
         // Show the exported video in the main viewer
         displayFileInMainArea({ path: data.video_path, filename: data.video_path.split('/').pop(), type: 'video' }, 'video');
@@ -1084,6 +1340,14 @@ function initializeTrimmerEventListeners() {
     // Timeline click
     timelineContainer.addEventListener('click', handleTimelineClick);
 
+    // Hovering the timeline previews the frame under the pointer
+    timelineContainer.addEventListener('mousemove', (e) => {
+        if (!isDragging) showScrubFrame(getMousePosition(e));
+    });
+    timelineContainer.addEventListener('mouseleave', () => {
+        if (!isDragging) hideScrubFrame();
+    });
+
     // Trimmer controls
     playTrimmedBtn.addEventListener('click', playTrimmedVideo);
     resetTrimBtn.addEventListener('click', resetTrimmer);
@@ -0,0 +1,137 @@
+"""
+Streaming, size-capped image uploads.
+
+Uploads are copied to disk in fixed-size chunks, so peak memory per upload is
+one chunk whatever the file size, and the copy stops as soon as the size cap
+is exceeded. The real format comes from the file's magic bytes, not the
+client's content type or filename, and decides the stored extension. Images
+are opened once, which records their dimensions and, when they are larger
+than the editing models need, downscales them in place.
+
+Configuration (environment):
+    UPLOAD_MAX_BYTES=20971520     largest accepted upload (413 past this)
+    UPLOAD_CHUNK_SIZE=1048576     bytes read and written per chunk
+    UPLOAD_MAX_PIXELS=50000000    largest accepted image area (decompression bomb guard)
+    UPLOAD_MAX_DIMENSION=2048     longest edge kept for editing; 0 disables downscaling
+
+Usage:
+    upload = await save_upload(file, "uploaded_images")
+    upload["path"], upload["width"], upload["height"]
+"""
+
+import asyncio
+import os
+import uuid
+from typing import Any, Dict, Optional
+
+from fastapi import UploadFile
+from PIL import Image
+
+from media_serving import sniff_content_type
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", "50000000"))
+UPLOAD_MAX_DIMENSION = int(os.getenv("UPLOAD_MAX_DIMENSION", "2048"))
+
+# Accepted formats: sniffed content type -> (stored extension, PIL save format)
+UPLOAD_FORMATS = {
+    "image/png": (".png", "PNG"),
+    "image/jpeg": (".jpg", "JPEG"),
+    "image/webp": (".webp", "WEBP"),
+    "image/gif": (".gif", "GIF"),
+}
+
+class UploadError(Exception):
+    """Raised when an upload is rejected; status_code is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def finalize_upload(tmp_path: str, final_path: str, save_format: str,
+                    max_dimension: int = UPLOAD_MAX_DIMENSION) -> Dict[str, Any]:
+    """
+    Read dimensions, downscale if needed and move the upload into place. Runs in a worker thread.
+
+    Returns:
+        width, height and whether the image was downscaled
+    """
+    with Image.open(tmp_path) as image:
+        width, height = image.size
+        if width * height > UPLOAD_MAX_PIXELS:
+            raise UploadError(f"Image is too large ({width}x{height})", status_code=413)
+
+        downscaled = False
+        # Animated GIFs are kept as they are
+        if max_dimension and max(width, height) > max_dimension and not getattr(image, "is_animated", False):
+            # JPEG can decode straight at a reduced scale
+            image.draft(image.mode, (max_dimension, max_dimension))
+            resized = image.copy() if image.mode in ("RGB", "RGBA", "L", "LA") else image.convert("RGBA")
+            resized.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            save_kwargs = {"quality": 95} if save_format in ("JPEG", "WEBP") else {}
+            if save_format == "JPEG" and resized.mode not in ("RGB", "L"):
+                resized = resized.convert("RGB")
+            resized.save(tmp_path, format=save_format, **save_kwargs)
+            width, height = resized.size
+            downscaled = True
+
+    os.replace(tmp_path, final_path)
+    return {"width": width, "height": height, "downscaled": downscaled}
+
+async def save_upload(
+    file: UploadFile,
+    directory: str,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """
+    Stream an uploaded image to disk under a new uuid filename.
+
+    Args:
+        file: The multipart upload
+        directory: Destination directory, e.g. "uploaded_images"
+        max_bytes: Size cap; the upload is rejected with 413 past it
+
+    Returns:
+        path, filename, content_type, size, width, height and downscaled
+    """
+    tmp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.part")
+    size = 0
+    content_type: Optional[str] = None
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                if content_type is None:
+                    content_type = sniff_content_type(chunk[:16])
+                    if content_type not in UPLOAD_FORMATS:
+                        raise UploadError("File must be a PNG, JPEG, WebP or GIF image")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadError(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit", status_code=413)
+                await asyncio.to_thread(out.write, chunk)
+
+        if content_type is None:
+            raise UploadError("Uploaded file is empty")
+
+        extension, save_format = UPLOAD_FORMATS[content_type]
+        filename = f"{uuid.uuid4()}{extension}"
+        final_path = os.path.join(directory, filename)
+        try:
+            info = await asyncio.to_thread(finalize_upload, tmp_path, final_path, save_format)
+        except (OSError, Image.DecompressionBombError) as e:
+            raise UploadError(f"Could not read image: {e}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return {
+        "path": final_path,
+        "filename": filename,
+        "content_type": content_type,
+        "size": os.path.getsize(final_path),
+        **info,
+    }
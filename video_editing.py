@@ -0,0 +1,548 @@
+"""
+ffmpeg-based editing engine for trimming and exporting videos.
+
+Uses the ffmpeg binary bundled with imageio-ffmpeg, so no system install is
+needed. Trim modes:
+    fast     Smart cut: whole GOPs between the cut points are stream-copied and
+             only the partial GOPs at each cut are re-encoded. Frame accurate and
+             usually a fraction of the cost of a full encode.
+    precise  Full decode and re-encode of the range with MoviePy. Also used as
+             the fallback whenever a smart cut isn't possible.
+
+Sequence export has two paths:
+    concat   All sources share codec parameters (always true for Veo output):
+             each scene is smart-cut and the parts are joined with the concat
+             demuxer, with no re-encode of the joined video.
+    render   Otherwise every scene is rendered to a common format in parallel
+             across a process pool, then the parts are joined the same way.
+
+precut_segment smart-cuts one scene into the segment cache as soon as its clip
+exists, so a later concat export of the sequence only has to join the parts.
+
+Long-running entry points take an optional progress(fraction, stage) callback,
+fed from ffmpeg's -progress output, MoviePy's frame counter or finished
+export segments.
+
+Usage:
+    mode_used = trim_video_file("in.mp4", 1.5, 6.0, "out.mp4", mode="fast")
+    report = export_sequence_file([("a.mp4", 0, 4), ("b.mp4", 1, 3)], "out.mp4", cache=segment_cache)
+"""
+
+import os
+import re
+import subprocess
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from observability import log
+
+if TYPE_CHECKING:
+    from segment_cache import SegmentCache
+
+TRIM_MODES = ("fast", "precise")
+
+# Encoder settings for the re-encoded partial GOPs
+SMART_CUT_PRESET = os.getenv("SMART_CUT_PRESET", "veryfast")
+SMART_CUT_CRF = os.getenv("SMART_CUT_CRF", "18")
+
+# Worker processes for rendering mismatched export segments
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(os.cpu_count() or 2)))
+
+# Render target when export segments need normalizing
+EXPORT_DEFAULT_FPS = "24"
+EXPORT_AUDIO_RATE = "48000"
+
+# Segment cache settings of smart-cut export segments
+SMART_CUT_SETTINGS = {"mode": "smart_cut", "preset": SMART_CUT_PRESET, "crf": SMART_CUT_CRF}
+
+# Cut points closer than this to a keyframe snap onto it (seconds)
+KEYFRAME_TOLERANCE = 0.01
+
+# x264 profile names as printed by ffmpeg, mapped to -profile:v values
+H264_PROFILES = {
+    "constrained baseline": "baseline",
+    "baseline": "baseline",
+    "main": "main",
+    "high": "high",
+}
+
+# progress(fraction done in [0, 1], stage name)
+ProgressCallback = Callable[[float, str], None]
+
+class VideoEditingError(Exception):
+    """Raised when an ffmpeg or MoviePy editing step fails."""
+
+@dataclass
+class StreamInfo:
+    duration: float
+    video_codec: Optional[str] = None
+    profile: Optional[str] = None
+    pix_fmt: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[str] = None
+    timescale: Optional[str] = None
+    audio_codec: Optional[str] = None
+    sample_rate: Optional[int] = None
+    channels: Optional[str] = None
+
+    def concat_key(self) -> Tuple:
+        """Parameters that must match for segments to be joined without re-encoding."""
+        return (self.video_codec, self.profile, self.pix_fmt, self.width, self.height, self.fps,
+                self.timescale, self.audio_codec, self.sample_rate, self.channels)
+
+_ffmpeg_exe = None
+
+def get_ffmpeg_exe() -> str:
+    """Locate the bundled ffmpeg binary once."""
+    global _ffmpeg_exe
+    if _ffmpeg_exe is None:
+        try:
+            import imageio_ffmpeg
+        except ImportError:
+            raise VideoEditingError("Video editing requires imageio-ffmpeg. Please install with: pip install imageio-ffmpeg")
+        _ffmpeg_exe = imageio_ffmpeg.get_ffmpeg_exe()
+    return _ffmpeg_exe
+
+def run_ffmpeg(args: List[str], check: bool = True, progress: Optional[Callable[[float], None]] = None,
+               duration: Optional[float] = None) -> str:
+    """
+    Run ffmpeg with the given arguments and return its stderr output.
+
+    With progress and the expected output duration, progress(fraction) is
+    called as ffmpeg reports its output position.
+    """
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-nostdin", "-y"] + args
+    if progress is None or not duration:
+        proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace")
+        returncode, stderr = proc.returncode, proc.stderr
+    else:
+        # Progress lines come on stdout; stderr goes to a file so neither pipe can fill up and block
+        cmd[1:1] = ["-progress", "pipe:1", "-nostats"]
+        with tempfile.TemporaryFile(mode="w+", errors="replace") as stderr_file:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, text=True, errors="replace")
+            for line in proc.stdout:
+                key, _, value = line.strip().partition("=")
+                # out_time_us is in microseconds (out_time_ms is too, despite its name)
+                if key == "out_time_us" and value.isdigit():
+                    progress(min(1.0, int(value) / 1e6 / duration))
+            returncode = proc.wait()
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+    if check and returncode != 0:
+        tail = "\n".join(stderr.strip().splitlines()[-5:])
+        raise VideoEditingError(f"ffmpeg failed ({returncode}): {tail}")
+    return stderr
+
+def probe(path: str) -> StreamInfo:
+    """Read duration and stream parameters from ffmpeg's input banner."""
+    output = run_ffmpeg(["-i", path], check=False)
+
+    duration_match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", output)
+    if not duration_match:
+        raise VideoEditingError(f"Could not read video duration: {path}")
+    hours, minutes, seconds = duration_match.groups()
+    info = StreamInfo(duration=int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+
+    video_line = re.search(r"Stream #\S+.*?: Video: (.*)", output)
+    if video_line:
+        line = video_line.group(1)
+        codec = re.match(r"(\w+)(?: \(([^)]*)\))?", line)
+        info.video_codec = codec.group(1)
+        info.profile = codec.group(2)
+        pix_fmt = re.search(r", (yuv\w+|rgb\w+|gray\w*|nv12)", line)
+        info.pix_fmt = pix_fmt.group(1) if pix_fmt else None
+        size = re.search(r", (\d{2,5})x(\d{2,5})", line)
+        if size:
+            info.width, info.height = int(size.group(1)), int(size.group(2))
+        fps = re.search(r", ([\d.]+(?:k)?) fps", line)
+        info.fps = fps.group(1) if fps else None
+        timescale = re.search(r", ([\d.]+(?:k)?) tbn", line)
+        info.timescale = timescale.group(1).replace("k", "000") if timescale else None
+
+    audio_line = re.search(r"Stream #\S+.*?: Audio: (.*)", output)
+    if audio_line:
+        line = audio_line.group(1)
+        info.audio_codec = re.match(r"(\w+)", line).group(1)
+        sample_rate = re.search(r"(\d+) Hz", line)
+        info.sample_rate = int(sample_rate.group(1)) if sample_rate else None
+        channels = re.search(r"Hz, ([^,]+)", line)
+        info.channels = channels.group(1) if channels else None
+
+    return info
+
+def keyframe_times(path: str) -> List[float]:
+    """List keyframe timestamps by decoding only the keyframes."""
+    output = run_ffmpeg(["-skip_frame", "nokey", "-i", path, "-map", "0:v:0", "-an",
+                         "-vf", "showinfo", "-f", "null", "-"])
+    return sorted(float(t) for t in re.findall(r"pts_time:(-?[\d.]+)", output))
+
+def plan_smart_cut(keyframes: List[float], start: float, end: float) -> List[Tuple[str, float, float]]:
+    """
+    Split [start, end) into ("encode" | "copy", from, to) segments.
+
+    Whole GOPs between the first keyframe at/after start and the last keyframe
+    at/before end are copied; the partial GOPs before and after are encoded.
+    """
+    def snap(t: float) -> float:
+        for k in keyframes:
+            if abs(k - t) <= KEYFRAME_TOLERANCE:
+                return k
+        return t
+
+    start, end = snap(start), snap(end)
+    inner = [k for k in keyframes if start <= k <= end]
+    if len(inner) < 2:
+        # No complete GOP inside the range
+        return [("encode", start, end)]
+
+    first, last = inner[0], inner[-1]
+    segments = []
+    if first > start:
+        segments.append(("encode", start, first))
+    segments.append(("copy", first, last))
+    if end > last:
+        segments.append(("encode", last, end))
+    return segments
+
+def sub_progress(progress: Optional[ProgressCallback], base: float, weight: float,
+                 stage: str) -> Optional[Callable[[float], None]]:
+    """A progress(fraction) callback for one step that fills [base, base + weight] of progress, or None."""
+    if progress is None:
+        return None
+    return lambda fraction: progress(base + fraction * weight, stage)
+
+def smart_trim(src: str, start: float, end: float, out_path: str, info: Optional[StreamInfo] = None,
+               progress: Optional[ProgressCallback] = None) -> List[Tuple[str, float, float]]:
+    """
+    Frame-accurate trim that re-encodes only the partial GOPs at the cut points.
+
+    Returns:
+        The segment plan that was executed
+    """
+    info = info or probe(src)
+    if info.video_codec != "h264" or not info.pix_fmt or not info.fps:
+        raise VideoEditingError(f"Smart cut needs a constant frame rate h264 source, got {info.video_codec}")
+    fps = float(info.fps.replace("k", "000"))
+
+    plan = plan_smart_cut(keyframe_times(src), start, end)
+
+    # Re-encoded parts must match the copied ones closely enough to concat without re-encoding
+    encode_args = ["-c:v", "libx264", "-preset", SMART_CUT_PRESET, "-crf", SMART_CUT_CRF,
+                   "-pix_fmt", info.pix_fmt, "-r", info.fps]
+    profile = H264_PROFILES.get((info.profile or "").lower())
+    if profile:
+        encode_args += ["-profile:v", profile]
+    if info.timescale:
+        encode_args += ["-video_track_timescale", info.timescale]
+
+    # Progress is weighted by time: encoded parts dominate, copied ones are nearly free
+    weights = [(seg_end - seg_start) * (1.0 if action == "encode" else 0.1) for action, seg_start, seg_end in plan]
+    total_weight = (sum(weights) or 1.0) / 0.95
+    done_weight = 0.0
+
+    with tempfile.TemporaryDirectory(prefix="trim_") as workdir:
+        parts = []
+        for index, (action, seg_start, seg_end) in enumerate(plan):
+            part = os.path.join(workdir, f"part_{index}.mp4")
+            if action == "copy":
+                # Limit by frame count: -t is checked in decode order and would let
+                # frames past the next keyframe through
+                frames = max(1, round((seg_end - seg_start) * fps))
+                codec_args = ["-frames:v", str(frames), "-c:v", "copy"]
+            else:
+                codec_args = ["-t", f"{seg_end - seg_start:.6f}"] + encode_args
+
+            part_progress = sub_progress(progress, done_weight / total_weight, weights[index] / total_weight,
+                                         f"{action} part {index + 1}/{len(plan)}")
+            run_ffmpeg(["-ss", f"{seg_start:.6f}", "-i", src, "-map", "0:v:0", "-an"] + codec_args + [part],
+                       progress=part_progress, duration=seg_end - seg_start)
+            done_weight += weights[index]
+            parts.append(part)
+
+        if progress is not None:
+            progress(0.95, "joining")
+
+        list_path = os.path.join(workdir, "parts.txt")
+        with open(list_path, "w") as f:
+            for part in parts:
+                f.write(f"file '{part}'\n")
+
+        # Join the video parts without re-encoding and add the cut audio track
+        args = ["-f", "concat", "-safe", "0", "-i", list_path]
+        if info.audio_codec:
+            args += ["-ss", f"{start:.6f}", "-t", f"{end - start:.6f}", "-i", src,
+                     "-map", "0:v:0", "-map", "1:a:0", "-c:a", "aac", "-b:a", "192k"]
+        else:
+            args += ["-map", "0:v:0"]
+        run_ffmpeg(args + ["-c:v", "copy", "-movflags", "+faststart", out_path])
+
+    return plan
+
+def moviepy_logger(progress: Optional[ProgressCallback]):
+    """A proglog logger that forwards MoviePy's frame counter to progress, or None."""
+    if progress is None:
+        return None
+    from proglog import ProgressBarLogger
+
+    class FrameProgressLogger(ProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            # "t" counts video frames written; the "chunk" bar is the audio pass
+            total = self.bars[bar].get("total")
+            if bar == "t" and attr == "index" and total:
+                progress(min(1.0, value / total), "encoding")
+
+    return FrameProgressLogger()
+
+def reencode_trim(src: str, start: float, end: float, out_path: str,
+                  progress: Optional[ProgressCallback] = None) -> None:
+    """Trim with a full MoviePy decode and libx264/aac re-encode."""
+    # Import moviepy here to avoid import errors if not installed
+    try:
+        from moviepy.editor import VideoFileClip
+    except ImportError:
+        raise VideoEditingError("Video trimming requires moviepy. Please install with: pip install moviepy")
+
+    video_clip = VideoFileClip(src)
+    trimmed_clip = None
+    try:
+        trimmed_clip = video_clip.subclip(start, end)
+        trimmed_clip.write_videofile(
+            out_path,
+            codec="libx264",
+            audio_codec="aac",
+            temp_audiofile=os.path.join(tempfile.gettempdir(), f"temp_audio_{uuid.uuid4()}.m4a"),
+            remove_temp=True,
+            verbose=False,
+            logger=moviepy_logger(progress)
+        )
+    finally:
+        # Close the clips to free resources
+        if trimmed_clip is not None:
+            trimmed_clip.close()
+        video_clip.close()
+
+def trim_video_file(src: str, start: float, end: float, out_path: str, mode: str = "fast",
+                    progress: Optional[ProgressCallback] = None) -> str:
+    """
+    Trim src to [start, end) into out_path.
+
+    Args:
+        src: Source video path
+        start: Start time in seconds
+        end: End time in seconds
+        out_path: Destination .mp4 path
+        mode: "fast" for a smart cut, "precise" for a full re-encode
+        progress: Optional progress(fraction, stage) callback
+
+    Returns:
+        The mode that actually produced the file ("fast" or "precise")
+    """
+    if mode not in TRIM_MODES:
+        raise ValueError(f"Unsupported trim mode: {mode}. Use 'fast' or 'precise'")
+
+    info = probe(src)
+    start = max(0.0, min(start, info.duration))
+    end = max(start, min(end, info.duration))
+    if end <= start:
+        raise ValueError("End time must be after start time")
+
+    if mode == "fast":
+        try:
+            smart_trim(src, start, end, out_path, info, progress)
+            return "fast"
+        except VideoEditingError as e:
+            log(f"Smart cut failed, falling back to full re-encode: {e}", level="warning")
+
+    reencode_trim(src, start, end, out_path, progress)
+    return "precise"
+
+def concat_files(parts: List[str], out_path: str) -> None:
+    """Join compatible MP4 files with the concat demuxer, without re-encoding."""
+    with tempfile.TemporaryDirectory(prefix="concat_") as workdir:
+        list_path = os.path.join(workdir, "parts.txt")
+        with open(list_path, "w") as f:
+            for part in parts:
+                f.write(f"file '{os.path.abspath(part)}'\n")
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-map", "0",
+                    "-c", "copy", "-movflags", "+faststart", out_path])
+
+def cut_segment(src: str, start: float, end: float, out_path: str) -> str:
+    """Smart-cut one export segment (runs in a worker process)."""
+    smart_trim(src, start, end, out_path)
+    return out_path
+
+def covers_whole_file(start: float, end: float, duration: float) -> bool:
+    return start <= KEYFRAME_TOLERANCE and end >= duration - KEYFRAME_TOLERANCE
+
+def render_segment(src: str, start: float, end: float, out_path: str, target: Dict[str, Any]) -> str:
+    """Re-encode one export segment to the common target format (runs in a worker process)."""
+    width, height = target["width"], target["height"]
+    video_filter = (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                    f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={target['fps']},format=yuv420p")
+    duration = f"{end - start:.6f}"
+
+    args = ["-ss", f"{start:.6f}", "-t", duration, "-i", src]
+    if target["has_audio"].get(src, False):
+        audio_map = "0:a:0"
+    else:
+        # Give silent scenes a track so every segment has the same streams
+        args += ["-f", "lavfi", "-t", duration, "-i", f"anullsrc=r={EXPORT_AUDIO_RATE}:cl=stereo"]
+        audio_map = "1:a:0"
+
+    run_ffmpeg(args + ["-map", "0:v:0", "-map", audio_map, "-vf", video_filter,
+                       "-c:v", "libx264", "-preset", SMART_CUT_PRESET, "-crf", SMART_CUT_CRF,
+                       "-video_track_timescale", "12288",
+                       "-c:a", "aac", "-b:a", "192k", "-ar", EXPORT_AUDIO_RATE, "-ac", "2",
+                       out_path])
+    return out_path
+
+def precut_segment(src: str, start: float, end: float, cache: "SegmentCache",
+                   progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """
+    Smart-cut one scene into the segment cache ahead of its export.
+
+    The segment is stored under the key a concat export of the same range
+    looks up, so the export later only has to join the parts. Scenes that
+    keep the whole file need no cut.
+
+    Returns:
+        {"segment": cached path or None for a whole file, "cached": whether it was already there}
+    """
+    info = probe(src)
+    start = max(0.0, min(start, info.duration))
+    end = max(start, min(end, info.duration))
+    if end <= start:
+        raise ValueError("End time must be after start time")
+    if covers_whole_file(start, end, info.duration):
+        return {"segment": None, "cached": True}
+
+    key = cache.key(src, start, end, SMART_CUT_SETTINGS)
+    cached = cache.lookup(key)
+    if cached is not None:
+        return {"segment": cached, "cached": True}
+
+    with tempfile.TemporaryDirectory(prefix="precut_") as workdir:
+        part = os.path.join(workdir, "segment.mp4")
+        smart_trim(src, start, end, part, info, progress)
+        return {"segment": cache.store(key, part), "cached": False}
+
+def export_sequence_file(
+    scenes: List[Tuple[str, float, float]],
+    out_path: str,
+    max_workers: int = EXPORT_WORKERS,
+    cache: Optional["SegmentCache"] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """
+    Export scenes (path, start, end) as one video.
+
+    Args:
+        scenes: Source paths with the time range to keep from each
+        out_path: Destination .mp4 path
+        max_workers: Process pool size for cutting or rendering segments
+        cache: Optional SegmentCache; segments found there are not rendered again
+        progress: Optional progress(fraction, stage) callback, advanced per finished segment
+
+    Returns:
+        A report with the path taken ("concat" or "render"), the number of
+        segments, how many came from the cache, were rendered or were whole
+        files used as is, how many cached segments were evicted, and per-stage
+        timings in seconds
+    """
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    infos = {src: probe(src) for src in {src for src, _, _ in scenes}}
+    segments = []
+    for src, start, end in scenes:
+        duration = infos[src].duration
+        start = max(0.0, min(start, duration))
+        end = max(start, min(end, duration))
+        if end > start:
+            segments.append((src, start, end))
+    if not segments:
+        raise ValueError("No valid scenes to export")
+    timings["probe"] = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory(prefix="export_") as workdir:
+        stage = time.perf_counter()
+        compatible = len({infos[src].concat_key() for src, _, _ in segments}) == 1
+        if compatible and infos[segments[0][0]].video_codec == "h264":
+            path = "concat"
+            target = None
+        else:
+            path = "render"
+            first = infos[segments[0][0]]
+            target = {
+                "width": first.width or 1280,
+                "height": first.height or 720,
+                "fps": first.fps or EXPORT_DEFAULT_FPS,
+                "has_audio": {src: info.audio_codec is not None for src, info in infos.items()},
+            }
+
+        parts: List[Optional[str]] = [None] * len(segments)
+        pending = []
+        passthrough = 0
+        for index, (src, start, end) in enumerate(segments):
+            if path == "concat" and covers_whole_file(start, end, infos[src].duration):
+                parts[index] = src
+                passthrough += 1
+                continue
+
+            key = None
+            if cache is not None:
+                if path == "concat":
+                    settings = SMART_CUT_SETTINGS
+                else:
+                    settings = {"mode": "render", "preset": SMART_CUT_PRESET, "crf": SMART_CUT_CRF,
+                                "width": target["width"], "height": target["height"], "fps": target["fps"],
+                                "audio": target["has_audio"][src]}
+                key = cache.key(src, start, end, settings)
+                parts[index] = cache.lookup(key)
+                if parts[index] is not None:
+                    continue
+
+            part = os.path.join(workdir, f"segment_{index}.mp4")
+            if path == "concat":
+                pending.append((index, key, cut_segment, (src, start, end, part)))
+            else:
+                pending.append((index, key, render_segment, (src, start, end, part, target)))
+
+        # Segments are independent, so cut or render them across a process pool
+        if pending:
+            if progress is not None:
+                progress(0.0, f"{path}: 0/{len(pending)} segments")
+            with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as pool:
+                futures = {pool.submit(func, *args): (index, key) for index, key, func, args in pending}
+                for finished, future in enumerate(as_completed(futures), 1):
+                    index, key = futures[future]
+                    rendered = future.result()
+                    parts[index] = cache.store(key, rendered) if cache is not None else rendered
+                    if progress is not None:
+                        progress(0.95 * finished / len(pending), f"{path}: {finished}/{len(pending)} segments")
+        timings["segments"] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        if progress is not None:
+            progress(0.95, "joining")
+        concat_files(parts, out_path)
+        timings["concat"] = time.perf_counter() - stage
+
+    evicted = cache.evict(keep=parts) if cache is not None else 0
+
+    timings["total"] = time.perf_counter() - started
+    return {
+        "path": path,
+        "segments": len(segments),
+        "cached_segments": len(segments) - len(pending) - passthrough,
+        "rendered_segments": len(pending),
+        "passthrough_segments": passthrough,
+        "evicted_segments": evicted,
+        "duration": round(sum(end - start for _, start, end in segments), 3),
+        "timings": {name: round(seconds, 3) for name, seconds in timings.items()},
+    }